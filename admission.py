@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""Admission control, priority scheduling and per-client rate limiting for Kroki renders"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, NamedTuple, Optional
+from fastmcp.server.middleware import CallNext, Middleware, MiddlewareContext
+from metrics import observe_admission, observe_queue
+from tracing import phase
+
+logger = logging.getLogger(__name__)
+
+# Concurrency caps on renders sent to Kroki
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32"))
+# Per diagram type caps, e.g. "plantuml=8,bpmn=4"
+ADMISSION_TYPE_LIMITS = os.getenv("ADMISSION_TYPE_LIMITS", "")
+# Renders waiting for a slot beyond this are rejected immediately
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+# Seconds a render may wait for a slot before it is rejected
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+
+# Priority classes of render traffic; queued renders are served in proportion to the class weights
+PRIORITY_CLASSES = ("interactive", "validate", "batch", "export")
+ADMISSION_CLASS_WEIGHTS = os.getenv("ADMISSION_CLASS_WEIGHTS", "interactive=8,validate=4,batch=2,export=1")
+# Per class queue timeouts overriding ADMISSION_QUEUE_TIMEOUT, e.g. "batch=60,export=60"
+ADMISSION_CLASS_TIMEOUTS = os.getenv("ADMISSION_CLASS_TIMEOUTS", "batch=60,export=60")
+
+# Per-client token bucket (renders per second; 0 disables rate limiting)
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "0"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "20"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+
+
+class AdmissionRejected(Exception):
+    """Raised when a render is shed; the caller may retry after retry_after seconds"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    def to_result(self) -> dict:
+        """Tool error result telling the client the request can be retried"""
+        return {
+            "success": False,
+            "error": str(self),
+            "retryable": True,
+            "retry_after": round(self.retry_after, 3),
+        }
+
+
+def parse_type_limits(value: str, setting: str = "ADMISSION_TYPE_LIMITS", parse=int) -> Dict[str, Any]:
+    """Parse "name=value,..." into a dict, skipping malformed entries"""
+    limits = {}
+    for item in value.split(","):
+        name, _, limit = item.partition("=")
+        try:
+            limits[name.strip()] = parse(limit)
+        except ValueError:
+            if item.strip():
+                logger.warning(f"Ignoring invalid {setting} entry: {item!r}")
+    return limits
+
+
+class RenderPriority(NamedTuple):
+    """Who a render is for: its priority class and the client"""
+
+    priority_class: str = "interactive"
+    client: str = ""
+
+
+_render_priority: ContextVar[RenderPriority] = ContextVar("render_priority", default=RenderPriority())
+
+
+def set_render_priority(priority_class: str, client: str = ""):
+    """Make renders started from the current context use priority_class; returns a reset token"""
+    return _render_priority.set(RenderPriority(priority_class, client))
+
+
+def reset_render_priority(token) -> None:
+    _render_priority.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("future", "task", "diagram_type", "priority_class", "client", "enqueued")
+
+    def __init__(self, diagram_type: str, priority: RenderPriority):
+        self.future = asyncio.get_running_loop().create_future()
+        self.task = asyncio.current_task()
+        self.diagram_type = diagram_type
+        self.priority_class = priority.priority_class
+        self.client = priority.client
+        self.enqueued = time.monotonic()
+
+
+class AdmissionController:
+    """Global and per-diagram-type concurrency caps with a weighted fair wait queue
+
+    Renders that find no free slot wait in a queue per priority class. Freed
+    slots go to the classes in proportion to their weights (stride
+    scheduling: the class with the lowest pass value is served and its pass
+    advances by 1/weight), and within a class round-robin across clients, so
+    one client's batch cannot starve another client's preview. Waiters whose
+    class timeout passes are rejected; waiters whose callers went away are
+    dropped through cancel_queued().
+    """
+
+    def __init__(self, max_concurrency: int = ADMISSION_MAX_CONCURRENCY,
+                 type_limits: Optional[Dict[str, int]] = None,
+                 max_queue: int = ADMISSION_MAX_QUEUE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+                 enabled: bool = ADMISSION_ENABLED,
+                 class_weights: Optional[Dict[str, float]] = None,
+                 class_timeouts: Optional[Dict[str, float]] = None):
+        self.enabled = enabled
+        self.max_concurrency = max_concurrency
+        self.type_limits = parse_type_limits(ADMISSION_TYPE_LIMITS) if type_limits is None else type_limits
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        if class_weights is None:
+            class_weights = parse_type_limits(ADMISSION_CLASS_WEIGHTS, "ADMISSION_CLASS_WEIGHTS", float)
+        self.class_weights = {name: max(class_weights.get(name, 1.0), 0.01) for name in PRIORITY_CLASSES}
+        if class_timeouts is None:
+            class_timeouts = parse_type_limits(ADMISSION_CLASS_TIMEOUTS, "ADMISSION_CLASS_TIMEOUTS", float)
+        self.class_timeouts = {name: class_timeouts.get(name, queue_timeout) for name in PRIORITY_CLASSES}
+        # Per class: client -> waiters in arrival order; client order is the round-robin order
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Waiter]]"] = {
+            name: OrderedDict() for name in PRIORITY_CLASSES
+        }
+        self._queued_tasks: Dict[asyncio.Task, _Waiter] = {}
+        self._pass: Dict[str, float] = {name: 0.0 for name in PRIORITY_CLASSES}
+        self._virtual_time = 0.0
+        self.active = 0
+        self.active_by_type: Counter = Counter()
+        self.waiting = 0
+        self.waiting_by_class: Counter = Counter()
+        self.admitted = 0
+        self.admitted_by_class: Counter = Counter()
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.cancelled = 0
+
+    def _has_capacity(self, diagram_type: str) -> bool:
+        if self.active >= self.max_concurrency:
+            return False
+        limit = self.type_limits.get(diagram_type)
+        return limit is None or self.active_by_type[diagram_type] < limit
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        queue = self._queues[waiter.priority_class]
+        if not queue:
+            # A class returning from idle does not get credit for the time it was idle
+            self._pass[waiter.priority_class] = max(self._pass[waiter.priority_class], self._virtual_time)
+        queue.setdefault(waiter.client, deque()).append(waiter)
+        if waiter.task is not None:
+            self._queued_tasks[waiter.task] = waiter
+        self.waiting += 1
+        self.waiting_by_class[waiter.priority_class] += 1
+        observe_admission(self.active, self.waiting)
+
+    def _remove(self, waiter: _Waiter) -> bool:
+        queue = self._queues[waiter.priority_class]
+        waiters = queue.get(waiter.client)
+        if waiters is None or waiter not in waiters:
+            return False
+        waiters.remove(waiter)
+        if not waiters:
+            del queue[waiter.client]
+        self._queued_tasks.pop(waiter.task, None)
+        self.waiting -= 1
+        self.waiting_by_class[waiter.priority_class] -= 1
+        observe_admission(self.active, self.waiting)
+        return True
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        """The waiter to serve next: lowest pass class first, then round-robin over its clients"""
+        classes = sorted((name for name in PRIORITY_CLASSES if self._queues[name]), key=self._pass.__getitem__)
+        for name in classes:
+            queue = self._queues[name]
+            for client, waiters in queue.items():
+                for waiter in waiters:
+                    if not waiter.future.done() and self._has_capacity(waiter.diagram_type):
+                        queue.move_to_end(client)
+                        return waiter
+        return None
+
+    def _acquire(self, diagram_type: str, priority_class: str, waited: float) -> None:
+        self.active += 1
+        self.active_by_type[diagram_type] += 1
+        self.admitted += 1
+        self.admitted_by_class[priority_class] += 1
+        observe_queue(priority_class, waited)
+        observe_admission(self.active, self.waiting)
+
+    def _release(self, diagram_type: str) -> None:
+        self.active -= 1
+        self.active_by_type[diagram_type] -= 1
+        observe_admission(self.active, self.waiting)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to queued waiters"""
+        while self.waiting and self.active < self.max_concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            self._remove(waiter)
+            self._virtual_time = self._pass[waiter.priority_class]
+            self._pass[waiter.priority_class] += 1 / self.class_weights[waiter.priority_class]
+            self._acquire(waiter.diagram_type, waiter.priority_class, time.monotonic() - waiter.enqueued)
+            waiter.future.set_result(None)
+
+    def cancel_queued(self, task: asyncio.Task) -> bool:
+        """Cancel task if it is waiting for a slot (its callers have gone away)"""
+        if task not in self._queued_tasks:
+            return False
+        task.cancel()
+        return True
+
+    @asynccontextmanager
+    async def slot(self, diagram_type: str) -> AsyncIterator[None]:
+        """Hold a render slot for diagram_type, waiting in the queue if needed
+
+        The priority class and client come from the current render priority
+        (see set_render_priority).
+
+        Raises:
+            AdmissionRejected: the queue is full or no slot freed up within the
+                class queue timeout
+        """
+        if not self.enabled:
+            # Still counted, so shutdown can wait for in-flight renders
+            self.active += 1
+            observe_admission(self.active, self.waiting)
+            try:
+                yield
+            finally:
+                self.active -= 1
+                observe_admission(self.active, self.waiting)
+            return
+
+        priority = _render_priority.get()
+        if priority.priority_class not in self._queues:
+            priority = priority._replace(priority_class="interactive")
+
+        if not self.waiting and self._has_capacity(diagram_type):
+            self._acquire(diagram_type, priority.priority_class, 0.0)
+        else:
+            if self.waiting >= self.max_queue:
+                self.rejected_queue_full += 1
+                raise AdmissionRejected("Server busy: render queue is full, please retry", 1.0)
+
+            timeout = self.class_timeouts[priority.priority_class]
+            waiter = _Waiter(diagram_type, priority)
+            self._enqueue(waiter)
+            self._dispatch()
+            try:
+                with phase("queue"):
+                    await asyncio.wait_for(waiter.future, timeout=timeout)
+            except BaseException as e:
+                if waiter.future.done() and not waiter.future.cancelled():
+                    # Granted just as the wait ended; give the slot back
+                    self._release(diagram_type)
+                self._remove(waiter)
+                if isinstance(e, asyncio.TimeoutError):
+                    self.rejected_timeout += 1
+                    raise AdmissionRejected(
+                        f"Server busy: no render slot for {diagram_type} within {timeout:.3g}s, please retry",
+                        timeout,
+                    )
+                if isinstance(e, asyncio.CancelledError):
+                    self.cancelled += 1
+                raise
+
+        try:
+            yield
+        finally:
+            self._release(diagram_type)
+
+    async def drain(self, timeout: float) -> bool:
+        """Wait until no render holds or waits for a slot
+
+        Returns False if renders were still running after timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while self.active or self.waiting:
+            if time.monotonic() >= deadline:
+                logger.warning(f"Shutting down with {self.active + self.waiting} render(s) still in flight")
+                return False
+            await asyncio.sleep(0.1)
+        return True
+
+    def stats(self) -> dict:
+        """Slot usage, queue depth and rejection counters for health and metrics"""
+        stats = {
+            "enabled": self.enabled,
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "cancelled": self.cancelled,
+        }
+        for name in PRIORITY_CLASSES:
+            stats[f"waiting_{name}"] = self.waiting_by_class[name]
+            stats[f"admitted_{name}"] = self.admitted_by_class[name]
+        return stats
+
+
+class PriorityMiddleware(Middleware):
+    """FastMCP middleware setting the render priority of each tool call
+
+    classify maps a tool name to a priority class; client_id identifies the
+    caller (authenticated subject or address) for fairness between clients.
+    """
+
+    def __init__(self, classify: Callable[[str], str], client_id: Callable[[], Awaitable[str]]):
+        self.classify = classify
+        self.client_id = client_id
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next: CallNext) -> Any:
+        token = set_render_priority(self.classify(context.message.name), await self.client_id())
+        try:
+            return await call_next(context)
+        finally:
+            reset_render_priority(token)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate tokens per second up to burst"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token; return 0 on success or the seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Per-client token buckets, keeping at most max_clients buckets (least recently used evicted)"""
+
+    def __init__(self, rate: float = RATE_LIMIT_PER_SECOND, burst: int = RATE_LIMIT_BURST,
+                 max_clients: int = RATE_LIMIT_MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.rate_limited = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def check(self, client_id: str) -> None:
+        """Charge one render to client_id
+
+        Raises:
+            AdmissionRejected: the client is over its rate limit
+        """
+        if not self.enabled:
+            return
+
+        bucket = self._buckets.get(client_id)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+            self._buckets[client_id] = bucket
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client_id)
+
+        retry_after = bucket.take()
+        if retry_after > 0:
+            self.rate_limited += 1
+            raise AdmissionRejected(
+                f"Rate limit exceeded ({self.rate:g} renders/s, burst {self.burst}), "
+                f"retry after {retry_after:.1f}s",
+                retry_after,
+            )
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "clients": len(self._buckets),
+            "rate_limited": self.rate_limited,
+        }
+
+
+# Global instances
+admission_controller = AdmissionController()
+rate_limiter = RateLimiter()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Stand-in Kroki server with configurable latency and payload sizes for benchmarks"""
+
+import os
+import time
+import random
+import asyncio
+import argparse
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+MEDIA_TYPES = {
+    "svg": "image/svg+xml",
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "pdf": "application/pdf",
+    "txt": "text/plain",
+}
+
+
+def create_app(latency_ms: float = 50.0, jitter_ms: float = 10.0, svg_bytes: int = 20000,
+               binary_bytes: int = 200000, error_rate: float = 0.0) -> Starlette:
+    """Create a fake Kroki app
+
+    Every render sleeps for latency_ms +/- jitter_ms and returns a payload of the
+    configured size. Sources containing "syntax-error" (or a random error_rate
+    fraction of requests) get a 400 like a real Kroki parse failure.
+    """
+    stats = {"requests": 0, "errors": 0, "backend_seconds": 0.0}
+    svg_payload = (b"<svg xmlns=\"http://www.w3.org/2000/svg\">" +
+                   b" " * max(svg_bytes - 47, 0) + b"</svg>")
+    binary_payload = os.urandom(binary_bytes)
+
+    async def render(request: Request) -> Response:
+        started = time.perf_counter()
+        output_format = request.path_params["output_format"]
+        body = await request.body() if request.method == "POST" else request.path_params.get("encoded", "").encode()
+
+        delay = max(latency_ms + random.uniform(-jitter_ms, jitter_ms), 0) / 1000
+        await asyncio.sleep(delay)
+
+        stats["requests"] += 1
+        stats["backend_seconds"] += time.perf_counter() - started
+
+        if b"syntax-error" in body or random.random() < error_rate:
+            stats["errors"] += 1
+            return Response("Error 400: Syntax Error (fake Kroki)", status_code=400, media_type="text/plain")
+
+        payload = svg_payload if output_format in ("svg", "txt") else binary_payload
+        return Response(payload, media_type=MEDIA_TYPES.get(output_format, "application/octet-stream"))
+
+    async def get_stats(request: Request) -> JSONResponse:
+        return JSONResponse(stats)
+
+    async def reset_stats(request: Request) -> JSONResponse:
+        stats.update({"requests": 0, "errors": 0, "backend_seconds": 0.0})
+        return JSONResponse(stats)
+
+    async def health(request: Request) -> JSONResponse:
+        return JSONResponse({"status": "pass"})
+
+    return Starlette(routes=[
+        Route("/health", health, methods=["GET"]),
+        Route("/__stats", get_stats, methods=["GET"]),
+        Route("/__stats", reset_stats, methods=["DELETE"]),
+        Route("/{diagram_type}/{output_format}", render, methods=["POST"]),
+        Route("/{diagram_type}/{output_format}/{encoded}", render, methods=["GET"]),
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Kroki server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Mean render latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Uniform latency jitter")
+    parser.add_argument("--svg-bytes", type=int, default=20000, help="Size of SVG/TXT responses")
+    parser.add_argument("--binary-bytes", type=int, default=200000, help="Size of PNG/PDF/JPEG responses")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of renders answered with 400")
+    args = parser.parse_args()
+
+    app = create_app(args.latency_ms, args.jitter_ms, args.svg_bytes, args.binary_bytes, args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
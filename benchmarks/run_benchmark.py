@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""Load-test mcp-kroki over the MCP streamable HTTP endpoint against a fake Kroki server
+
+Starts benchmarks/fake_kroki.py and the mcp-kroki FastAPI app as subprocesses,
+drives concurrent generate_diagram_*, validate_diagram_* and
+obtain_svg_from_diagram calls, and writes throughput, latency percentiles,
+server memory high-water mark and mcp-kroki overhead on top of backend time
+to a JSON file that can be compared between releases.
+
+Example:
+    python benchmarks/run_benchmark.py --concurrency 1,16,64 --requests 500 \\
+        --output bench-results.json --compare previous-results.json
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import base64
+import random
+import socket
+import asyncio
+import platform
+import argparse
+import subprocess
+import tempfile
+from contextlib import AsyncExitStack
+from datetime import datetime, timezone
+from typing import List, Optional
+import httpx
+from fastmcp import Client
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKLOADS = ("generate", "validate", "obtain")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def encode_diagram(diagram_source: str) -> str:
+    """Same encoding as mcp_kroki_server.encode_diagram (kept local to avoid importing the server)"""
+    compressed = zlib.compress(diagram_source.encode("utf-8"), level=9)
+    return base64.urlsafe_b64encode(compressed).decode("utf-8")
+
+
+def diagram_source(diagram_type: str, index: int) -> str:
+    """A small, unique source per index"""
+    if diagram_type == "mermaid":
+        return f"graph TD\n  A{index}[Start] --> B{index}[End]"
+    if diagram_type == "graphviz":
+        return f"digraph G {{ a{index} -> b{index} }}"
+    return f"@startuml\nAlice -> Bob: request {index}\n@enduml"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def memory_high_water_kb(pid: int) -> Optional[int]:
+    """Peak resident set size of a process (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def wait_for(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_calls(workload: str, diagram_type: str, output_format: str, count: int,
+                repeat_ratio: float, kroki_url: str, offset: int) -> list:
+    """Build (tool name, arguments) pairs; repeat_ratio of them reuse earlier sources"""
+    calls = []
+    sources = []
+    for i in range(count):
+        if sources and random.random() < repeat_ratio:
+            source = random.choice(sources)
+        else:
+            source = diagram_source(diagram_type, offset + i)
+            sources.append(source)
+
+        if workload == "generate":
+            calls.append((f"generate_diagram_{diagram_type}",
+                          {"diagram_source": source, "output_format": output_format}))
+        elif workload == "validate":
+            calls.append((f"validate_diagram_{diagram_type}", {"diagram_source": source}))
+        else:
+            url = f"{kroki_url}/{diagram_type}/svg/{encode_diagram(source)}"
+            calls.append(("obtain_svg_from_diagram", {"diagram_url": url}))
+    return calls
+
+
+async def run_calls(mcp_url: str, calls: list, concurrency: int, sessions: int) -> dict:
+    """Run calls with a fixed number of concurrent workers over a pool of MCP sessions"""
+    latencies = []
+    failures = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for call in calls:
+        queue.put_nowait(call)
+
+    async with AsyncExitStack() as stack:
+        clients = [await stack.enter_async_context(Client(mcp_url, timeout=120))
+                   for _ in range(max(1, min(sessions, concurrency)))]
+
+        async def worker(worker_id: int):
+            nonlocal failures
+            client = clients[worker_id % len(clients)]
+            while True:
+                try:
+                    tool, arguments = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                started = time.perf_counter()
+                try:
+                    result = await client.call_tool(tool, arguments, raise_on_error=False)
+                    content = result.structured_content or {}
+                    ok = not result.is_error and content.get("success", content.get("valid", True)) is not False
+                except Exception:
+                    ok = False
+                latencies.append(time.perf_counter() - started)
+                if not ok:
+                    failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {"latencies": latencies, "failures": failures, "elapsed": elapsed}
+
+
+def summarize(run: dict, backend: dict, count: int) -> dict:
+    latencies = run["latencies"]
+    total_latency = sum(latencies)
+    return {
+        "requests": count,
+        "failures": run["failures"],
+        "elapsed_seconds": round(run["elapsed"], 4),
+        "throughput_rps": round(count / run["elapsed"], 2) if run["elapsed"] else 0.0,
+        "latency_ms": {
+            "mean": round(total_latency / len(latencies) * 1000, 3) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p95": round(percentile(latencies, 95) * 1000, 3),
+            "p99": round(percentile(latencies, 99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        "backend_requests": backend["requests"],
+        "backend_ms_mean": round(backend["backend_seconds"] / backend["requests"] * 1000, 3)
+        if backend["requests"] else 0.0,
+        # Average time per call spent in mcp-kroki (and the MCP transport) rather than in Kroki
+        "overhead_ms_mean": round((total_latency - backend["backend_seconds"]) / count * 1000, 3) if count else 0.0,
+    }
+
+
+def compare(results: dict, baseline_path: str) -> None:
+    """Print throughput and p95 changes against a previous results file"""
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)
+
+    previous = {(r["workload"], r["concurrency"]): r for r in baseline.get("runs", [])}
+    print(f"\nComparison with {baseline_path} ({baseline.get('metadata', {}).get('git_revision')}):")
+    for run in results["runs"]:
+        old = previous.get((run["workload"], run["concurrency"]))
+        if old is None:
+            continue
+        rps_change = (run["throughput_rps"] / old["throughput_rps"] - 1) * 100 if old["throughput_rps"] else 0.0
+        p95_change = (run["latency_ms"]["p95"] / old["latency_ms"]["p95"] - 1) * 100 if old["latency_ms"]["p95"] else 0.0
+        print(f"  {run['workload']:<9} c={run['concurrency']:<4} throughput {rps_change:+7.1f}%   p95 {p95_change:+7.1f}%")
+
+
+async def benchmark(args, kroki_url: str, mcp_url: str, server: subprocess.Popen) -> list:
+    runs = []
+    offset = 0
+    for workload in args.workloads:
+        for concurrency in args.concurrency:
+            calls = build_calls(workload, args.diagram_type, args.output_format, args.requests,
+                                args.repeat_ratio, kroki_url, offset)
+            offset += args.requests
+            httpx.delete(f"{kroki_url}/__stats")
+
+            run = await run_calls(mcp_url, calls, concurrency, args.sessions)
+            backend = httpx.get(f"{kroki_url}/__stats").json()
+            summary = summarize(run, backend, len(calls))
+            summary.update({
+                "workload": workload,
+                "concurrency": concurrency,
+                "server_memory_high_water_kb": memory_high_water_kb(server.pid),
+            })
+            runs.append(summary)
+            print(f"{workload:<9} c={concurrency:<4} {summary['throughput_rps']:>9.1f} req/s  "
+                  f"p50 {summary['latency_ms']['p50']:>8.1f}ms  p95 {summary['latency_ms']['p95']:>8.1f}ms  "
+                  f"p99 {summary['latency_ms']['p99']:>8.1f}ms  overhead {summary['overhead_ms_mean']:>7.1f}ms  "
+                  f"failures {summary['failures']}")
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mcp-kroki against a fake Kroki server")
+    parser.add_argument("--concurrency", default="1,16,64",
+                        type=lambda value: [int(v) for v in value.split(",")],
+                        help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per workload and concurrency level")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS),
+                        type=lambda value: [w for w in value.split(",") if w in WORKLOADS],
+                        help="Comma-separated workloads: generate, validate, obtain")
+    parser.add_argument("--diagram-type", default="plantuml", choices=["plantuml", "mermaid", "graphviz"])
+    parser.add_argument("--output-format", default="svg")
+    parser.add_argument("--repeat-ratio", type=float, default=0.0,
+                        help="Fraction of requests reusing an earlier source (exercises caching)")
+    parser.add_argument("--sessions", type=int, default=8, help="Number of MCP client sessions")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Fake Kroki mean latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Fake Kroki latency jitter")
+    parser.add_argument("--svg-bytes", type=int, default=20000, help="Fake Kroki SVG response size")
+    parser.add_argument("--binary-bytes", type=int, default=200000, help="Fake Kroki binary response size")
+    parser.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment variable for the mcp-kroki server (repeatable)")
+    parser.add_argument("--output", default="bench-results.json", help="Where to write JSON results")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    args = parser.parse_args()
+
+    kroki_port, mcp_port = free_port(), free_port()
+    kroki_url = f"http://127.0.0.1:{kroki_port}"
+    mcp_url = f"http://127.0.0.1:{mcp_port}/mcp"
+
+    env = dict(os.environ, KROKI_URL=kroki_url, PORT=str(mcp_port))
+    env.update(item.split("=", 1) for item in args.server_env)
+
+    log = tempfile.NamedTemporaryFile(prefix="mcp-kroki-bench-", suffix=".log", delete=False)
+    fake = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_ROOT, "benchmarks", "fake_kroki.py"), "--port", str(kroki_port),
+         "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+         "--svg-bytes", str(args.svg_bytes), "--binary-bytes", str(args.binary_bytes)],
+        stdout=log, stderr=subprocess.STDOUT,
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "mcp_kroki_server:app", "--host", "127.0.0.1",
+         "--port", str(mcp_port), "--log-level", "warning"],
+        cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+    try:
+        wait_for(f"{kroki_url}/__stats")
+        wait_for(f"http://127.0.0.1:{mcp_port}/health")
+        print(f"Fake Kroki: {kroki_url}  mcp-kroki: {mcp_url}  server log: {log.name}\n")
+        runs = asyncio.run(benchmark(args, kroki_url, mcp_url, server))
+    finally:
+        server.terminate()
+        fake.terminate()
+        server.wait(timeout=30)
+        fake.wait(timeout=30)
+
+    results = {
+        "metadata": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("output", "compare")
+        },
+        "runs": runs,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""gzip/brotli response compression for the HTTP endpoints"""
+
+import os
+import logging
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# gzip, brotli (falls back to gzip for clients without br support) or none
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "gzip").lower()
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", "1024"))
+RESPONSE_COMPRESSION_GZIP_LEVEL = int(os.getenv("RESPONSE_COMPRESSION_GZIP_LEVEL", "6"))
+RESPONSE_COMPRESSION_BROTLI_QUALITY = int(os.getenv("RESPONSE_COMPRESSION_BROTLI_QUALITY", "4"))
+
+# Content types that are already compressed; compressing them again only costs CPU
+INCOMPRESSIBLE_CONTENT_TYPES = ("image/png", "image/jpeg", "application/zip", "application/gzip")
+
+
+def _brotli_available() -> bool:
+    try:
+        import brotli  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class _SkipIncompressible:
+    """Responder mixin passing already-compressed content types and partial content through unchanged"""
+
+    async def send_with_compression(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            await super().send_with_compression(message)
+            headers = Headers(raw=message["headers"])
+            if (headers.get("content-type", "").startswith(INCOMPRESSIBLE_CONTENT_TYPES)
+                    or message["status"] == 206):
+                self.content_type_is_excluded = True
+            return
+        await super().send_with_compression(message)
+
+
+class _GZipResponder(_SkipIncompressible, GZipResponder):
+    pass
+
+
+class _BrotliResponder(_SkipIncompressible, IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int):
+        super().__init__(app, minimum_size)
+        import brotli
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        data = self.compressor.process(body)
+        # Flush each chunk so streamed responses are not held back
+        return data + (self.compressor.flush() if more_body else self.compressor.finish())
+
+
+def _vary_on_accept_encoding(send: Send) -> Send:
+    """Wrap send so every response start carries Vary: Accept-Encoding exactly once"""
+
+    async def send_with_vary(message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = MutableHeaders(raw=message["headers"])
+            values = [value.strip() for value in headers.get("vary", "").split(",") if value.strip()]
+            if not any(value.lower() == "accept-encoding" for value in values):
+                values.append("Accept-Encoding")
+            headers["vary"] = ", ".join(dict.fromkeys(values))
+        await send(message)
+
+    return send_with_vary
+
+
+class CompressionMiddleware:
+    """Compress responses with brotli or gzip, depending on Accept-Encoding
+
+    Server-sent event streams (MCP streaming responses), already-compressed
+    content types, partial content and bodies under minimum_size are sent as
+    they are. Every response varies on Accept-Encoding, so ETags are weak
+    validators shared by the encoded and identity bodies.
+    """
+
+    def __init__(self, app: ASGIApp, algorithm: str = RESPONSE_COMPRESSION,
+                 minimum_size: int = RESPONSE_COMPRESSION_MIN_SIZE,
+                 gzip_level: int = RESPONSE_COMPRESSION_GZIP_LEVEL,
+                 brotli_quality: int = RESPONSE_COMPRESSION_BROTLI_QUALITY):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.brotli = algorithm == "brotli"
+        if self.brotli and not _brotli_available():
+            logger.warning("RESPONSE_COMPRESSION=brotli but the 'brotli' package is not installed, using gzip")
+            self.brotli = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        if self.brotli and "br" in accept_encoding:
+            responder = _BrotliResponder(self.app, self.minimum_size, self.brotli_quality)
+        elif "gzip" in accept_encoding:
+            responder = _GZipResponder(self.app, self.minimum_size, compresslevel=self.gzip_level)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, _vary_on_accept_encoding(send))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Memoized diagram URL encoding and short content-addressed URLs for long sources"""
+
+import os
+import json
+import zlib
+import base64
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+from render_cache import RenderCache
+
+logger = logging.getLogger(__name__)
+
+# Whether tool results include diagram_url unless the caller says otherwise
+INCLUDE_DIAGRAM_URL = os.getenv("INCLUDE_DIAGRAM_URL", "true").lower() == "true"
+# zlib level used for URL payloads (1 = fastest, 9 = smallest)
+DIAGRAM_URL_COMPRESSION_LEVEL = int(os.getenv("DIAGRAM_URL_COMPRESSION_LEVEL", "9"))
+# Number of encoded payloads memoized by content hash
+DIAGRAM_URL_MEMO_SIZE = int(os.getenv("DIAGRAM_URL_MEMO_SIZE", "1024"))
+# URLs longer than this are replaced by a short /diagrams/<key>.<format> URL (0 disables)
+DIAGRAM_URL_MAX_LENGTH = int(os.getenv("DIAGRAM_URL_MAX_LENGTH", "4096"))
+# Memory kept for sources behind short URLs
+DIAGRAM_URL_SHORT_MAX_BYTES = int(os.getenv("DIAGRAM_URL_SHORT_MAX_BYTES", str(16 * 1024 * 1024)))
+
+
+class DiagramUrlEncoder:
+    """Deflate + URL-safe base64 encoding of diagram sources, memoized by content hash"""
+
+    def __init__(self, level: int = DIAGRAM_URL_COMPRESSION_LEVEL, memo_size: int = DIAGRAM_URL_MEMO_SIZE):
+        self.level = level
+        self.memo_size = memo_size
+        self._memo: "OrderedDict[bytes, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, diagram_source: str) -> str:
+        """Encode diagram source for a Kroki GET URL"""
+        data = diagram_source.encode("utf-8")
+        digest = hashlib.sha256(data).digest()
+        with self._lock:
+            encoded = self._memo.get(digest)
+            if encoded is not None:
+                self._memo.move_to_end(digest)
+                self.hits += 1
+                return encoded
+            self.misses += 1
+
+        encoded = base64.urlsafe_b64encode(zlib.compress(data, level=self.level)).decode("utf-8")
+        if self.memo_size > 0:
+            with self._lock:
+                self._memo[digest] = encoded
+                while len(self._memo) > self.memo_size:
+                    self._memo.popitem(last=False)
+        return encoded
+
+    def stats(self) -> dict:
+        return {
+            "compression_level": self.level,
+            "memo_entries": len(self._memo),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class ShortUrlRegistry:
+    """Sources behind short content-addressed URLs, keyed by render cache key"""
+
+    def __init__(self, max_bytes: int = DIAGRAM_URL_SHORT_MAX_BYTES):
+        self._sources = RenderCache(max_bytes=max_bytes, ttl=0, enabled=True, name="Short URL registry")
+        self.created = 0
+
+    def register(self, cache_key: str, diagram_type: str, output_format: str, diagram_source: str) -> None:
+        record = json.dumps([diagram_type, output_format, diagram_source]).encode("utf-8")
+        self._sources.put(cache_key, record)
+        self.created += 1
+
+    def lookup(self, cache_key: str) -> Optional[tuple]:
+        """Return (diagram_type, output_format, diagram_source) for a short URL key, if known"""
+        record = self._sources.get(cache_key)
+        if record is None:
+            return None
+        return tuple(json.loads(record))
+
+    def stats(self) -> dict:
+        stats = self._sources.stats()
+        return {
+            "entries": stats["entries"],
+            "size_bytes": stats["size_bytes"],
+            "max_bytes": stats["max_bytes"],
+            "created": self.created,
+        }
+
+
+# Global instances
+url_encoder = DiagramUrlEncoder()
+short_urls = ShortUrlRegistry()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Bulk export of rendered diagrams to a directory or a single zip/tar archive"""
+
+import io
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import tarfile
+import zipfile
+from typing import Dict, Optional, Set
+from streaming import AtomicFile, write_bytes_to_file
+
+logger = logging.getLogger(__name__)
+
+# Limits for the export_diagrams tool
+EXPORT_MAX_ITEMS = int(os.getenv("EXPORT_MAX_ITEMS", "500"))
+EXPORT_MAX_CONCURRENCY = int(os.getenv("EXPORT_MAX_CONCURRENCY", "8"))
+
+# Archive formats and their file extensions
+ARCHIVE_FORMATS = {"zip": ".zip", "tar": ".tar", "tar.gz": ".tar.gz"}
+# Already-compressed outputs are stored in zip archives without deflating them again
+STORED_EXTENSIONS = (".png", ".jpeg", ".jpg", ".pdf")
+MANIFEST_NAME = "manifest.json"
+
+
+def safe_file_name(name: str) -> str:
+    """Reduce name to a plain file name that cannot leave the export directory"""
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(name.replace("\\", "/")))
+    return name.lstrip(".") or "diagram"
+
+
+class ExportWriter:
+    """Write exported diagrams as files in a directory, or as members of one archive
+
+    Directory files are written concurrently through temporary files and
+    atomic renames. Archive members are appended one at a time from a worker
+    thread as renders complete, and the archive only appears under its final
+    name once close() has written the manifest.
+    """
+
+    def __init__(self, output_dir: str, archive: Optional[str] = None, archive_name: Optional[str] = None):
+        if archive is not None and archive not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unsupported archive format: {archive} (use {', '.join(ARCHIVE_FORMATS)})")
+        self.output_dir = os.path.abspath(output_dir)
+        self.archive = archive
+        self.archive_path = None
+        if archive is not None:
+            extension = ARCHIVE_FORMATS[archive]
+            name = safe_file_name(archive_name or "diagrams")
+            if not name.endswith(extension):
+                name += extension
+            self.archive_path = os.path.join(self.output_dir, name)
+        self._names: Set[str] = {MANIFEST_NAME}
+        self._lock = asyncio.Lock()
+        self._file: Optional[AtomicFile] = None
+        self._archive = None
+
+    async def open(self) -> None:
+        await asyncio.to_thread(os.makedirs, self.output_dir, exist_ok=True)
+        if self.archive is not None:
+            await asyncio.to_thread(self._open_archive)
+
+    def _open_archive(self) -> None:
+        self._file = AtomicFile(self.archive_path)
+        if self.archive == "zip":
+            self._archive = zipfile.ZipFile(self._file.file, "w", compression=zipfile.ZIP_DEFLATED)
+        else:
+            self._archive = tarfile.open(fileobj=self._file.file, mode="w:gz" if self.archive == "tar.gz" else "w")
+
+    def unique_name(self, name: str) -> str:
+        """A safe file name not used yet in this export"""
+        name = safe_file_name(name)
+        stem, extension = os.path.splitext(name)
+        candidate, counter = name, 1
+        while candidate in self._names:
+            counter += 1
+            candidate = f"{stem}-{counter}{extension}"
+        self._names.add(candidate)
+        return candidate
+
+    def _add_member(self, name: str, data: bytes) -> str:
+        if self.archive == "zip":
+            compression = zipfile.ZIP_STORED if name.lower().endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+            self._archive.writestr(name, data, compress_type=compression)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            self._archive.addfile(info, io.BytesIO(data))
+        return hashlib.sha256(data).hexdigest()
+
+    async def add(self, name: str, data: bytes) -> Dict:
+        """Write data under name (made unique); returns its manifest fields"""
+        name = self.unique_name(name)
+        if self.archive is None:
+            path = os.path.join(self.output_dir, name)
+            stats = await write_bytes_to_file(data, path)
+            return {"name": name, "path": path, "size_bytes": len(data), "sha256": stats["sha256"]}
+
+        async with self._lock:
+            sha256 = await asyncio.to_thread(self._add_member, name, data)
+        return {"name": name, "size_bytes": len(data), "sha256": sha256}
+
+    def _finish_archive(self, manifest: bytes) -> None:
+        self._add_member(MANIFEST_NAME, manifest)
+        self._archive.close()
+        self._file.commit()
+
+    async def close(self, manifest: dict) -> Dict:
+        """Write the manifest and finish the archive; returns where the export went"""
+        data = json.dumps(manifest, indent=2).encode("utf-8")
+        if self.archive is None:
+            path = os.path.join(self.output_dir, MANIFEST_NAME)
+            await write_bytes_to_file(data, path)
+            return {"manifest_path": path}
+
+        async with self._lock:
+            await asyncio.to_thread(self._finish_archive, data)
+        size = await asyncio.to_thread(os.path.getsize, self.archive_path)
+        return {"archive_path": self.archive_path, "archive_bytes": size}
+
+    def _discard_archive(self) -> None:
+        try:
+            self._archive.close()
+        finally:
+            self._file.discard()
+
+    async def abort(self) -> None:
+        """Remove the partial archive after a failure (files already written are kept)"""
+        if self._archive is not None and not self._file.file.closed:
+            async with self._lock:
+                await asyncio.to_thread(self._discard_archive)
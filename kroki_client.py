@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""Async Kroki HTTP client on a shared keep-alive connection pool
+
+Requests are spread over one or more Kroki backends with least-outstanding
+or consistent-hash routing, active health probes, per-backend circuit
+breakers and retries with backoff.
+"""
+
+import os
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator, Dict, Iterable, Optional, Set, Union
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Connection pool configuration
+KROKI_POOL_MAX_CONNECTIONS = int(os.getenv("KROKI_POOL_MAX_CONNECTIONS", "100"))
+KROKI_POOL_MAX_KEEPALIVE = int(os.getenv("KROKI_POOL_MAX_KEEPALIVE", "20"))
+KROKI_POOL_KEEPALIVE_EXPIRY = float(os.getenv("KROKI_POOL_KEEPALIVE_EXPIRY", "30"))
+KROKI_HTTP2 = os.getenv("KROKI_HTTP2", "false").lower() == "true"
+
+# Per-phase timeouts (seconds)
+KROKI_CONNECT_TIMEOUT = float(os.getenv("KROKI_CONNECT_TIMEOUT", "5"))
+KROKI_READ_TIMEOUT = float(os.getenv("KROKI_READ_TIMEOUT", "30"))
+KROKI_WRITE_TIMEOUT = float(os.getenv("KROKI_WRITE_TIMEOUT", "30"))
+KROKI_POOL_TIMEOUT = float(os.getenv("KROKI_POOL_TIMEOUT", "10"))
+# Read timeout overrides per diagram type, e.g. "plantuml=60,mermaid=15"
+KROKI_TYPE_TIMEOUTS = os.getenv("KROKI_TYPE_TIMEOUTS", "")
+
+# Backend routing: least_outstanding or consistent_hash
+KROKI_ROUTING = os.getenv("KROKI_ROUTING", "least_outstanding")
+KROKI_HEALTH_CHECK_INTERVAL = float(os.getenv("KROKI_HEALTH_CHECK_INTERVAL", "10"))
+KROKI_HEALTH_CHECK_PATH = os.getenv("KROKI_HEALTH_CHECK_PATH", "/health")
+KROKI_HEALTH_CHECK_TIMEOUT = float(os.getenv("KROKI_HEALTH_CHECK_TIMEOUT", "2"))
+
+# Circuit breaker and retry configuration
+KROKI_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("KROKI_CIRCUIT_FAILURE_THRESHOLD", "5"))
+KROKI_CIRCUIT_RESET_TIMEOUT = float(os.getenv("KROKI_CIRCUIT_RESET_TIMEOUT", "30"))
+KROKI_RETRIES = int(os.getenv("KROKI_RETRIES", "2"))
+KROKI_RETRY_BACKOFF = float(os.getenv("KROKI_RETRY_BACKOFF", "0.1"))
+KROKI_RETRY_BACKOFF_MAX = float(os.getenv("KROKI_RETRY_BACKOFF_MAX", "2"))
+
+# Gateway errors worth trying on another backend; other statuses (e.g. 400 for
+# a syntax error) would fail the same way everywhere
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+
+# Transport errors worth retrying. Read timeouts are not retried: a render that
+# hit its timeout usually stalls on every backend, but it still counts as a
+# circuit breaker failure so a stalled backend is taken out of rotation.
+RETRYABLE_ERRORS = (
+    httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout,
+    httpx.ReadError, httpx.WriteError, httpx.RemoteProtocolError,
+)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def parse_type_timeouts(value: str) -> Dict[str, float]:
+    """Parse "type=seconds,..." into a dict, skipping malformed entries"""
+    timeouts = {}
+    for item in value.split(","):
+        name, _, seconds = item.partition("=")
+        try:
+            timeouts[name.strip()] = float(seconds)
+        except ValueError:
+            if item.strip():
+                logger.warning(f"Ignoring invalid KROKI_TYPE_TIMEOUTS entry: {item!r}")
+    return timeouts
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised when every Kroki backend's circuit refuses requests"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker
+
+    Opens after failure_threshold consecutive failures. After reset_timeout
+    the circuit goes half-open and lets a single probe request through while
+    other requests are still refused; the probe's success closes the circuit
+    and its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = KROKI_CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = KROKI_CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.probing = False
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now (closed, or half-open with no probe in flight)"""
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open":
+            return not self.probing
+        return self.state == "closed"
+
+    def begin(self) -> bool:
+        """Mark a request allowed by allow() as sent; returns True if it is the half-open probe"""
+        if self.state != "half_open":
+            return False
+        self.probing = True
+        return True
+
+    def end_probe(self) -> None:
+        """Let another probe through after one ended without a result (e.g. it was cancelled)"""
+        self.probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.state = "closed"
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opens += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.probing = False
+
+
+class KrokiBackend:
+    """One Kroki endpoint with its health, circuit breaker and counters"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.breaker = CircuitBreaker()
+        self.healthy = True
+        self.in_flight = 0
+        self.requests_total = 0
+        self.failures_total = 0
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and self.breaker.allow()
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "circuit": self.breaker.state,
+            "in_flight": self.in_flight,
+            "requests_total": self.requests_total,
+            "failures_total": self.failures_total,
+        }
+
+
+class KrokiClient:
+    """Shared async client for Kroki requests with pooled keep-alive connections"""
+
+    def __init__(self, base_urls: Union[str, Iterable[str]], aliases: Iterable[str] = ()):
+        if isinstance(base_urls, str):
+            base_urls = [base_urls]
+        self.backends = [KrokiBackend(url) for url in base_urls]
+        if not self.backends:
+            raise ValueError("At least one Kroki URL is required")
+        self.base_url = self.backends[0].url
+        # Other base URLs (e.g. a public KROKI_URL) whose requests are routed over the backends
+        self.aliases = [alias.rstrip("/") for alias in aliases if alias]
+
+        self.limits = httpx.Limits(
+            max_connections=KROKI_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=KROKI_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=KROKI_POOL_KEEPALIVE_EXPIRY,
+        )
+        self.timeout = httpx.Timeout(
+            connect=KROKI_CONNECT_TIMEOUT,
+            read=KROKI_READ_TIMEOUT,
+            write=KROKI_WRITE_TIMEOUT,
+            pool=KROKI_POOL_TIMEOUT,
+        )
+        self.type_timeouts = parse_type_timeouts(KROKI_TYPE_TIMEOUTS)
+        self.routing = KROKI_ROUTING
+        if self.routing not in ("least_outstanding", "consistent_hash"):
+            logger.warning(f"Unknown KROKI_ROUTING '{self.routing}', using least_outstanding")
+            self.routing = "least_outstanding"
+        self.retries = KROKI_RETRIES
+        self.http2 = KROKI_HTTP2
+        if self.http2 and not _http2_available():
+            logger.warning("KROKI_HTTP2 is enabled but the 'h2' package is not installed, using HTTP/1.1")
+            self.http2 = False
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self.in_flight = 0
+        self.requests_total = 0
+        self.retries_total = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Return the shared client, creating it on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=self.timeout,
+                http2=self.http2,
+            )
+            logger.info(
+                f"Kroki connection pool created (max_connections={self.limits.max_connections}, "
+                f"max_keepalive={self.limits.max_keepalive_connections}, http2={self.http2}, "
+                f"backends={len(self.backends)}, routing={self.routing})"
+            )
+        return self._client
+
+    def timeout_for(self, diagram_type: Optional[str]) -> httpx.Timeout:
+        """Pool timeouts with the read timeout overridden for diagram_type, if configured"""
+        read = self.type_timeouts.get(diagram_type or "")
+        if read is None:
+            return self.timeout
+        return httpx.Timeout(connect=self.timeout.connect, read=read,
+                             write=self.timeout.write, pool=self.timeout.pool)
+
+    def _backend_path(self, url: str) -> Optional[str]:
+        """Path of url relative to a backend or alias base URL, or None for other hosts"""
+        for base in [backend.url for backend in self.backends] + self.aliases:
+            if url == base or url.startswith(base + "/"):
+                return url[len(base):]
+        return None
+
+    def choose_backend(self, route_key: Optional[str] = None,
+                       exclude: Set[str] = frozenset()) -> KrokiBackend:
+        """Pick a backend for a request
+
+        Only backends whose circuit allows a request are candidates, and a
+        half-open backend takes a single probe request at a time. Healthy
+        backends are preferred; when none is healthy, the others are still
+        tried. Backends in exclude (already tried) are skipped while others
+        remain. Raises CircuitOpenError when every circuit refuses.
+        """
+        candidates = [b for b in self.backends if b.url not in exclude] or self.backends
+        allowed = [b for b in candidates if b.breaker.allow()]
+        if not allowed:
+            raise CircuitOpenError("Circuit open for every Kroki backend, not sending the request")
+        available = [b for b in allowed if b.healthy] or allowed
+
+        if self.routing == "consistent_hash" and route_key is not None:
+            # Rendezvous hashing: the same key keeps landing on the same backend
+            # while it is available, keeping that backend's caches warm
+            digest = hashlib.sha256(route_key.encode("utf-8")).digest()
+            return max(available, key=lambda b: hashlib.sha256(digest + b.url.encode("utf-8")).digest())
+
+        fewest = min(b.in_flight for b in available)
+        return random.choice([b for b in available if b.in_flight == fewest])
+
+    def render_stream(self, diagram_type: str, output_format: str, diagram_source: str):
+        """POST diagram source to Kroki; use as `async with` and read the body in chunks"""
+        url = f"{self.base_url}/{diagram_type}/{output_format}"
+        headers = {
+            "Content-Type": "text/plain"
+        }
+        return self.stream("POST", url, content=diagram_source.encode("utf-8"), headers=headers,
+                           route_key=f"{diagram_type}/{output_format}/{diagram_source}")
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, route_key: Optional[str] = None,
+                     **kwargs) -> AsyncIterator[httpx.Response]:
+        """Send a request through the shared pool without reading the body up front
+
+        URLs on a Kroki backend (or alias) are routed over the backends and
+        retried with backoff on connection errors and gateway errors until
+        the response headers arrive; other URLs are fetched as they are.
+        """
+        path = self._backend_path(url)
+        if path is None:
+            self.in_flight += 1
+            self.requests_total += 1
+            try:
+                async with self.client.stream(method, url, **kwargs) as response:
+                    yield response
+            finally:
+                self.in_flight -= 1
+            return
+
+        diagram_type = path.lstrip("/").split("/", 1)[0]
+        kwargs.setdefault("timeout", self.timeout_for(diagram_type))
+        tried: Set[str] = set()
+        attempt = 0
+
+        while True:
+            backend = self.choose_backend(route_key or path, tried)
+            probe = backend.breaker.begin()
+            tried.add(backend.url)
+            self.in_flight += 1
+            self.requests_total += 1
+            backend.in_flight += 1
+            backend.requests_total += 1
+
+            stack = AsyncExitStack()
+            try:
+                response = await stack.enter_async_context(
+                    self.client.stream(method, backend.url + path, **kwargs)
+                )
+            except httpx.TransportError as e:
+                await stack.aclose()
+                self._release(backend, failed=True)
+                if not isinstance(e, RETRYABLE_ERRORS) or attempt >= self.retries:
+                    raise
+                logger.warning(f"Kroki backend {backend.url} failed ({type(e).__name__}), retrying")
+            except BaseException:
+                await stack.aclose()
+                self._release(backend, failed=False)
+                if probe:
+                    backend.breaker.end_probe()
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= self.retries:
+                    failed = response.status_code in RETRYABLE_STATUS_CODES
+                    if not failed:
+                        backend.breaker.record_success()
+                    try:
+                        yield response
+                    finally:
+                        await stack.aclose()
+                        self._release(backend, failed=failed)
+                    return
+
+                await stack.aclose()
+                self._release(backend, failed=True)
+                logger.warning(f"Kroki backend {backend.url} returned {response.status_code}, retrying")
+
+            attempt += 1
+            self.retries_total += 1
+            # Exponential backoff with full jitter
+            delay = min(KROKI_RETRY_BACKOFF * (2 ** (attempt - 1)), KROKI_RETRY_BACKOFF_MAX)
+            await asyncio.sleep(random.uniform(0, delay))
+
+    def _release(self, backend: KrokiBackend, failed: bool) -> None:
+        self.in_flight -= 1
+        backend.in_flight -= 1
+        if failed:
+            backend.failures_total += 1
+            backend.breaker.record_failure()
+
+    async def get(self, url: str) -> httpx.Response:
+        """GET a diagram URL through the shared pool"""
+        return await self._send("GET", url)
+
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        async with self.stream(method, url, **kwargs) as response:
+            await response.aread()
+            return response
+
+    async def probe(self, backend: KrokiBackend) -> None:
+        """Check one backend's health endpoint and update its status"""
+        try:
+            response = await self.client.get(backend.url + KROKI_HEALTH_CHECK_PATH,
+                                             timeout=KROKI_HEALTH_CHECK_TIMEOUT)
+            healthy = response.status_code == 200
+        except httpx.HTTPError:
+            healthy = False
+
+        if healthy != backend.healthy:
+            logger.warning(f"Kroki backend {backend.url} is now {'healthy' if healthy else 'unhealthy'}")
+        backend.healthy = healthy
+
+    async def _probe_periodically(self) -> None:
+        while True:
+            await asyncio.gather(*(self.probe(backend) for backend in self.backends))
+            await asyncio.sleep(KROKI_HEALTH_CHECK_INTERVAL)
+
+    async def warm_up(self) -> None:
+        """Open pooled connections to the backends before traffic arrives"""
+        if len(self.backends) > 1:
+            await asyncio.gather(*(self.probe(backend) for backend in self.backends))
+            return
+        # A single backend is always used; only its connection is worth warming
+        try:
+            await self.client.get(self.backends[0].url + KROKI_HEALTH_CHECK_PATH, timeout=KROKI_HEALTH_CHECK_TIMEOUT)
+        except httpx.HTTPError as e:
+            logger.warning(f"Kroki backend {self.backends[0].url} not reachable at startup: {e}")
+
+    def start(self) -> None:
+        """Start active health probes; only useful with more than one backend"""
+        if len(self.backends) > 1 and KROKI_HEALTH_CHECK_INTERVAL > 0 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._probe_periodically())
+
+    async def aclose(self) -> None:
+        """Stop health probes, close the shared client and release pooled connections"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info("Kroki connection pool closed")
+        self._client = None
+
+    def stats(self) -> dict:
+        """Pool configuration, backend status and request counters for the health endpoint"""
+        return {
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "http2": self.http2,
+            "routing": self.routing,
+            "in_flight": self.in_flight,
+            "requests_total": self.requests_total,
+            "retries_total": self.retries_total,
+            "circuit_opens": sum(b.breaker.opens for b in self.backends),
+            "backends_available": sum(1 for b in self.backends if b.available),
+            "backends": [b.stats() for b in self.backends],
+        }
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""Production entry point: multiple uvicorn workers with a tuned event loop and graceful drain
+
+Workers default to the CPU quota of the container's cgroup when a shared
+render store is configured, and to a single worker otherwise. uvloop and
+httptools are used when installed. On SIGTERM each worker stops accepting
+connections and finishes in-flight requests and renders before it exits.
+"""
+
+import os
+import glob
+import math
+import logging
+import tempfile
+import importlib.util
+from typing import Optional
+
+import uvicorn
+
+logger = logging.getLogger("launcher")
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", 8084))
+# Number of worker processes ("auto" sizes to the cgroup CPU quota)
+WEB_CONCURRENCY = os.getenv("WEB_CONCURRENCY", "auto")
+WEB_MAX_WORKERS = int(os.getenv("WEB_MAX_WORKERS", "8"))
+# Seconds idle keep-alive connections are held open; keep this above the load balancer's idle timeout
+KEEPALIVE_TIMEOUT = int(os.getenv("KEEPALIVE_TIMEOUT", "65"))
+# Pending connections queued by the kernel before accept()
+LISTEN_BACKLOG = int(os.getenv("LISTEN_BACKLOG", "2048"))
+# Seconds a worker waits for in-flight requests and renders on shutdown
+GRACEFUL_SHUTDOWN_TIMEOUT = int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "30"))
+# Honour X-Forwarded-* headers from these addresses
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info").lower()
+
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """Return the CPU quota of the current cgroup (v2 or v1), or None if unlimited"""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def worker_count(value: str = WEB_CONCURRENCY, max_workers: int = WEB_MAX_WORKERS,
+                 shared_store: Optional[bool] = None) -> int:
+    """Number of workers: an explicit count, or the CPUs available to this process
+
+    Short /diagrams/ URLs and binary resource links resolve through the render
+    cache of the worker that created them, so without a render store shared
+    by all workers (RENDER_STORE_DIR) "auto" means a single worker.
+    """
+    if value != "auto":
+        return max(1, int(value))
+    if shared_store is None:
+        shared_store = bool(os.environ.get("RENDER_STORE_DIR"))
+    if not shared_store:
+        return 1
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, math.ceil(limit))
+    return max(1, min(cpus, max_workers))
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def prepare_multiprocess(workers: int) -> Optional[str]:
+    """Set up state shared by workers before they are started
+
+    Prometheus counters and histograms are aggregated through
+    PROMETHEUS_MULTIPROC_DIR. Unless it is set, the launcher creates a fresh
+    directory and returns it, so it can be cleared on exit; a directory set
+    by the operator is never cleared. MCP sessions live in worker memory, so
+    the MCP endpoint is made stateless; any worker can then serve any request.
+    """
+    created_dir = None
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not metrics_dir:
+        created_dir = metrics_dir = tempfile.mkdtemp(prefix="mcp-kroki-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+    elif glob.glob(os.path.join(metrics_dir, "*.db")):
+        logger.warning(f"PROMETHEUS_MULTIPROC_DIR={metrics_dir} holds metric files from an earlier run; "
+                       "their counts are added to this run's until the directory is emptied")
+    os.makedirs(metrics_dir, exist_ok=True)
+
+    if "MCP_STATELESS_HTTP" not in os.environ:
+        os.environ["MCP_STATELESS_HTTP"] = "true"
+    elif os.environ["MCP_STATELESS_HTTP"].lower() != "true":
+        logger.warning("MCP_STATELESS_HTTP=false with several workers: "
+                       "MCP sessions only work if clients stick to one worker")
+
+    # Admission control and rate limiting keep their state in each worker
+    logger.info(f"Admission limits (ADMISSION_MAX_CONCURRENCY, ADMISSION_TYPE_LIMITS, ADMISSION_MAX_QUEUE) "
+                f"and RATE_LIMIT_PER_SECOND/RATE_LIMIT_BURST apply per worker: "
+                f"the server as a whole allows up to {workers} times the configured values")
+    return created_dir
+
+
+def clear_metrics_dir(metrics_dir: str) -> None:
+    """Remove the metric files and the directory created by prepare_multiprocess()"""
+    for path in glob.glob(os.path.join(metrics_dir, "*.db")):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    try:
+        os.rmdir(metrics_dir)
+    except OSError:
+        pass
+
+
+def main() -> None:
+    logging.basicConfig(level=LOG_LEVEL.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    workers = worker_count()
+    if workers > 1 and not os.environ.get("RENDER_STORE_DIR"):
+        # A follow-up request for a short URL or resource link would 404 on any other worker
+        raise SystemExit(f"WEB_CONCURRENCY={workers} needs RENDER_STORE_DIR: without a render store "
+                         "shared by all workers, /diagrams/ URLs only resolve on the worker that created them")
+    metrics_dir = prepare_multiprocess(workers) if workers > 1 else None
+
+    loop = "uvloop" if _installed("uvloop") else "asyncio"
+    http = "httptools" if _installed("httptools") else "h11"
+    logger.info(f"Starting {workers} worker(s) on {HOST}:{PORT} (loop={loop}, http={http}, "
+                f"keep-alive={KEEPALIVE_TIMEOUT}s, backlog={LISTEN_BACKLOG}, "
+                f"graceful shutdown={GRACEFUL_SHUTDOWN_TIMEOUT}s)")
+
+    try:
+        uvicorn.run(
+            "mcp_kroki_server:app",
+            host=HOST,
+            port=PORT,
+            workers=workers,
+            loop=loop,
+            http=http,
+            timeout_keep_alive=KEEPALIVE_TIMEOUT,
+            backlog=LISTEN_BACKLOG,
+            timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_TIMEOUT,
+            proxy_headers=True,
+            forwarded_allow_ips=FORWARDED_ALLOW_IPS,
+            log_level=LOG_LEVEL,
+        )
+    finally:
+        if metrics_dir is not None:
+            clear_metrics_dir(metrics_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""Local diagram pre-validation before falling back to Kroki"""
+
+import os
+import re
+import json
+import logging
+import xml.etree.ElementTree as ElementTree
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Local validation configuration
+LOCAL_VALIDATION_ENABLED = os.getenv("LOCAL_VALIDATION_ENABLED", "true").lower() == "true"
+
+STRUCTURAL_CHECK = "Structural check (local)"
+
+PLANTUML_START = re.compile(r"^\s*@start(\w+)", re.MULTILINE)
+PLANTUML_END = re.compile(r"^\s*@end(\w+)", re.MULTILINE)
+GRAPHVIZ_HEADER = re.compile(r"^\s*(strict\s+)?(graph|digraph)\b", re.IGNORECASE)
+
+
+def _invalid(error: str) -> dict:
+    return {"valid": False, "error": error, "validation_method": STRUCTURAL_CHECK}
+
+
+def _check_brackets(source: str, pairs: dict, line_comments: tuple, quotes: tuple,
+                    html_strings: bool = False) -> Optional[str]:
+    """Check bracket balance, skipping comments and quoted strings
+
+    A "#" line comment only counts at the start of a line (after whitespace).
+    Quote delimiters are tried in order, so list multi-character ones first.
+    Returns an error message, or None when brackets are balanced.
+    """
+    closers = {close: open_ for open_, close in pairs.items()}
+    stack = []
+    i = 0
+    line = 1
+    line_start = 0
+    length = len(source)
+
+    while i < length:
+        char = source[i]
+        quote = next((q for q in quotes if source.startswith(q, i)), None)
+
+        if char == "\n":
+            line += 1
+            line_start = i + 1
+        elif source.startswith("/*", i):
+            end = source.find("*/", i + 2)
+            if end == -1:
+                return f"Unterminated block comment starting on line {line}"
+            line += source.count("\n", i, end)
+            i = end + 2
+            continue
+        elif any(source.startswith(marker, i) and (marker != "#" or not source[line_start:i].strip())
+                 for marker in line_comments):
+            end = source.find("\n", i)
+            i = length if end == -1 else end
+            continue
+        elif quote is not None:
+            start_line = line
+            i += len(quote)
+            while i < length and not source.startswith(quote, i):
+                if source[i] == "\\":
+                    i += 1
+                elif source[i] == "\n":
+                    line += 1
+                i += 1
+            if i >= length:
+                return f"Unterminated string starting on line {start_line}"
+            i += len(quote) - 1
+        elif html_strings and char == "<":
+            # Graphviz HTML-like labels: <...> with nested angle brackets
+            start_line = line
+            depth = 0
+            while i < length:
+                if source[i] == "<":
+                    depth += 1
+                elif source[i] == ">":
+                    depth -= 1
+                    if depth == 0:
+                        break
+                elif source[i] == "\n":
+                    line += 1
+                i += 1
+            if depth != 0:
+                return f"Unterminated HTML label starting on line {start_line}"
+        elif char in pairs:
+            stack.append((char, line))
+        elif char in closers:
+            if not stack or stack[-1][0] != closers[char]:
+                return f"Unexpected '{char}' on line {line}"
+            stack.pop()
+
+        i += 1
+
+    if stack:
+        char, open_line = stack[-1]
+        return f"Unclosed '{char}' opened on line {open_line}"
+    return None
+
+
+class LocalValidator:
+    """Cheap local syntax checks that reject broken input before Kroki is called
+
+    validate() returns an invalid result dict when a check fails, or None
+    when the local checks cannot decide and Kroki has to be asked.
+    """
+
+    def __init__(self, enabled: bool = LOCAL_VALIDATION_ENABLED):
+        self.enabled = enabled
+
+        if not self.enabled:
+            logger.info("Local diagram validation disabled")
+            return
+
+        self._checks = {
+            "vega": self._check_vega,
+            "vegalite": self._check_vega,
+            "bpmn": self._check_bpmn,
+            "plantuml": self._check_plantuml,
+            "graphviz": self._check_graphviz,
+            "dbml": self._check_dbml,
+        }
+
+    def validate(self, diagram_type: str, diagram_source: str) -> Optional[dict]:
+        """Validate locally; return None when the result is not conclusive"""
+        if not self.enabled:
+            return None
+
+        if not diagram_source.strip():
+            return _invalid("Diagram source is empty")
+
+        check = self._checks.get(diagram_type)
+        if check is None:
+            return None
+        return check(diagram_type, diagram_source)
+
+    def _check_vega(self, diagram_type: str, diagram_source: str) -> Optional[dict]:
+        try:
+            spec = json.loads(diagram_source)
+        except json.JSONDecodeError as e:
+            return _invalid(f"Invalid JSON: {e}")
+
+        if not isinstance(spec, dict):
+            return _invalid("Specification must be a JSON object")
+        return None
+
+    def _check_bpmn(self, diagram_type: str, diagram_source: str) -> Optional[dict]:
+        try:
+            root = ElementTree.fromstring(diagram_source)
+        except ElementTree.ParseError as e:
+            return _invalid(f"Invalid XML: {e}")
+
+        if root.tag.rsplit("}", 1)[-1] != "definitions":
+            return _invalid(f"Root element must be 'definitions', found '{root.tag}'")
+        return None
+
+    def _check_plantuml(self, diagram_type: str, diagram_source: str) -> Optional[dict]:
+        starts = PLANTUML_START.findall(diagram_source)
+        ends = PLANTUML_END.findall(diagram_source)
+        if not starts and not ends:
+            return None
+
+        if len(starts) != len(ends):
+            return _invalid(f"Unbalanced @start/@end markers: {len(starts)} @start, {len(ends)} @end")
+        for start, end in zip(starts, ends):
+            if start.lower() != end.lower():
+                return _invalid(f"Mismatched markers: @start{start} closed by @end{end}")
+        return None
+
+    def _check_graphviz(self, diagram_type: str, diagram_source: str) -> Optional[dict]:
+        error = _check_brackets(
+            diagram_source,
+            pairs={"{": "}", "[": "]"},
+            line_comments=("//", "#"),
+            quotes=('"',),
+            html_strings=True,
+        )
+        if error:
+            return _invalid(error)
+
+        uncommented = re.sub(r"/\*.*?\*/|//[^\n]*|^\s*#[^\n]*", "", diagram_source, flags=re.DOTALL | re.MULTILINE)
+        if not GRAPHVIZ_HEADER.match(uncommented):
+            return _invalid("Graph must start with 'graph' or 'digraph'")
+        return None
+
+    def _check_dbml(self, diagram_type: str, diagram_source: str) -> Optional[dict]:
+        error = _check_brackets(
+            diagram_source,
+            pairs={"{": "}", "[": "]", "(": ")"},
+            line_comments=("//",),
+            quotes=("'''", "'", '"', "`"),
+        )
+        if error:
+            return _invalid(error)
+        return None
+
+
+# Global validator instance
+local_validator = LocalValidator()
@@ -2,32 +2,110 @@
 """Kroki MCP Server using HTTP/JSON-RPC with streaming support"""
 
 import os
+import re
 import logging
 import base64
 import zlib
-import requests
-from typing import Optional
-from fastmcp import FastMCP
-from fastapi import FastAPI, Depends
+import json
+import time
+import hashlib
+import asyncio
+import signal
+
+# Imported first so the startup profile covers the imports below
+from startup import startup
+
+import httpx
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field
+from fastmcp import FastMCP, Context
+from fastmcp.server.dependencies import get_http_request
+from fastmcp.tools.tool import ToolResult
+from mcp.types import ResourceLink, TextContent
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from starlette.middleware import Middleware
 from starlette.middleware.cors import CORSMiddleware
+from sse_starlette.sse import AppStatus
 
 # Import OAuth middleware
-from oauth_middleware import get_current_user, optional_authentication, oauth_validator
+from oauth_middleware import get_current_user, optional_authentication, oauth_validator, require_admin
+from render_cache import render_cache, make_cache_key
+from kroki_client import KrokiClient
+from singleflight import SingleFlight
+from normalization import source_normalizer
+from svg_optimizer import SVG_OPTIMIZE_DEFAULT, svg_optimizer
+from diagram_url import DIAGRAM_URL_MAX_LENGTH, INCLUDE_DIAGRAM_URL, short_urls, url_encoder
+from admission import (
+    AdmissionRejected, PriorityMiddleware, admission_controller, rate_limiter, reset_render_priority,
+    set_render_priority
+)
+from local_validation import local_validator
+from render_store import render_store
+from streaming import (
+    STREAM_CHUNK_SIZE, OutputTooLargeError, check_content_length,
+    read_limited, write_bytes_to_file, write_stream_to_file
+)
+from tracing import TimingMiddleware, ToolTimingMiddleware, phase, tracing
+from profiling import PROFILE_MAX_SECONDS, PROFILING_ENABLED, ProfilerBusy, profiler
+from export import EXPORT_MAX_CONCURRENCY, EXPORT_MAX_ITEMS, ExportWriter
+from warmup import WARMUP_MANIFEST, hot_keys, load_entries, warmer
+from tool_surface import compact_tools_enabled, per_type_tools_enabled, tool_list_cache
+from compression import RESPONSE_COMPRESSION, CompressionMiddleware
+from metrics import (
+    MetricsMiddleware, diagram_label, mark_worker_exit, observe_kroki, observe_render, render_metrics,
+    stats_collector
+)
 
 # Configure logging
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=LOG_LEVEL,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+startup.mark("imports")
 
 PORT = int(os.getenv("PORT", 8084))
 HOST = os.getenv("HOST", "0.0.0.0")
-KROKI_URL = os.getenv("KROKI_URL", "http://localhost:8000")
+# Kroki backends; KROKI_URL defaults to the first one and is used to build diagram URLs
+KROKI_URLS = [url.strip().rstrip("/") for url in os.getenv("KROKI_URLS", "").split(",") if url.strip()]
+KROKI_URL = os.getenv("KROKI_URL", KROKI_URLS[0] if KROKI_URLS else "http://localhost:8000").rstrip("/")
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+MAX_DIAGRAM_SOURCE_BYTES = int(os.getenv("MAX_DIAGRAM_SOURCE_BYTES", str(1024 * 1024)))
+# Public base URL of this server; when set, diagram_url points at its /render endpoint
+PUBLIC_URL = os.getenv("PUBLIC_URL", "").rstrip("/")
+RENDER_CACHE_CONTROL = os.getenv("RENDER_CACHE_CONTROL", "public, max-age=31536000, immutable")
+# Return binary renders of at least BINARY_RESOURCE_MIN_BYTES as resource links instead of inline base64
+BINARY_AS_RESOURCE = os.getenv("BINARY_AS_RESOURCE", "false").lower() == "true"
+BINARY_RESOURCE_MIN_BYTES = int(os.getenv("BINARY_RESOURCE_MIN_BYTES", str(256 * 1024)))
+# Answer MCP requests with plain JSON instead of SSE streams (allows response compression,
+# but progress notifications are not streamed)
+MCP_JSON_RESPONSE = os.getenv("MCP_JSON_RESPONSE", "false").lower() == "true"
+# Serve each MCP request without a server-side session (set by the launcher when running several workers)
+MCP_STATELESS_HTTP = os.getenv("MCP_STATELESS_HTTP", "false").lower() == "true"
+# Seconds shutdown waits for in-flight renders
+GRACEFUL_SHUTDOWN_TIMEOUT = float(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "30"))
+
+BINARY_FORMATS = {"png", "jpeg", "pdf"}
+
+MEDIA_TYPES = {
+    "svg": "image/svg+xml",
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "pdf": "application/pdf",
+    "txt": "text/plain; charset=utf-8",
+    "base64": "text/plain; charset=utf-8",
+}
 
 logger.info(f"Initializing Kroki MCP HTTP Server on {HOST}:{PORT}")
 logger.info(f"Kroki server URL: {KROKI_URL}")
+if KROKI_URLS:
+    logger.info(f"Kroki backends: {', '.join(KROKI_URLS)}")
+if PUBLIC_URL:
+    logger.info(f"Diagram URLs served from: {PUBLIC_URL}/render")
 
 # Log OAuth status
 if oauth_validator.enabled:
@@ -37,6 +115,32 @@ else:
 
 mcp = FastMCP("kroki-mcp-server")
 
+# Shared async Kroki client (pooled keep-alive connections over the Kroki backends)
+kroki_client = KrokiClient(KROKI_URLS or [KROKI_URL], aliases=[KROKI_URL])
+
+# Coalesces identical concurrent renders into a single Kroki request; renders
+# still queued for admission are dropped once every caller has been cancelled
+render_flight = SingleFlight(on_abandoned=admission_controller.cancel_queued)
+
+# Export component counters on /metrics
+stats_collector.add("render_cache", render_cache.stats)
+stats_collector.add("kroki_pool", kroki_client.stats)
+stats_collector.add("render_coalescing", render_flight.stats)
+stats_collector.add("render_store", render_store.stats)
+stats_collector.add("admission", admission_controller.stats)
+stats_collector.add("source_normalization", source_normalizer.stats)
+stats_collector.add("diagram_url", url_encoder.stats)
+stats_collector.add("svg_optimizer", svg_optimizer.stats)
+stats_collector.add("short_urls", short_urls.stats)
+stats_collector.add("rate_limit", rate_limiter.stats)
+stats_collector.add("oauth_token_cache", oauth_validator.token_cache.stats)
+stats_collector.add("tool_surface", tool_list_cache.stats)
+stats_collector.add("startup", startup.stats)
+stats_collector.add("warmup", warmer.stats)
+stats_collector.add("hot_keys", hot_keys.stats)
+stats_collector.add("tracing", tracing.stats)
+stats_collector.add("profiler", profiler.stats)
+
 # Supported diagram types from Kroki
 DIAGRAM_TYPES = [
     "blockdiag", "seqdiag", "actdiag", "nwdiag", "packetdiag", "rackdiag",
@@ -46,6 +150,11 @@ DIAGRAM_TYPES = [
     "wavedrom", "wireviz"
 ]
 
+mcp.add_middleware(MetricsMiddleware(DIAGRAM_TYPES))
+mcp.add_middleware(tool_list_cache)
+if tracing.enabled:
+    mcp.add_middleware(ToolTimingMiddleware())
+
 # Diagram types that support validation (through schema or library capabilities)
 # Based on research, these formats have formal schemas or validation capabilities
 VALIDATABLE_TYPES = {
@@ -59,82 +168,484 @@ VALIDATABLE_TYPES = {
 }
 
 
+# Short content-addressed diagram URLs: /diagrams/<render cache key>.<format>
+SHORT_URL_PATTERN = re.compile(r"/diagrams/([0-9a-f]{64})\.([a-z0-9]+)$")
+# Content keys accepted by export_diagrams: <render cache key>[.<format>]
+CONTENT_KEY_PATTERN = re.compile(r"([0-9a-f]{64})(?:\.([a-z0-9]+))?")
+
+
 def encode_diagram(diagram_source: str) -> str:
-    """Encode diagram source for Kroki URL"""
-    compressed = zlib.compress(diagram_source.encode('utf-8'), level=9)
-    encoded = base64.urlsafe_b64encode(compressed).decode('utf-8')
-    return encoded
+    """Encode diagram source for Kroki URL (memoized by content hash)"""
+    return url_encoder.encode(diagram_source)
+
+
+def decode_diagram(encoded: str) -> str:
+    """Decode a Kroki URL payload back to diagram source
+
+    Raises ValueError if the payload is malformed or decodes to more than
+    MAX_DIAGRAM_SOURCE_BYTES.
+    """
+    try:
+        compressed = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+        decompressor = zlib.decompressobj()
+        source = decompressor.decompress(compressed, MAX_DIAGRAM_SOURCE_BYTES)
+    except (ValueError, zlib.error) as e:
+        raise ValueError(f"Invalid diagram payload: {e}")
+
+    if decompressor.unconsumed_tail:
+        raise ValueError(f"Diagram source exceeds {MAX_DIAGRAM_SOURCE_BYTES} bytes")
+    return source.decode('utf-8')
+
+
+def server_base_url() -> Optional[str]:
+    """Base URL clients reach this server on: PUBLIC_URL, else the current request's"""
+    if PUBLIC_URL:
+        return PUBLIC_URL
+    try:
+        return str(get_http_request().base_url).rstrip("/")
+    except RuntimeError:
+        return None
+
+
+def build_diagram_url(diagram_type: str, output_format: str, diagram_source: str) -> str:
+    """Build the GET URL of a diagram, on this server if PUBLIC_URL is set, else on Kroki
+
+    URLs longer than DIAGRAM_URL_MAX_LENGTH are replaced by a short
+    content-addressed URL served by this server, when its base URL is known.
+    """
+    with phase("url"):
+        encoded = encode_diagram(diagram_source)
+    if PUBLIC_URL:
+        diagram_url = f"{PUBLIC_URL}/render/{diagram_type}/{output_format}/{encoded}"
+    else:
+        diagram_url = f"{KROKI_URL}/{diagram_type}/{output_format}/{encoded}"
+
+    if DIAGRAM_URL_MAX_LENGTH and len(diagram_url) > DIAGRAM_URL_MAX_LENGTH:
+        base_url = server_base_url()
+        if base_url:
+            cache_key = make_cache_key(diagram_type, output_format, diagram_source)
+            short_urls.register(cache_key, diagram_type, output_format, diagram_source)
+            return f"{base_url}/diagrams/{cache_key}.{output_format}"
+        logger.debug(f"Diagram URL is {len(diagram_url)} characters but no base URL is known for a short URL")
+    return diagram_url
+
 
+def parse_diagram_url(diagram_url: str) -> Optional[tuple]:
+    """Split a GET diagram URL into (diagram_type, output_format, diagram_source)
 
-def call_kroki(diagram_type: str, diagram_source: str, output_format: str = "svg") -> dict:
+    Returns None if the URL does not point at the configured Kroki server or
+    this server's /render endpoint, or cannot be decoded. Short /diagrams/ URLs
+    are resolved while their source is still registered.
+    """
+    short = SHORT_URL_PATTERN.search(diagram_url.split("?", 1)[0])
+    if short:
+        return short_urls.lookup(short.group(1))
+
+    prefixes = [f"{KROKI_URL}/"]
+    if PUBLIC_URL:
+        prefixes.insert(0, f"{PUBLIC_URL}/render/")
+    prefix = next((p for p in prefixes if diagram_url.startswith(p)), None)
+    if prefix is None:
+        return None
+
+    parts = diagram_url[len(prefix):].split("?", 1)[0].split("/")
+    if len(parts) != 3 or parts[0] not in DIAGRAM_TYPES:
+        return None
+
+    diagram_type, output_format, encoded = parts
+    try:
+        return diagram_type, output_format, decode_diagram(encoded)
+    except ValueError:
+        return None
+
+
+async def remember_render(cache_key: str, content: bytes) -> None:
+    """Store rendered bytes in the render cache and the persistent store"""
+    render_cache.put(cache_key, content)
+    if render_store.enabled:
+        await asyncio.to_thread(render_store.put, cache_key, content)
+
+
+async def optimize_svg_render(cache_key: str, content: bytes) -> tuple:
+    """Return (optimized SVG, stats), caching the optimized output next to the raw render"""
+    optimized_key = hashlib.sha256(f"{cache_key}:{svg_optimizer.cache_tag}".encode("utf-8")).hexdigest()
+    optimized = render_cache.get(optimized_key)
+    if optimized is None and render_store.enabled:
+        optimized = await asyncio.to_thread(render_store.get, optimized_key)
+    if optimized is None:
+        with phase("svg_optimize"):
+            optimized = await asyncio.to_thread(svg_optimizer.optimize, content)
+        await remember_render(optimized_key, optimized)
+
+    return optimized, {
+        "original_bytes": len(content),
+        "optimized_bytes": len(optimized),
+        "bytes_saved": len(content) - len(optimized),
+    }
+
+
+async def current_client_id() -> str:
+    """Identify the calling client for rate limiting
+
+    Uses the OAuth `sub` (or `client_id`) of a valid bearer token, falling
+    back to the remote address.
+    """
+    try:
+        request = get_http_request()
+    except RuntimeError:
+        return "local"
+
+    authorization = request.headers.get("authorization", "")
+    if oauth_validator.enabled and authorization.lower().startswith("bearer "):
+        try:
+            token_info = await oauth_validator.validate_token_async(authorization[7:])
+            client = token_info.get("sub") or token_info.get("client_id")
+            if client:
+                return f"client:{client}"
+        except HTTPException:
+            pass
+
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def tool_priority_class(tool: str) -> str:
+    """Admission priority class of the renders a tool starts"""
+    if tool.startswith("validate_diagram"):
+        return "validate"
+    if tool == "generate_diagrams_batch":
+        return "batch"
+    if tool in ("export_diagrams", "save_diagram"):
+        return "export"
+    return "interactive"
+
+
+mcp.add_middleware(PriorityMiddleware(tool_priority_class, current_client_id))
+
+
+def build_resource_reference(diagram_type: str, diagram_source: str, output_format: str,
+                             content: bytes) -> Optional[dict]:
+    """Describe rendered bytes served by this server's /diagrams endpoint
+
+    Returns None when the server's base URL is not known (e.g. stdio transport).
+    """
+    base_url = server_base_url()
+    if not base_url:
+        return None
+
+    cache_key = make_cache_key(diagram_type, output_format, diagram_source)
+    # Lets /diagrams render again if the bytes have left the cache by the time they are fetched
+    short_urls.register(cache_key, diagram_type, output_format, diagram_source)
+    return {
+        "uri": f"{base_url}/diagrams/{cache_key}.{output_format}",
+        "name": f"{diagram_type}-{cache_key[:12]}.{output_format}",
+        "mime_type": MEDIA_TYPES[output_format],
+        "size_bytes": len(content),
+    }
+
+
+def build_render_result(diagram_type: str, diagram_source: str, output_format: str,
+                        content: bytes, cached: bool = False, include_url: bool = True,
+                        binary_as_resource: Optional[bool] = None) -> dict:
+    """Build the tool result for rendered diagram bytes
+
+    Binary output is inlined as base64 unless binary_as_resource is true, or
+    it is None, BINARY_AS_RESOURCE is set and the output is at least
+    BINARY_RESOURCE_MIN_BYTES; then a resource reference is returned instead.
+    """
+    result = {
+        "success": True,
+        "format": output_format,
+        "cached": cached
+    }
+
+    resource = None
+    if output_format in BINARY_FORMATS:
+        if binary_as_resource is None:
+            binary_as_resource = BINARY_AS_RESOURCE and len(content) >= BINARY_RESOURCE_MIN_BYTES
+        if binary_as_resource:
+            resource = build_resource_reference(diagram_type, diagram_source, output_format, content)
+
+    if resource:
+        result["resource"] = resource
+    elif output_format in ["svg", "txt"]:
+        result["data"] = content.decode('utf-8', errors='replace')
+    else:
+        with phase("base64"):
+            result["data"] = base64.b64encode(content).decode('utf-8')
+
+    if include_url:
+        # Generate URL for reference
+        result["diagram_url"] = build_diagram_url(diagram_type, output_format, diagram_source)
+    return result
+
+
+def as_tool_result(result: dict):
+    """Return result as is, or as a ToolResult with a resource link when it references a resource"""
+    resource = result.get("resource")
+    if not resource:
+        return result
+    return ToolResult(
+        content=[
+            TextContent(type="text", text=json.dumps(result)),
+            ResourceLink(type="resource_link", uri=resource["uri"], name=resource["name"],
+                         mimeType=resource["mime_type"], size=resource["size_bytes"]),
+        ],
+        structured_content=result,
+    )
+
+
+async def call_kroki(diagram_type: str, diagram_source: str, output_format: str = "svg",
+                     include_url: Optional[bool] = None, optimize_svg: Optional[bool] = None,
+                     binary_as_resource: Optional[bool] = None) -> dict:
     """
     Call Kroki API to generate diagram
 
+    Rendered bytes are served from the in-process render cache when the same
+    (type, format, source) was rendered recently, and concurrent calls for the
+    same key share a single in-flight Kroki request.
+
     Args:
         diagram_type: Type of diagram (e.g., 'plantuml', 'mermaid')
         diagram_source: Source code of the diagram
         output_format: Output format (svg, png, pdf, jpeg, base64)
+        include_url: Whether to build diagram_url (default: INCLUDE_DIAGRAM_URL)
+        optimize_svg: Whether to minify SVG output (default: SVG_OPTIMIZE_DEFAULT)
+        binary_as_resource: Whether to return binary output as a resource reference
+            (default: BINARY_AS_RESOURCE for outputs of at least BINARY_RESOURCE_MIN_BYTES)
 
     Returns:
         dict with success status, data/error, and diagram_url
     """
+    result = await fetch_render(diagram_type, diagram_source, output_format)
+    if not result["success"]:
+        return result
+    if include_url is None:
+        include_url = INCLUDE_DIAGRAM_URL
+    if optimize_svg is None:
+        optimize_svg = SVG_OPTIMIZE_DEFAULT
+
+    content = result["content"]
+    optimization = None
+    if optimize_svg and output_format == "svg":
+        content, optimization = await optimize_svg_render(result["cache_key"], content)
+
+    render_result = build_render_result(diagram_type, result["diagram_source"], output_format,
+                                        content, cached=result["cached"], include_url=include_url,
+                                        binary_as_resource=binary_as_resource)
+    if optimization:
+        render_result["svg_optimization"] = optimization
+    return render_result
+
+
+async def fetch_render(diagram_type: str, diagram_source: str, output_format: str,
+                       background: bool = False) -> dict:
+    """Return rendered bytes from the render cache, the render store or Kroki
+
+    The source is normalized first, so sources differing only in formatting
+    share cache entries, in-flight renders and diagram URLs. Background
+    renders (warm-up) are neither rate limited nor counted as hot keys.
+
+    Returns:
+        dict with success status, content bytes, the normalized diagram_source and
+        cache_key, or the error
+    """
+    type_label = diagram_label(diagram_type, DIAGRAM_TYPES)
+    format_label = diagram_label(output_format, MEDIA_TYPES)
+    source_bytes = len(diagram_source.encode('utf-8'))
+
+    with phase("normalize"):
+        normalized_source = source_normalizer.normalize(diagram_type, diagram_source)
+    changed = normalized_source != diagram_source
+    diagram_source = normalized_source
+
+    cache_key = make_cache_key(diagram_type, output_format, diagram_source)
+    cached = render_cache.get(cache_key)
+    if cached is not None:
+        logger.debug(f"Render cache hit for {diagram_type}/{output_format}")
+        if changed:
+            source_normalizer.record_hit(diagram_type)
+        if not background:
+            hot_keys.record(cache_key, diagram_type, output_format, diagram_source)
+        observe_render(type_label, format_label, "cache", source_bytes, len(cached))
+        return {"success": True, "content": cached, "cached": True, "diagram_source": diagram_source,
+                "cache_key": cache_key}
+
+    if rate_limiter.enabled and not background:
+        try:
+            rate_limiter.check(await current_client_id())
+        except AdmissionRejected as e:
+            observe_render(type_label, format_label, "rejected", source_bytes, None)
+            return e.to_result()
+
+    coalesced = render_flight.is_in_flight(cache_key)
+    result = await render_flight.do(
+        cache_key,
+        lambda: render_with_kroki(diagram_type, diagram_source, output_format, cache_key)
+    )
+
+    if not result["success"]:
+        observe_render(type_label, format_label, "rejected" if result.get("retryable") else "error",
+                       source_bytes, None)
+        return dict(result)
+
+    source = "coalesced" if coalesced else result["source"]
+    if changed and source != "kroki":
+        source_normalizer.record_hit(diagram_type)
+    if not background:
+        hot_keys.record(cache_key, diagram_type, output_format, diagram_source)
+    observe_render(type_label, format_label, source, source_bytes, len(result["content"]))
+    return dict(result, diagram_source=diagram_source, cache_key=cache_key)
+
+
+async def warm_render(diagram_type: str, diagram_source: str, output_format: str) -> dict:
+    """Render one warm-up entry into the render cache, as batch traffic"""
+    token = set_render_priority("batch", "warmup")
     try:
-        # POST request with plain text body (as per Kroki documentation)
-        url = f"{KROKI_URL}/{diagram_type}/{output_format}"
+        return await fetch_render(diagram_type, diagram_source, output_format, background=True)
+    finally:
+        reset_render_priority(token)
 
-        headers = {
-            "Content-Type": "text/plain"
-        }
 
-        response = requests.post(url, data=diagram_source, headers=headers, timeout=30)
+# Warm-up renders wait while real renders are queued for an admission slot
+warmer.render = warm_render
+warmer.busy = lambda: admission_controller.waiting > 0
 
-        if response.status_code == 200:
-            # Generate URL for reference
-            encoded = encode_diagram(diagram_source)
-            diagram_url = f"{KROKI_URL}/{diagram_type}/{output_format}/{encoded}"
 
-            if output_format in ["svg", "txt"]:
-                result_data = response.text
-            else:
-                result_data = base64.b64encode(response.content).decode('utf-8')
+async def render_with_kroki(diagram_type: str, diagram_source: str, output_format: str,
+                            cache_key: str) -> dict:
+    """Render a diagram on the Kroki backend and store the result
 
-            return {
-                "success": True,
-                "data": result_data,
-                "diagram_url": diagram_url,
-                "format": output_format
-            }
-        else:
-            return {
-                "success": False,
-                "error": f"Kroki server returned error: {response.status_code} - {response.text}",
-                "status_code": response.status_code
-            }
+    The persistent render store is checked first, so renders written by other
+    replicas or before a restart are reused. Kroki requests then wait for an
+    admission slot and are shed with a retryable error when the queue is full.
+    """
+    if render_store.enabled:
+        with phase("store"):
+            stored = await asyncio.to_thread(render_store.get, cache_key)
+        if stored is not None:
+            render_cache.put(cache_key, stored)
+            return {"success": True, "content": stored, "cached": True, "source": "store"}
 
-    except requests.exceptions.RequestException as e:
+    try:
+        async with admission_controller.slot(diagram_type):
+            with phase("kroki"):
+                result = await request_kroki_render(diagram_type, diagram_source, output_format)
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected {diagram_type}/{output_format} render: {e}")
+        return e.to_result()
+
+    if result["success"]:
+        await remember_render(cache_key, result["content"])
+    return result
+
+
+async def request_kroki_render(diagram_type: str, diagram_source: str, output_format: str) -> dict:
+    """POST a diagram to Kroki and read the rendered bytes"""
+    started = time.perf_counter()
+    kroki_status = None
+    try:
+        # POST request with plain text body (as per Kroki documentation);
+        # the body is read in chunks and capped at MAX_OUTPUT_BYTES
+        async with kroki_client.render_stream(diagram_type, output_format, diagram_source) as response:
+            if response.status_code == 200:
+                content = await read_limited(response)
+            else:
+                kroki_status = response.status_code
+                await response.aread()
+                return {
+                    "success": False,
+                    "error": f"Kroki server returned error: {response.status_code} - {response.text}",
+                    "status_code": response.status_code
+                }
+
+    except OutputTooLargeError as e:
+        logger.warning(f"Rejected {diagram_type}/{output_format} render: {e}")
+        return {
+            "success": False,
+            "error": str(e)
+        }
+    except httpx.HTTPError as e:
+        kroki_status = "connection"
         logger.error(f"Error calling Kroki: {e}")
         return {
             "success": False,
             "error": f"Failed to connect to Kroki server: {str(e)}"
         }
+    finally:
+        observe_kroki(diagram_label(diagram_type, DIAGRAM_TYPES), diagram_label(output_format, MEDIA_TYPES),
+                      time.perf_counter() - started, kroki_status)
+
+    return {"success": True, "content": content, "cached": False, "source": "kroki"}
+
+
+async def generate_diagram_of_type(diagram_type: str, diagram_source: str, output_format: str = "svg",
+                                  include_url: Optional[bool] = None, optimize_svg: Optional[bool] = None,
+                                  binary_as_resource: Optional[bool] = None):
+    """Render a diagram for the generation tools"""
+    logger.info(f"Generating {diagram_type} diagram")
+    result = await call_kroki(diagram_type, diagram_source, output_format, include_url, optimize_svg,
+                              binary_as_resource)
+    return as_tool_result(result)
+
+
+async def validate_diagram_of_type(diagram_type: str, diagram_source: str) -> dict:
+    """Validate a diagram for the validation tools
+
+    Cheap local checks run first; Kroki is only asked when they are not conclusive.
+    """
+    logger.info(f"Validating {diagram_type} diagram")
+    validation_method = VALIDATABLE_TYPES.get(diagram_type, "Parser validation")
+
+    local_result = local_validator.validate(diagram_type, diagram_source)
+    if local_result is not None:
+        state = "valid" if local_result["valid"] else "invalid"
+        response = {
+            "valid": local_result["valid"],
+            "message": f"{diagram_type} diagram syntax is {state}",
+            "validation_method": local_result["validation_method"]
+        }
+        if not local_result["valid"]:
+            response["error"] = local_result["error"]
+        return response
+
+    result = await call_kroki(diagram_type, diagram_source, "svg", include_url=False)
+
+    if result.get("retryable"):
+        # Shed by admission control; the source was not checked
+        return {
+            "valid": None,
+            "message": f"{diagram_type} diagram could not be validated now",
+            "error": result["error"],
+            "retryable": True,
+            "retry_after": result["retry_after"],
+            "validation_method": validation_method
+        }
+
+    if result["success"]:
+        return {
+            "valid": True,
+            "message": f"{diagram_type} diagram syntax is valid",
+            "validation_method": validation_method
+        }
+    else:
+        return {
+            "valid": False,
+            "message": f"{diagram_type} diagram syntax is invalid",
+            "error": result.get("error", "Unknown error"),
+            "validation_method": validation_method
+        }
 
 
 # Generate tools for each diagram type
 def create_generate_tool(diagram_type: str):
     """Create a generate tool for a specific diagram type"""
 
-    def generate_func(diagram_source: str, output_format: str = "svg") -> dict:
-        f"""Generate {diagram_type} diagram
-
-        Args:
-            diagram_source: Source code for the {diagram_type} diagram
-            output_format: Output format (svg, png, pdf, jpeg, base64). Default: svg
-
-        Returns:
-            Dictionary with diagram data and URL
-        """
-        logger.info(f"Generating {diagram_type} diagram")
-        return call_kroki(diagram_type, diagram_source, output_format)
+    async def generate_func(diagram_source: str, output_format: str = "svg",
+                            include_url: Optional[bool] = None,
+                            optimize_svg: Optional[bool] = None,
+                            binary_as_resource: Optional[bool] = None) -> dict:
+        return await generate_diagram_of_type(diagram_type, diagram_source, output_format, include_url,
+                                              optimize_svg, binary_as_resource)
 
     # Set the function name and docstring before registering
     generate_func.__name__ = f"generate_diagram_{diagram_type}"
@@ -143,6 +654,10 @@ def create_generate_tool(diagram_type: str):
 Args:
     diagram_source: Source code for the {diagram_type} diagram
     output_format: Output format (svg, png, pdf, jpeg, base64). Default: svg
+    include_url: Include diagram_url in the result. Default: server setting (true)
+    optimize_svg: Minify SVG output and report bytes saved. Default: server setting (false)
+    binary_as_resource: Return png/jpeg/pdf output as a resource link instead of base64 data.
+        Default: server setting (large outputs only, if enabled)
 
 Returns:
     Dictionary with diagram data and URL
@@ -155,40 +670,15 @@ Returns:
 def create_validate_tool(diagram_type: str):
     """Create a validate tool for diagram types that support validation"""
 
-    def validate_func(diagram_source: str) -> dict:
-        f"""Validate {diagram_type} diagram syntax
-
-        This tool validates the diagram syntax by attempting to generate it.
-        Validation method: {VALIDATABLE_TYPES.get(diagram_type, 'Parser validation')}
-
-        Args:
-            diagram_source: Source code for the {diagram_type} diagram
-
-        Returns:
-            Dictionary with validation result
-        """
-        logger.info(f"Validating {diagram_type} diagram")
-        result = call_kroki(diagram_type, diagram_source, "svg")
-
-        if result["success"]:
-            return {
-                "valid": True,
-                "message": f"{diagram_type} diagram syntax is valid",
-                "validation_method": VALIDATABLE_TYPES.get(diagram_type, "Parser validation")
-            }
-        else:
-            return {
-                "valid": False,
-                "message": f"{diagram_type} diagram syntax is invalid",
-                "error": result.get("error", "Unknown error"),
-                "validation_method": VALIDATABLE_TYPES.get(diagram_type, "Parser validation")
-            }
+    async def validate_func(diagram_source: str) -> dict:
+        return await validate_diagram_of_type(diagram_type, diagram_source)
 
     # Set the function name and docstring before registering
     validate_func.__name__ = f"validate_diagram_{diagram_type}"
     validate_func.__doc__ = f"""Validate {diagram_type} diagram syntax
 
-This tool validates the diagram syntax by attempting to generate it.
+This tool validates the diagram syntax with cheap local checks first and, when
+those are not conclusive, by attempting to generate it.
 Validation method: {VALIDATABLE_TYPES.get(diagram_type, 'Parser validation')}
 
 Args:
@@ -201,17 +691,169 @@ Returns:
     return mcp.tool()(validate_func)
 
 
-# Register tools for all diagram types
-for dtype in DIAGRAM_TYPES:
-    create_generate_tool(dtype)
+# Diagram type enums of the compact tools
+DiagramType = Literal[tuple(DIAGRAM_TYPES)]
+ValidatableType = Literal[tuple(VALIDATABLE_TYPES)]
+
+
+async def generate_diagram(diagram_type: DiagramType, diagram_source: str, output_format: str = "svg",
+                           include_url: Optional[bool] = None, optimize_svg: Optional[bool] = None,
+                           binary_as_resource: Optional[bool] = None) -> dict:
+    """Generate a diagram of any supported type
+
+    Args:
+        diagram_type: Type of diagram
+        diagram_source: Source code of the diagram
+        output_format: Output format (svg, png, pdf, jpeg, base64). Default: svg
+        include_url: Include diagram_url in the result. Default: server setting (true)
+        optimize_svg: Minify SVG output and report bytes saved. Default: server setting (false)
+        binary_as_resource: Return png/jpeg/pdf output as a resource link instead of base64 data.
+            Default: server setting (large outputs only, if enabled)
 
-    # Only create validate tool for types that support validation
-    if dtype in VALIDATABLE_TYPES:
-        create_validate_tool(dtype)
+    Returns:
+        Dictionary with diagram data and URL
+    """
+    return await generate_diagram_of_type(diagram_type, diagram_source, output_format, include_url,
+                                          optimize_svg, binary_as_resource)
+
+
+async def validate_diagram(diagram_type: ValidatableType, diagram_source: str) -> dict:
+    """Validate diagram syntax with local checks and, if not conclusive, by rendering it
+
+    Args:
+        diagram_type: Type of diagram (types with schema or parser validation)
+        diagram_source: Source code of the diagram
+
+    Returns:
+        Dictionary with validation result
+    """
+    return await validate_diagram_of_type(diagram_type, diagram_source)
+
+
+# Register the diagram tools of the configured TOOL_SURFACE
+with tool_list_cache.measure_registration():
+    if per_type_tools_enabled():
+        for dtype in DIAGRAM_TYPES:
+            create_generate_tool(dtype)
+
+            # Only create validate tool for types that support validation
+            if dtype in VALIDATABLE_TYPES:
+                create_validate_tool(dtype)
+
+    if compact_tools_enabled():
+        mcp.tool()(generate_diagram)
+        mcp.tool()(validate_diagram)
+startup.mark("tool registration")
+
+
+class DiagramRequest(BaseModel):
+    """A single diagram to render in a batch"""
+
+    diagram_type: str = Field(description="Type of diagram (e.g., 'plantuml', 'mermaid')")
+    source: str = Field(description="Source code of the diagram")
+    output_format: str = Field(default="svg", description="Output format (svg, png, pdf, jpeg, base64)")
 
 
 @mcp.tool()
-def obtain_svg_from_diagram(diagram_url: str) -> dict:
+async def generate_diagrams_batch(
+    items: List[DiagramRequest],
+    max_concurrency: Optional[int] = None,
+    include_url: Optional[bool] = None,
+    optimize_svg: Optional[bool] = None,
+    binary_as_resource: Optional[bool] = None,
+    ctx: Optional[Context] = None
+) -> dict:
+    """Generate many diagrams in one call
+
+    Items are rendered concurrently (bounded by max_concurrency) and identical
+    items are rendered only once. A progress notification with a short summary
+    is sent as each item completes; the full results are returned at the end,
+    in the same order as the input, including per-item failures.
+
+    Args:
+        items: List of diagrams, each with diagram_type, source and output_format (default: svg)
+        max_concurrency: Maximum number of concurrent renders (capped by the server limit)
+        include_url: Include diagram_url in each result (default: server setting, true)
+        optimize_svg: Minify SVG outputs and report bytes saved (default: server setting, false)
+        binary_as_resource: Return png/jpeg/pdf outputs as resource URIs instead of base64 data
+            (default: server setting, large outputs only if enabled)
+
+    Returns:
+        Dictionary with per-item results and success/failure counts
+    """
+    if len(items) > BATCH_MAX_ITEMS:
+        return {
+            "success": False,
+            "error": f"Batch too large: {len(items)} items (maximum {BATCH_MAX_ITEMS})"
+        }
+
+    concurrency = min(max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    logger.info(f"Generating batch of {len(items)} diagrams (concurrency={concurrency})")
+
+    # Dedupe identical items: render each unique key once, fan results back out
+    unique = {}
+    indexes_by_key = {}
+    for index, item in enumerate(items):
+        source = source_normalizer.normalize(item.diagram_type, item.source)
+        key = make_cache_key(item.diagram_type, item.output_format, source)
+        unique.setdefault(key, item)
+        indexes_by_key.setdefault(key, []).append(index)
+
+    async def render(key: str, item: DiagramRequest):
+        if item.diagram_type not in DIAGRAM_TYPES:
+            return key, {
+                "success": False,
+                "error": f"Unsupported diagram type: {item.diagram_type}"
+            }
+        async with semaphore:
+            return key, await call_kroki(item.diagram_type, item.source, item.output_format,
+                                         include_url, optimize_svg, binary_as_resource)
+
+    results: List[Optional[dict]] = [None] * len(items)
+    completed = 0
+    tasks = [asyncio.create_task(render(key, item)) for key, item in unique.items()]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            key, result = await next_done
+            for index in indexes_by_key[key]:
+                item = items[index]
+                results[index] = {
+                    "index": index,
+                    "diagram_type": item.diagram_type,
+                    **result
+                }
+                completed += 1
+
+                if ctx is not None:
+                    summary = {
+                        "index": index,
+                        "diagram_type": item.diagram_type,
+                        "success": result["success"],
+                    }
+                    if result["success"] and "diagram_url" in result:
+                        summary["diagram_url"] = result["diagram_url"]
+                    else:
+                        summary["error"] = result.get("error", "Unknown error")
+                    await ctx.report_progress(completed, len(items), json.dumps(summary))
+    finally:
+        # Stop outstanding renders if the request is cancelled
+        for task in tasks:
+            task.cancel()
+
+    succeeded = sum(1 for result in results if result["success"])
+    return {
+        "success": succeeded == len(items),
+        "total": len(items),
+        "unique": len(unique),
+        "succeeded": succeeded,
+        "failed": len(items) - succeeded,
+        "results": results
+    }
+
+
+@mcp.tool()
+async def obtain_svg_from_diagram(diagram_url: str, optimize_svg: Optional[bool] = None) -> dict:
     """Obtain SVG content from a Kroki diagram URL
 
     This tool fetches the SVG content from a Kroki diagram URL so you don't have to
@@ -219,18 +861,60 @@ def obtain_svg_from_diagram(diagram_url: str) -> dict:
 
     Args:
         diagram_url: Full Kroki diagram URL (e.g., http://localhost:8000/plantuml/svg/...)
+        optimize_svg: Minify the SVG and report bytes saved (default: server setting, false)
 
     Returns:
         Dictionary with SVG content and metadata
     """
+    # Determine format from URL
+    format_type = "svg" if "/svg/" in diagram_url or diagram_url.endswith(".svg") else "unknown"
+    if optimize_svg is None:
+        optimize_svg = SVG_OPTIMIZE_DEFAULT
+    optimize_svg = optimize_svg and format_type == "svg"
+
+    # Render through the cache, store and coalescing path when the URL decodes
+    parsed = parse_diagram_url(diagram_url)
+    if parsed:
+        diagram_type, output_format, diagram_source = parsed
+        logger.info(f"Rendering diagram for URL: {diagram_url}")
+        result = await fetch_render(diagram_type, diagram_source, output_format)
+        if not result["success"]:
+            return {
+                "success": False,
+                "error": f"Failed to fetch diagram: {result['error']}"
+            }
+        content = result["content"]
+        optimization = None
+        if optimize_svg:
+            content, optimization = await optimize_svg_render(result["cache_key"], content)
+        response = {
+            "success": True,
+            "content": content.decode('utf-8', errors='replace'),
+            "format": format_type,
+            "url": diagram_url
+        }
+        if optimization:
+            response["svg_optimization"] = optimization
+        return response
+
     try:
         logger.info(f"Fetching diagram from URL: {diagram_url}")
-        response = requests.get(diagram_url, timeout=30)
+        response = await kroki_client.get(diagram_url)
 
         if response.status_code == 200:
-            # Determine format from URL
-            format_type = "svg" if "/svg/" in diagram_url else "unknown"
-
+            if optimize_svg:
+                optimized = await asyncio.to_thread(svg_optimizer.optimize, response.content)
+                return {
+                    "success": True,
+                    "content": optimized.decode('utf-8', errors='replace'),
+                    "format": format_type,
+                    "url": diagram_url,
+                    "svg_optimization": {
+                        "original_bytes": len(response.content),
+                        "optimized_bytes": len(optimized),
+                        "bytes_saved": len(response.content) - len(optimized),
+                    }
+                }
             return {
                 "success": True,
                 "content": response.text,
@@ -243,7 +927,7 @@ def obtain_svg_from_diagram(diagram_url: str) -> dict:
                 "error": f"Failed to fetch diagram: {response.status_code} - {response.text}"
             }
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Error fetching diagram: {e}")
         return {
             "success": False,
@@ -252,44 +936,49 @@ def obtain_svg_from_diagram(diagram_url: str) -> dict:
 
 
 @mcp.tool()
-def save_diagram(diagram_url: str, output_path: str) -> dict:
+async def save_diagram(diagram_url: str, output_path: str) -> dict:
     """Save a diagram from a Kroki URL to a local file
 
-    This tool fetches the diagram from a Kroki URL and saves it to a local file.
+    Kroki URLs, this server's /render URLs and short /diagrams/ URLs are
+    rendered through the render cache, the render store and request
+    coalescing, then written atomically. Other URLs are streamed to disk in
+    chunks through a temporary file that is atomically renamed, so large
+    outputs are never fully buffered in memory.
 
     Args:
         diagram_url: Full Kroki diagram URL (e.g., http://localhost:8000/plantuml/svg/...)
         output_path: Local file path where the diagram should be saved
 
     Returns:
-        Dictionary with operation result
+        Dictionary with operation result, bytes written and throughput
     """
     try:
         logger.info(f"Saving diagram from URL: {diagram_url} to {output_path}")
-        response = requests.get(diagram_url, timeout=30)
-
-        if response.status_code == 200:
-            # Determine if binary or text format
-            if "/svg/" in diagram_url or "/txt/" in diagram_url:
-                # Text format
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    f.write(response.text)
-            else:
-                # Binary format (png, pdf, jpeg)
-                with open(output_path, 'wb') as f:
-                    f.write(response.content)
 
-            return {
-                "success": True,
-                "message": f"Diagram saved to {output_path}",
-                "file_path": output_path,
-                "url": diagram_url
-            }
+        if SHORT_URL_PATTERN.search(diagram_url.split("?", 1)[0]) or parse_diagram_url(diagram_url):
+            item = await fetch_export_item(diagram_url)
+            if not item["success"]:
+                return dict(item, error=f"Failed to save diagram: {item['error']}")
+            write_stats = await write_bytes_to_file(item["content"], output_path)
         else:
-            return {
-                "success": False,
-                "error": f"Failed to fetch diagram: {response.status_code} - {response.text}"
-            }
+            async with kroki_client.stream("GET", diagram_url) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    return {
+                        "success": False,
+                        "error": f"Failed to fetch diagram: {response.status_code} - {response.text}"
+                    }
+
+                check_content_length(response)
+                write_stats = await write_stream_to_file(response.aiter_bytes(STREAM_CHUNK_SIZE), output_path)
+
+        return {
+            "success": True,
+            "message": f"Diagram saved to {output_path}",
+            "file_path": output_path,
+            "url": diagram_url,
+            **write_stats
+        }
 
     except Exception as e:
         logger.error(f"Error saving diagram: {e}")
@@ -299,6 +988,160 @@ def save_diagram(diagram_url: str, output_path: str) -> dict:
         }
 
 
+async def fetch_export_item(ref: str) -> dict:
+    """Rendered bytes for a diagram URL or content key, and the file name to export them under
+
+    Content keys and short URLs are served from the render cache or store,
+    or rendered again from their registered source. Decodable URLs go through
+    the usual render path; other URLs are fetched as they are.
+    """
+    key_match = CONTENT_KEY_PATTERN.fullmatch(ref) or SHORT_URL_PATTERN.search(ref.split("?", 1)[0])
+    if key_match:
+        cache_key, output_format = key_match.group(1), key_match.group(2)
+        registered = short_urls.lookup(cache_key)
+        if output_format is None and registered is not None:
+            output_format = registered[1]
+        if output_format not in MEDIA_TYPES:
+            return {"success": False, "error": "Unknown output format, use <content key>.<format>"}
+
+        diagram_type = registered[0] if registered is not None else "diagram"
+        content = render_cache.get(cache_key)
+        if content is None and render_store.enabled:
+            content = await asyncio.to_thread(render_store.get, cache_key)
+        if content is None:
+            if registered is None or registered[1] != output_format:
+                return {"success": False, "error": "Unknown diagram"}
+            diagram_type, _, diagram_source = registered
+            result = await fetch_render(diagram_type, diagram_source, output_format)
+            if not result["success"]:
+                return result
+            content = result["content"]
+        return {"success": True, "content": content, "diagram_type": diagram_type,
+                "output_format": output_format, "name": f"{diagram_type}-{cache_key[:12]}.{output_format}"}
+
+    parsed = parse_diagram_url(ref)
+    if parsed:
+        diagram_type, output_format, diagram_source = parsed
+        result = await fetch_render(diagram_type, diagram_source, output_format)
+        if not result["success"]:
+            return result
+        return {"success": True, "content": result["content"], "diagram_type": diagram_type,
+                "output_format": output_format,
+                "name": f"{diagram_type}-{result['cache_key'][:12]}.{output_format}"}
+
+    if not ref.startswith(("http://", "https://")):
+        return {"success": False, "error": "Not a diagram URL or content key"}
+
+    output_format = next((f for f in MEDIA_TYPES if f"/{f}/" in ref), "bin")
+    try:
+        async with kroki_client.stream("GET", ref) as response:
+            if response.status_code != 200:
+                await response.aread()
+                return {"success": False,
+                        "error": f"Failed to fetch diagram: {response.status_code} - {response.text}"}
+            content = await read_limited(response)
+    except (httpx.HTTPError, OutputTooLargeError) as e:
+        return {"success": False, "error": f"Failed to fetch diagram: {str(e)}"}
+    url_hash = hashlib.sha256(ref.encode("utf-8")).hexdigest()
+    return {"success": True, "content": content, "output_format": output_format,
+            "name": f"diagram-{url_hash[:12]}.{output_format}"}
+
+
+@mcp.tool()
+async def export_diagrams(
+    items: List[str],
+    output_dir: str,
+    archive: Optional[Literal["zip", "tar", "tar.gz"]] = None,
+    archive_name: Optional[str] = None,
+    max_concurrency: Optional[int] = None,
+    ctx: Optional[Context] = None
+) -> dict:
+    """Export many diagrams to a local directory or a single archive in one call
+
+    Diagrams are fetched concurrently and written as they arrive, through
+    temporary files and atomic renames, or appended to one zip/tar archive.
+    A manifest.json listing every item is written alongside them (or into
+    the archive) and returned.
+
+    Args:
+        items: Diagram URLs (as returned in diagram_url) or content keys (<key> or <key>.<format>)
+        output_dir: Local directory to export into (created if missing)
+        archive: Pack everything into one archive: zip, tar or tar.gz (default: separate files)
+        archive_name: Archive file name in output_dir (default: diagrams.<extension>)
+        max_concurrency: Maximum number of concurrent fetches (capped by the server limit)
+
+    Returns:
+        Dictionary with counts, bytes written, the archive or manifest path and the manifest
+        entries (name, size_bytes and sha256 per item, or the error)
+    """
+    if len(items) > EXPORT_MAX_ITEMS:
+        return {
+            "success": False,
+            "error": f"Export too large: {len(items)} items (maximum {EXPORT_MAX_ITEMS})"
+        }
+
+    started = time.perf_counter()
+    try:
+        writer = ExportWriter(output_dir, archive, archive_name)
+        await writer.open()
+    except (OSError, ValueError) as e:
+        return {"success": False, "error": f"Failed to start export: {str(e)}"}
+
+    concurrency = min(max_concurrency or EXPORT_MAX_CONCURRENCY, EXPORT_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    logger.info(f"Exporting {len(items)} diagrams to {output_dir} "
+                f"({archive or 'files'}, concurrency={concurrency})")
+
+    async def export(index: int, ref: str) -> dict:
+        entry = {"index": index, "ref": ref}
+        async with semaphore:
+            result = await fetch_export_item(ref)
+        if not result["success"]:
+            return dict(entry, success=False, error=result.get("error", "Unknown error"))
+        written = await writer.add(result["name"], result["content"])
+        if result.get("diagram_type"):
+            entry["diagram_type"] = result["diagram_type"]
+        return dict(entry, success=True, output_format=result["output_format"], **written)
+
+    manifest: List[Optional[dict]] = [None] * len(items)
+    tasks = [asyncio.create_task(export(index, ref)) for index, ref in enumerate(items)]
+    try:
+        for completed, next_done in enumerate(asyncio.as_completed(tasks), start=1):
+            entry = await next_done
+            manifest[entry["index"]] = entry
+            if ctx is not None:
+                await ctx.report_progress(completed, len(items), entry.get("name") or entry.get("error"))
+
+        succeeded = sum(1 for entry in manifest if entry["success"])
+        bytes_written = sum(entry.get("size_bytes", 0) for entry in manifest)
+        location = await writer.close({
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "total": len(items),
+            "succeeded": succeeded,
+            "items": manifest,
+        })
+    except BaseException as e:
+        for task in tasks:
+            task.cancel()
+        await writer.abort()
+        if not isinstance(e, Exception):
+            raise
+        logger.error(f"Error exporting diagrams: {e}")
+        return {"success": False, "error": f"Failed to export diagrams: {str(e)}"}
+
+    return {
+        "success": succeeded == len(items),
+        "output_dir": writer.output_dir,
+        **location,
+        "total": len(items),
+        "succeeded": succeeded,
+        "failed": len(items) - succeeded,
+        "bytes_written": bytes_written,
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+        "manifest": manifest,
+    }
+
+
 middleware = [
     Middleware(
         CORSMiddleware,
@@ -315,12 +1158,103 @@ middleware = [
 ]
 
 # Create the MCP HTTP app with streaming support
-mcp_app = mcp.http_app(middleware=middleware)
+mcp_app = mcp.http_app(middleware=middleware, json_response=MCP_JSON_RESPONSE or None,
+                       stateless_http=MCP_STATELESS_HTTP or None)
+
+
+def warmup_entries(include_hot_keys: bool = True) -> list:
+    """Entries of WARMUP_MANIFEST followed by hot keys saved by earlier runs and seen by this one"""
+    entries = []
+    if WARMUP_MANIFEST:
+        try:
+            entries.extend(load_entries(WARMUP_MANIFEST))
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read warm-up manifest {WARMUP_MANIFEST}: {e}")
+    if include_hot_keys:
+        entries.extend(hot_keys.load())
+        entries.extend(hot_keys.top())
+    return [entry for entry in entries if entry["diagram_type"] in DIAGRAM_TYPES]
+
+
+class GracefulDrain:
+    """Keep MCP SSE responses open on SIGTERM until in-flight renders are done
+
+    sse-starlette closes every SSE stream as soon as uvicorn receives a
+    shutdown signal, which cuts off tool calls that are still rendering. Its
+    automatic drain is disabled instead; once uvicorn is exiting, renders
+    holding or waiting for an admission slot get up to GRACEFUL_SHUTDOWN_TIMEOUT
+    to finish before the remaining streams (e.g. idle GET streams) are closed.
+    """
+
+    def __init__(self, timeout: float = GRACEFUL_SHUTDOWN_TIMEOUT, poll_interval: float = 0.2):
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _uvicorn_server():
+        # uvicorn installs a bound Server.handle_exit as the SIGTERM handler
+        server = getattr(signal.getsignal(signal.SIGTERM), "__self__", None)
+        return server if hasattr(server, "should_exit") else None
+
+    def start(self) -> None:
+        server = self._uvicorn_server()
+        if server is None:
+            return
+        AppStatus.disable_automatic_graceful_drain()
+        self._task = asyncio.create_task(self._run(server))
+
+    async def _run(self, server) -> None:
+        while not server.should_exit:
+            await asyncio.sleep(self.poll_interval)
+        logger.info(f"Shutdown requested, draining "
+                    f"{admission_controller.active + admission_controller.waiting} in-flight render(s)")
+        await admission_controller.drain(self.timeout)
+        AppStatus.should_exit = True
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            AppStatus.should_exit = True
+
+
+graceful_drain = GracefulDrain()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the MCP lifespan, drain in-flight renders and close the Kroki connection pool on shutdown"""
+    async with mcp_app.lifespan(app):
+        graceful_drain.start()
+        oauth_validator.start()
+        kroki_client.start()
+        tracing.start()
+        if oauth_validator.uses_jwks:
+            startup.warm_up("oauth_jwks", oauth_validator.load_jwks())
+        startup.warm_up("kroki", kroki_client.warm_up())
+        hot_keys.start()
+        if warmer.start(warmup_entries()):
+            startup.warm_up("render_cache", warmer.wait(), progress=warmer.progress)
+        startup.mark_serving()
+        try:
+            yield
+        finally:
+            await startup.aclose()
+            await warmer.aclose()
+            await hot_keys.aclose()
+            await graceful_drain.aclose()
+            await admission_controller.drain(GRACEFUL_SHUTDOWN_TIMEOUT)
+            await oauth_validator.aclose()
+            await kroki_client.aclose()
+            await asyncio.to_thread(tracing.shutdown)
+            mark_worker_exit()
+
 
 # Create FastAPI app with MCP lifespan
 app = FastAPI(
     redirect_slashes=False,
-    lifespan=mcp_app.lifespan
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -331,6 +1265,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if RESPONSE_COMPRESSION != "none":
+    app.add_middleware(CompressionMiddleware)
+
+if tracing.enabled:
+    app.add_middleware(TimingMiddleware)
+
+
+@app.get("/ready")
+def ready():
+    """Readiness endpoint - public; 503 until startup warm-up has finished"""
+    return JSONResponse(startup.readiness(), status_code=200 if startup.ready else 503)
+
 
 @app.get("/health")
 def status(user: Optional[dict] = Depends(optional_authentication)):
@@ -340,7 +1286,21 @@ def status(user: Optional[dict] = Depends(optional_authentication)):
         "kroki_url": KROKI_URL,
         "supported_diagrams": len(DIAGRAM_TYPES),
         "validatable_diagrams": len(VALIDATABLE_TYPES),
-        "oauth_enabled": oauth_validator.enabled
+        "oauth_enabled": oauth_validator.enabled,
+        "render_cache": render_cache.stats(),
+        "kroki_pool": kroki_client.stats(),
+        "render_coalescing": render_flight.stats(),
+        "render_store": render_store.stats(),
+        "source_normalization": source_normalizer.stats(),
+        "diagram_url": url_encoder.stats(),
+        "svg_optimizer": svg_optimizer.stats(),
+        "short_urls": short_urls.stats(),
+        "admission": admission_controller.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "tool_surface": tool_list_cache.stats(),
+        "startup": startup.stats(),
+        "warmup": warmer.stats(),
+        "tracing": tracing.stats()
     }
 
     # Add user info if authenticated
@@ -356,6 +1316,13 @@ def status(user: Optional[dict] = Depends(optional_authentication)):
     return response
 
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics endpoint - public"""
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
+
 @app.get("/oauth/info")
 def oauth_info():
     """OAuth configuration information endpoint - public"""
@@ -401,5 +1368,177 @@ def protected_endpoint(user: dict = Depends(get_current_user)):
     }
 
 
+def render_etag(cache_key: str) -> str:
+    """Weak ETag of a rendered diagram
+
+    Weak, because the compression middleware sends the same render gzip- or
+    brotli-encoded or as it is, and a strong ETag would have to differ per body.
+    """
+    return f'W/"{cache_key}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)"""
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+
+async def stored_render_response(cache_key: str, output_format: str, headers: dict) -> Optional[FileResponse]:
+    """Send a render held in the persistent store straight from its file, if there is one"""
+    if not render_store.enabled:
+        return None
+    path = await asyncio.to_thread(render_store.locate, cache_key)
+    if path is None:
+        return None
+    return FileResponse(path, media_type=MEDIA_TYPES[output_format], headers=headers)
+
+
+@app.get("/render/{diagram_type}/{output_format}/{encoded}")
+async def render_diagram(diagram_type: str, output_format: str, encoded: str, request: Request):
+    """
+    Serve a diagram from a deflate+base64 encoded source (same encoding as Kroki GET URLs)
+    Responses carry a weak ETag derived from the content hash, Vary: Accept-Encoding
+    and long-lived immutable Cache-Control headers, so browsers and CDNs can absorb
+    repeated views
+    """
+    if diagram_type not in DIAGRAM_TYPES:
+        raise HTTPException(status_code=404, detail=f"Unsupported diagram type: {diagram_type}")
+    if output_format not in MEDIA_TYPES:
+        raise HTTPException(status_code=404, detail=f"Unsupported output format: {output_format}")
+
+    try:
+        diagram_source = decode_diagram(encoded)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # ETags follow the normalized source, like the render cache
+    cache_key = make_cache_key(diagram_type, output_format,
+                               source_normalizer.normalize(diagram_type, diagram_source))
+    headers = {
+        "ETag": render_etag(cache_key),
+        "Cache-Control": RENDER_CACHE_CONTROL,
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    if render_cache.get(cache_key) is None:
+        stored = await stored_render_response(cache_key, output_format, headers)
+        if stored is not None:
+            observe_render(diagram_label(diagram_type, DIAGRAM_TYPES), output_format, "store",
+                           len(diagram_source.encode("utf-8")), None)
+            return stored
+
+    result = await fetch_render(diagram_type, diagram_source, output_format)
+    if not result["success"]:
+        status_code = result.get("status_code", 502)
+        return Response(content=result["error"], status_code=status_code, media_type="text/plain")
+
+    return Response(content=result["content"], media_type=MEDIA_TYPES[output_format], headers=headers)
+
+
+@app.get("/diagrams/{cache_key}.{output_format}")
+async def render_short_diagram(cache_key: str, output_format: str, request: Request):
+    """
+    Serve a diagram by its content key (short URLs for sources too long to encode in a URL)
+    Rendered bytes come from the render cache or store, or are rendered again from
+    the registered source
+    """
+    if output_format not in MEDIA_TYPES or not re.fullmatch(r"[0-9a-f]{64}", cache_key):
+        raise HTTPException(status_code=404, detail="Unknown diagram")
+
+    headers = {
+        "ETag": render_etag(cache_key),
+        "Cache-Control": RENDER_CACHE_CONTROL,
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    content = render_cache.get(cache_key)
+    if content is None:
+        stored = await stored_render_response(cache_key, output_format, headers)
+        if stored is not None:
+            return stored
+
+        registered = short_urls.lookup(cache_key)
+        if registered is None or registered[1] != output_format:
+            raise HTTPException(status_code=404, detail="Unknown diagram")
+
+        diagram_type, _, diagram_source = registered
+        result = await fetch_render(diagram_type, diagram_source, output_format)
+        if not result["success"]:
+            status_code = result.get("status_code", 502)
+            return Response(content=result["error"], status_code=status_code, media_type="text/plain")
+        content = result["content"]
+
+    return Response(content=content, media_type=MEDIA_TYPES[output_format], headers=headers)
+
+
+class WarmupRequest(BaseModel):
+    """Diagrams to pre-render; without entries the manifest and hot keys are used"""
+
+    entries: Optional[List[DiagramRequest]] = Field(default=None, description="Diagrams to pre-render")
+
+
+@app.get("/admin/warmup")
+def warmup_status(admin: dict = Depends(require_admin)):
+    """Progress of the current or last warm-up - requires admin access"""
+    return {"warmup": warmer.stats(), "hot_keys": hot_keys.stats()}
+
+
+@app.post("/admin/warmup", status_code=202)
+async def start_warmup(body: Optional[WarmupRequest] = None, admin: dict = Depends(require_admin)):
+    """Start a background warm-up of the render cache - requires admin access"""
+    if body is not None and body.entries is not None:
+        entries = [entry.model_dump() for entry in body.entries
+                   if entry.diagram_type in DIAGRAM_TYPES]
+    else:
+        entries = warmup_entries()
+
+    if not warmer.start(entries):
+        raise HTTPException(status_code=409, detail="A warm-up is already running")
+    logger.info(f"Warm-up of {warmer.total} diagram(s) started by {admin.get('sub', 'admin')}")
+    return {"warmup": warmer.progress()}
+
+
+def check_profiling() -> None:
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (set PROFILING_ENABLED=true)")
+
+
+@app.post("/admin/profile/cpu", response_class=PlainTextResponse)
+async def profile_cpu(
+    seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=1000),
+    admin: dict = Depends(require_admin),
+):
+    """
+    Sample the stacks of this worker's threads for seconds - requires admin access
+    Returns collapsed stacks ("frame;frame count" lines) for flame graph viewers
+    """
+    check_profiling()
+    try:
+        return await profiler.cpu(seconds, interval_ms)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/admin/profile/memory")
+async def profile_memory(
+    seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+    limit: int = Query(50, ge=1, le=1000),
+    admin: dict = Depends(require_admin),
+):
+    """Trace this worker's allocations for seconds and return the largest growth - requires admin access"""
+    check_profiling()
+    try:
+        return await profiler.memory(seconds, limit)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
 # Mount the MCP app at the root
 app.mount("/", mcp_app)
+startup.mark("app setup")
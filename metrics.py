@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""Prometheus metrics for MCP Kroki Server"""
+
+import os
+import time
+import logging
+from typing import Any, Callable, Dict, Iterable, Optional
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from fastmcp.exceptions import NotFoundError
+from fastmcp.server.middleware import CallNext, Middleware, MiddlewareContext
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Set by the launcher when several workers run; tool and render metrics are then summed over workers
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+TOOL_CALLS = Counter(
+    "mcp_kroki_tool_calls_total",
+    "MCP tool calls by tool, diagram type and status",
+    ["tool", "diagram_type", "status"],
+)
+TOOL_DURATION = Histogram(
+    "mcp_kroki_tool_duration_seconds",
+    "Total MCP tool call duration",
+    ["tool", "diagram_type"],
+    buckets=LATENCY_BUCKETS,
+)
+RENDERS = Counter(
+    "mcp_kroki_renders_total",
+    "Render requests by where the result came from (cache, store, coalesced, kroki, error, rejected)",
+    ["diagram_type", "output_format", "source"],
+)
+KROKI_DURATION = Histogram(
+    "mcp_kroki_kroki_request_duration_seconds",
+    "Time spent waiting on the Kroki backend",
+    ["diagram_type", "output_format"],
+    buckets=LATENCY_BUCKETS,
+)
+KROKI_ERRORS = Counter(
+    "mcp_kroki_kroki_errors_total",
+    "Kroki errors by HTTP status code ('connection' for transport errors)",
+    ["diagram_type", "status_code"],
+)
+ADMISSION_QUEUE_DURATION = Histogram(
+    "mcp_kroki_admission_queue_seconds",
+    "Time renders waited for an admission slot, by priority class",
+    ["priority_class"],
+    buckets=LATENCY_BUCKETS,
+)
+# Set by each worker and summed over the live ones, so the queue depth autoscaling follows covers the whole pod
+ADMISSION_ACTIVE = Gauge(
+    "mcp_kroki_admission_active",
+    "Renders holding an admission slot",
+    multiprocess_mode="livesum",
+)
+ADMISSION_WAITING = Gauge(
+    "mcp_kroki_admission_waiting",
+    "Renders waiting for an admission slot",
+    multiprocess_mode="livesum",
+)
+SOURCE_BYTES = Histogram(
+    "mcp_kroki_source_bytes",
+    "Size of diagram sources sent for rendering",
+    ["diagram_type"],
+    buckets=SIZE_BUCKETS,
+)
+RENDERED_BYTES = Histogram(
+    "mcp_kroki_rendered_bytes",
+    "Size of rendered diagrams",
+    ["diagram_type", "output_format"],
+    buckets=SIZE_BUCKETS,
+)
+
+# Fields of component stats() dicts exported as counters rather than gauges
+COUNTER_FIELDS = {
+    "hits", "misses", "evictions", "expirations", "requests_total", "executed",
+    "coalesced", "writes", "gc_runs", "gc_removed", "retries_total", "circuit_opens",
+    "admitted", "rejected_queue_full", "rejected_timeout", "rate_limited",
+    "normalized", "created", "optimized", "bytes_in", "bytes_out", "list_requests",
+    "saves", "runs", "requests_timed", "cpu_profiles", "memory_profiles", "cancelled",
+    "admitted_interactive", "admitted_validate", "admitted_batch", "admitted_export", "abandoned",
+}
+
+# Component stats fields exported by the gauges above rather than by the stats collector
+GAUGE_FIELDS = {("admission", "active"), ("admission", "waiting")}
+
+
+class StatsCollector:
+    """Export numeric fields of component stats() dicts as Prometheus metrics"""
+
+    def __init__(self):
+        self._sources: Dict[str, Callable[[], dict]] = {}
+
+    def add(self, component: str, stats: Callable[[], dict]) -> None:
+        self._sources[component] = stats
+
+    def collect(self) -> Iterable:
+        for component, stats in self._sources.items():
+            try:
+                values = stats()
+            except Exception as e:
+                logger.warning(f"Failed to collect {component} stats: {e}")
+                continue
+
+            for field, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)) or (component, field) in GAUGE_FIELDS:
+                    continue
+
+                name = f"mcp_kroki_{component}_{field}"
+                documentation = f"{component} {field.replace('_', ' ')}"
+                if field in COUNTER_FIELDS:
+                    # prometheus_client appends _total to counter names
+                    name = name[:-len("_total")] if name.endswith("_total") else name
+                    yield CounterMetricFamily(name, documentation, value=value)
+                else:
+                    yield GaugeMetricFamily(name, documentation, value=value)
+
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+
+def diagram_label(diagram_type: Optional[str], known_types: Iterable[str]) -> str:
+    """Bound label cardinality to the supported diagram types"""
+    if not diagram_type:
+        return ""
+    return diagram_type if diagram_type in known_types else "other"
+
+
+def observe_render(diagram_type: str, output_format: str, source: str,
+                   source_bytes: int, rendered_bytes: Optional[int]) -> None:
+    """Record one render request"""
+    if not METRICS_ENABLED:
+        return
+    RENDERS.labels(diagram_type, output_format, source).inc()
+    SOURCE_BYTES.labels(diagram_type).observe(source_bytes)
+    if rendered_bytes is not None:
+        RENDERED_BYTES.labels(diagram_type, output_format).observe(rendered_bytes)
+
+
+def observe_kroki(diagram_type: str, output_format: str, duration: float,
+                  status_code: Optional[Any] = None) -> None:
+    """Record time spent on one Kroki request and its error status, if any"""
+    if not METRICS_ENABLED:
+        return
+    KROKI_DURATION.labels(diagram_type, output_format).observe(duration)
+    if status_code is not None:
+        KROKI_ERRORS.labels(diagram_type, str(status_code)).inc()
+
+
+def observe_queue(priority_class: str, duration: float) -> None:
+    """Record how long an admitted render waited for its slot"""
+    if not METRICS_ENABLED:
+        return
+    ADMISSION_QUEUE_DURATION.labels(priority_class).observe(duration)
+
+
+def observe_admission(active: int, waiting: int) -> None:
+    """Record the admission slots held and waited for in this worker"""
+    if not METRICS_ENABLED:
+        return
+    ADMISSION_ACTIVE.set(active)
+    ADMISSION_WAITING.set(waiting)
+
+
+def mark_worker_exit() -> None:
+    """Drop this worker's live gauges from the multiprocess aggregate (call on shutdown)"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class MetricsMiddleware(Middleware):
+    """FastMCP middleware recording per-tool call counts and latency"""
+
+    def __init__(self, diagram_types: Iterable[str]):
+        self.diagram_types = set(diagram_types)
+
+    def _diagram_type(self, tool: str, arguments: Optional[dict]) -> str:
+        for prefix in ("generate_diagram_", "validate_diagram_"):
+            if tool.startswith(prefix):
+                return diagram_label(tool[len(prefix):], self.diagram_types)
+        if arguments and isinstance(arguments.get("diagram_type"), str):
+            return diagram_label(arguments["diagram_type"], self.diagram_types)
+        return ""
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next: CallNext) -> Any:
+        if not METRICS_ENABLED:
+            return await call_next(context)
+
+        tool = context.message.name
+        diagram_type = self._diagram_type(tool, context.message.arguments)
+        started = time.perf_counter()
+        try:
+            result = await call_next(context)
+        except NotFoundError:
+            TOOL_CALLS.labels("unknown", "", "error").inc()
+            raise
+        except Exception:
+            TOOL_CALLS.labels(tool, diagram_type, "error").inc()
+            TOOL_DURATION.labels(tool, diagram_type).observe(time.perf_counter() - started)
+            raise
+
+        structured = getattr(result, "structured_content", None) or {}
+        failed = structured.get("success") is False or structured.get("valid") is False
+        TOOL_CALLS.labels(tool, diagram_type, "failed" if failed else "ok").inc()
+        TOOL_DURATION.labels(tool, diagram_type).observe(time.perf_counter() - started)
+        return result
+
+
+def render_metrics() -> tuple:
+    """Return (payload, content type) for the /metrics endpoint
+
+    With several workers, counters, histograms and the admission gauges are
+    aggregated from PROMETHEUS_MULTIPROC_DIR; other component stats are those
+    of the worker serving the scrape.
+    """
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(stats_collector)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
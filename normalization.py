@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Per-diagram-type source canonicalization ahead of caching, Kroki and URL encoding
+
+Sources that differ only in a BOM, line endings, trailing whitespace, blank
+lines, JSON whitespace or (where safe) comment lines normalize to the same
+text, so they share cache entries, coalesced renders and diagram URLs.
+"""
+
+import os
+import re
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+SOURCE_NORMALIZATION_ENABLED = os.getenv("SOURCE_NORMALIZATION_ENABLED", "true").lower() == "true"
+SOURCE_NORMALIZATION_STRIP_COMMENTS = os.getenv("SOURCE_NORMALIZATION_STRIP_COMMENTS", "true").lower() == "true"
+
+# Diagram types whose source is a JSON document
+JSON_TYPES = {"vega", "vegalite", "excalidraw"}
+
+# Types where leading indentation of the first line is significant: ASCII-art
+# drawings, and YAML (wireviz), where it sets the indentation of the whole document
+INDENTED_TYPES = {"ditaa", "svgbob", "wireviz"}
+
+# Whole-line comment markers that are safe to drop: the renderer ignores these
+# lines everywhere, including inside notes and labels
+COMMENT_PREFIXES = {
+    "plantuml": ("'",),
+    "c4plantuml": ("'",),
+    "mermaid": ("%%",),
+}
+
+# PlantUML block comments: /' ... '/
+BLOCK_COMMENT_TYPES = {"plantuml", "c4plantuml"}
+BLOCK_COMMENT_MARKERS = re.compile(r"/'|'/")
+
+# JSON strings (kept as written) or whitespace between tokens
+JSON_STRING_OR_SPACE = re.compile(r'("(?:[^"\\]|\\.)*")|\s+')
+
+
+def _reject_constant(name: str):
+    raise ValueError(f"{name} is not valid JSON")
+
+
+def minify_json(source: str) -> str:
+    """Remove the whitespace between the tokens of a JSON document
+
+    Keys, their order, numbers and string escapes stay exactly as written.
+    Raises ValueError if source is not strict JSON (NaN and Infinity included).
+    """
+    json.loads(source, parse_constant=_reject_constant)
+    return JSON_STRING_OR_SPACE.sub(lambda match: match.group(1) or "", source)
+
+
+class SourceNormalizer:
+    """Canonicalize diagram sources and count how often that produces a reuse"""
+
+    def __init__(self, enabled: bool = SOURCE_NORMALIZATION_ENABLED,
+                 strip_comments: bool = SOURCE_NORMALIZATION_STRIP_COMMENTS):
+        self.enabled = enabled
+        self.strip_comments = strip_comments
+        self.normalized = 0
+        self.hits = 0
+
+    def normalize(self, diagram_type: str, diagram_source: str) -> str:
+        """Return the canonical form of diagram_source for diagram_type"""
+        if not self.enabled:
+            return diagram_source
+
+        source = diagram_source.lstrip("\ufeff").replace("\r\n", "\n").replace("\r", "\n")
+
+        if diagram_type in JSON_TYPES:
+            try:
+                source = minify_json(source)
+            except ValueError:
+                # Leave invalid JSON alone so Kroki reports the original error
+                source = source.strip()
+        else:
+            lines = [line.rstrip() for line in source.split("\n")]
+            prefixes = self._comment_prefixes(diagram_type, lines)
+            if prefixes:
+                lines = self._drop_comments(diagram_type, lines, prefixes)
+            source = "\n".join(lines).strip("\n")
+            if diagram_type not in INDENTED_TYPES:
+                source = source.strip()
+
+        if source != diagram_source:
+            self.normalized += 1
+        return source
+
+    def _comment_prefixes(self, diagram_type: str, lines: list):
+        if not self.strip_comments:
+            return None
+        if diagram_type in ("plantuml", "c4plantuml"):
+            # Embedded @startjson/@startyaml/@startditaa/... blocks use other syntaxes
+            if any(line.startswith("@start") and not line.startswith("@startuml") for line in lines):
+                return None
+        return COMMENT_PREFIXES.get(diagram_type)
+
+    @staticmethod
+    def _is_comment(line: str, prefixes: tuple) -> bool:
+        stripped = line.lstrip()
+        # Mermaid %%{init: ...}%% directives look like comments but configure the diagram
+        return stripped.startswith(prefixes) and not stripped.startswith("%%{")
+
+    def _drop_comments(self, diagram_type: str, lines: list, prefixes: tuple) -> list:
+        """Drop whole-line comments, keeping every line of a PlantUML block comment
+
+        Lines inside /' ... '/ are kept as they are, so the line closing a
+        block (which starts with ') is never mistaken for a line comment.
+        """
+        if diagram_type not in BLOCK_COMMENT_TYPES:
+            return [line for line in lines if not self._is_comment(line, prefixes)]
+
+        kept = []
+        in_block = False
+        for line in lines:
+            if not in_block and self._is_comment(line, prefixes) and "'/" not in line:
+                continue
+            kept.append(line)
+            for marker in BLOCK_COMMENT_MARKERS.findall(line):
+                if marker == ("'/" if in_block else "/'"):
+                    in_block = not in_block
+        return kept
+
+    def record_hit(self, diagram_type: str) -> None:
+        """Record a render reused only because its source was normalized"""
+        self.hits += 1
+        logger.debug(f"Normalization turned a {diagram_type} cache miss into a hit ({self.hits} so far)")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "strip_comments": self.strip_comments,
+            "normalized": self.normalized,
+            "hits": self.hits,
+        }
+
+
+# Global normalizer instance
+source_normalizer = SourceNormalizer()
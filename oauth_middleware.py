@@ -2,14 +2,18 @@
 """OAuth 2.1 Authentication Middleware for MCP Kroki Server"""
 
 import os
+import time
+import asyncio
+import hmac
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
 from typing import Optional
 from fastapi import HTTPException, Security, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from authlib.integrations.requests_client import OAuth2Session
-from authlib.oauth2.rfc7662 import IntrospectionToken
-from jose import JWTError, jwt
-import requests
+import httpx
+from tracing import phase
 
 logger = logging.getLogger(__name__)
 
@@ -23,9 +27,90 @@ OAUTH_INTROSPECTION_URL = os.getenv("OAUTH_INTROSPECTION_URL", "")
 OAUTH_JWKS_URL = os.getenv("OAUTH_JWKS_URL", "")
 OAUTH_TOKEN_VALIDATION = os.getenv("OAUTH_TOKEN_VALIDATION", "introspection")  # introspection or jwks
 
+# Verified-token cache and JWKS refresh
+OAUTH_TOKEN_CACHE_SIZE = int(os.getenv("OAUTH_TOKEN_CACHE_SIZE", "10000"))
+OAUTH_TOKEN_CACHE_TTL = int(os.getenv("OAUTH_TOKEN_CACHE_TTL", "300"))  # seconds, 0 disables the cache
+OAUTH_JWKS_REFRESH_INTERVAL = int(os.getenv("OAUTH_JWKS_REFRESH_INTERVAL", "3600"))  # seconds
+OAUTH_JWKS_MIN_REFETCH_INTERVAL = int(os.getenv("OAUTH_JWKS_MIN_REFETCH_INTERVAL", "30"))  # seconds
+
+# Admin endpoints: OAuth tokens carrying ADMIN_SCOPE, or the static ADMIN_TOKEN; disabled if neither applies
+ADMIN_SCOPE = os.getenv("ADMIN_SCOPE", "mcp-kroki:admin")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
 security = HTTPBearer(auto_error=False)
 
 
+def _jose():
+    """Import python-jose on first use, so servers without OAuth do not pay for it at startup"""
+    from jose import JWTError, jwt
+    return jwt, JWTError
+
+
+class TokenCache:
+    """LRU cache of verified token claims keyed by token hash
+
+    Entries expire at the token's own `exp` or after the maximum TTL,
+    whichever comes first.
+    """
+
+    def __init__(self, max_size: int = OAUTH_TOKEN_CACHE_SIZE, ttl: int = OAUTH_TOKEN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = max_size > 0 and ttl > 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> Optional[dict]:
+        """Return cached claims for token, or None if absent or expired"""
+        if not self.enabled:
+            return None
+
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token: str, claims: dict) -> None:
+        """Cache verified claims until min(exp, now + ttl)"""
+        if not self.enabled:
+            return
+
+        expires_at = time.time() + self.ttl
+        exp = claims.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+        if expires_at <= time.time():
+            return
+
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (claims, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
 class OAuthValidator:
     """OAuth 2.1 Token Validator"""
 
@@ -39,63 +124,109 @@ class OAuthValidator:
         self.jwks_url = OAUTH_JWKS_URL
         self.validation_method = OAUTH_TOKEN_VALIDATION
         self.jwks = None
+        self.token_cache = TokenCache()
+        self._jwks_fetched_at = 0.0
+        self._jwks_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
 
         if self.enabled:
             logger.info(f"OAuth 2.1 authentication enabled")
             logger.info(f"Issuer: {self.issuer}")
             logger.info(f"Validation method: {self.validation_method}")
-
-            if self.validation_method == "jwks" and self.jwks_url:
-                self._load_jwks()
         else:
             logger.info("OAuth 2.1 authentication disabled")
 
-    def _load_jwks(self):
-        """Load JWKS (JSON Web Key Set) from the issuer"""
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """Shared async client for IdP requests (JWKS and introspection)"""
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = httpx.AsyncClient(timeout=10)
+        return self._http_client
+
+    @property
+    def uses_jwks(self) -> bool:
+        return self.enabled and self.validation_method == "jwks" and bool(self.jwks_url)
+
+    async def _load_jwks_async(self):
+        """Load JWKS without blocking the event loop; keeps the previous keys on failure"""
+        self._jwks_fetched_at = time.monotonic()
         try:
-            response = requests.get(self.jwks_url, timeout=10)
+            response = await self.http_client.get(self.jwks_url)
             response.raise_for_status()
             self.jwks = response.json()
-            logger.info("JWKS loaded successfully")
+            logger.info("JWKS refreshed successfully")
         except Exception as e:
-            logger.error(f"Failed to load JWKS: {e}")
-            self.jwks = None
+            logger.error(f"Failed to refresh JWKS: {e}")
+
+    async def load_jwks(self):
+        """Load JWKS in the background at startup; tokens arriving meanwhile wait for it"""
+        async with self._jwks_lock:
+            await self._load_jwks_async()
 
-    def validate_token_introspection(self, token: str) -> dict:
-        """Validate token using OAuth 2.1 token introspection endpoint"""
+    async def _refetch_jwks_for_kid(self, kid: Optional[str]):
+        """Refetch JWKS when a token uses an unknown key id (key rotation), rate-limited"""
+        async with self._jwks_lock:
+            if kid and kid in self._jwks_kids():
+                return
+            if time.monotonic() - self._jwks_fetched_at < OAUTH_JWKS_MIN_REFETCH_INTERVAL:
+                return
+            logger.info(f"Refetching JWKS for unknown key id: {kid}")
+            await self._load_jwks_async()
+
+    def _jwks_kids(self) -> set:
+        if not self.jwks:
+            return set()
+        return {key.get("kid") for key in self.jwks.get("keys", [])}
+
+    def _needs_jwks_refetch(self, token: str) -> tuple:
+        """Return (needs_refetch, kid) for a token given the current JWKS"""
+        if not self.jwks:
+            return True, None
+        jwt, JWTError = _jose()
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+        except JWTError:
+            return False, None
+        return bool(kid) and kid not in self._jwks_kids(), kid
+
+    async def _refresh_jwks_periodically(self):
+        while True:
+            await asyncio.sleep(OAUTH_JWKS_REFRESH_INTERVAL)
+            await self._load_jwks_async()
+
+    def start(self):
+        """Start background JWKS refresh (call from the application lifespan)"""
+        if self.uses_jwks and self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_jwks_periodically())
+            logger.info(f"Background JWKS refresh every {OAUTH_JWKS_REFRESH_INTERVAL}s")
+
+    async def aclose(self):
+        """Stop background refresh and close the IdP client"""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+        if self._http_client is not None and not self._http_client.is_closed:
+            await self._http_client.aclose()
+        self._http_client = None
+
+    async def validate_token_introspection_async(self, token: str) -> dict:
+        """Validate token using the introspection endpoint without blocking the event loop"""
         try:
-            response = requests.post(
+            response = await self.http_client.post(
                 self.introspection_url,
                 auth=(self.client_id, self.client_secret),
                 data={"token": token, "token_type_hint": "access_token"},
                 headers={"Content-Type": "application/x-www-form-urlencoded"},
-                timeout=10
             )
             response.raise_for_status()
-            token_info = response.json()
-
-            if not token_info.get("active", False):
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Token is not active or has been revoked",
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
-
-            # Validate audience if configured
-            if self.audience:
-                aud = token_info.get("aud", [])
-                if isinstance(aud, str):
-                    aud = [aud]
-                if self.audience not in aud:
-                    raise HTTPException(
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                        detail=f"Invalid audience. Expected: {self.audience}",
-                        headers={"WWW-Authenticate": "Bearer"},
-                    )
+            return self._check_introspection(response.json())
 
-            return token_info
-
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"Token introspection failed: {e}")
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -103,11 +234,39 @@ class OAuthValidator:
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-    def validate_token_jwks(self, token: str) -> dict:
-        """Validate token using JWKS (JSON Web Key Set)"""
-        if not self.jwks:
-            self._load_jwks()
+    def _check_introspection(self, token_info: dict) -> dict:
+        """Check an introspection response for activity and audience"""
+        if not token_info.get("active", False):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token is not active or has been revoked",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+        # Validate audience if configured
+        if self.audience:
+            aud = token_info.get("aud", [])
+            if isinstance(aud, str):
+                aud = [aud]
+            if self.audience not in aud:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail=f"Invalid audience. Expected: {self.audience}",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+
+        return token_info
+
+    async def validate_token_jwks_async(self, token: str) -> dict:
+        """Validate token using JWKS, refetching keys without blocking when the key id is unknown"""
+        needs_refetch, kid = self._needs_jwks_refetch(token)
+        if needs_refetch:
+            await self._refetch_jwks_for_kid(kid)
 
+        return self._decode_jwt(token)
+
+    def _decode_jwt(self, token: str) -> dict:
+        """Verify a JWT against the loaded JWKS"""
         if not self.jwks:
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -115,6 +274,7 @@ class OAuthValidator:
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
+        jwt, JWTError = _jose()
         try:
             # Decode and validate JWT
             payload = jwt.decode(
@@ -140,12 +300,20 @@ class OAuthValidator:
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-    def validate_token(self, token: str) -> dict:
-        """Validate token using configured validation method"""
-        if self.validation_method == "jwks":
-            return self.validate_token_jwks(token)
-        else:
-            return self.validate_token_introspection(token)
+    async def validate_token_async(self, token: str) -> dict:
+        """Validate token using configured validation method, serving verified tokens from cache"""
+        with phase("auth"):
+            cached = self.token_cache.get(token)
+            if cached is not None:
+                return cached
+
+            if self.validation_method == "jwks":
+                token_info = await self.validate_token_jwks_async(token)
+            else:
+                token_info = await self.validate_token_introspection_async(token)
+
+            self.token_cache.put(token, token_info)
+            return token_info
 
 
 # Global validator instance
@@ -174,7 +342,7 @@ async def get_current_user(
         )
 
     try:
-        token_info = oauth_validator.validate_token(credentials.credentials)
+        token_info = await oauth_validator.validate_token_async(credentials.credentials)
         return token_info
     except HTTPException:
         raise
@@ -202,8 +370,56 @@ async def optional_authentication(
         return None
 
     try:
-        token_info = oauth_validator.validate_token(credentials.credentials)
+        token_info = await oauth_validator.validate_token_async(credentials.credentials)
         return token_info
     except Exception as e:
         logger.warning(f"Optional authentication failed: {e}")
         return None
+
+
+def token_scopes(token_info: dict) -> set:
+    """Scopes granted to a token, from the "scope" string or the "scp" list claim"""
+    scopes = token_info.get("scope") or token_info.get("scp") or []
+    if isinstance(scopes, str):
+        scopes = scopes.split()
+    return set(scopes)
+
+
+async def require_admin(
+    credentials: Optional[HTTPAuthorizationCredentials] = Security(security)
+) -> dict:
+    """
+    Dependency for admin endpoints
+    Accepts ADMIN_TOKEN, or an OAuth token with ADMIN_SCOPE when OAuth is enabled
+    Raises HTTPException otherwise (403 when admin access is not configured)
+    """
+    if not ADMIN_TOKEN and not oauth_validator.enabled:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin endpoints are disabled (set ADMIN_TOKEN or enable OAuth)",
+        )
+
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Missing authentication token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    token = credentials.credentials
+    if ADMIN_TOKEN and hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        return {"sub": "admin-token", "scope": ADMIN_SCOPE}
+
+    if not oauth_validator.enabled:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid admin token",
+        )
+
+    token_info = await get_current_user(credentials)
+    if ADMIN_SCOPE not in token_scopes(token_info):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Missing required scope: {ADMIN_SCOPE}",
+        )
+    return token_info
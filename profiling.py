@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""On-demand sampling CPU profiles and allocation snapshots of the running process"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Enables the /admin/profile endpoints
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+# Longest profile a request may ask for, in seconds
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+# Frames kept per allocation traceback; more frames cost more memory while tracing
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "10"))
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one runs"""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class Profiler:
+    """Sample thread stacks or diff tracemalloc snapshots, one profile at a time
+
+    Nothing runs between profiles. The CPU profiler samples every thread's
+    stack from a separate thread, so the event loop is observed, not paused.
+    """
+
+    def __init__(self):
+        self._running = False
+        self.cpu_profiles = 0
+        self.memory_profiles = 0
+
+    def _acquire(self) -> None:
+        if self._running:
+            raise ProfilerBusy("A profile is already running")
+        self._running = True
+
+    def _sample(self, seconds: float, interval: float) -> Counter:
+        own = threading.get_ident()
+        stacks: Counter = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, str(ident)))
+                stacks[";".join(reversed(labels))] += 1
+            time.sleep(interval)
+        return stacks
+
+    async def cpu(self, seconds: float, interval_ms: float = 5.0) -> str:
+        """Sample stacks for seconds and return them in collapsed format ("frame;frame;frame count")
+
+        The output loads into flamegraph.pl, speedscope and similar viewers.
+        """
+        self._acquire()
+        try:
+            logger.info(f"CPU profile for {seconds:g}s every {interval_ms:g} ms")
+            stacks = await asyncio.to_thread(self._sample, seconds, interval_ms / 1000)
+            self.cpu_profiles += 1
+        finally:
+            self._running = False
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    async def memory(self, seconds: float, limit: int = 50) -> dict:
+        """Trace allocations for seconds and return the source lines whose allocations grew most"""
+        self._acquire()
+        started = not tracemalloc.is_tracing()
+        try:
+            logger.info(f"Allocation profile for {seconds:g}s")
+            if started:
+                tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+            before = await asyncio.to_thread(tracemalloc.take_snapshot)
+            await asyncio.sleep(seconds)
+            after = await asyncio.to_thread(tracemalloc.take_snapshot)
+            current, peak = tracemalloc.get_traced_memory()
+            differences = await asyncio.to_thread(after.compare_to, before, "traceback")
+            self.memory_profiles += 1
+        finally:
+            if started:
+                tracemalloc.stop()
+            self._running = False
+
+        top: List[Dict] = []
+        for stat in differences[:limit]:
+            top.append({
+                "size_diff_bytes": stat.size_diff,
+                "size_bytes": stat.size,
+                "count_diff": stat.count_diff,
+                "count": stat.count,
+                "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+            })
+        return {
+            "seconds": seconds,
+            "traced_bytes": current,
+            "peak_traced_bytes": peak,
+            "top": top,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "enabled": PROFILING_ENABLED,
+            "running": self._running,
+            "cpu_profiles": self.cpu_profiles,
+            "memory_profiles": self.memory_profiles,
+        }
+
+
+# Global instance
+profiler = Profiler()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""In-process render cache for Kroki diagrams"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Render cache configuration
+RENDER_CACHE_ENABLED = os.getenv("RENDER_CACHE_ENABLED", "true").lower() == "true"
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RENDER_CACHE_TTL = int(os.getenv("RENDER_CACHE_TTL", "3600"))  # seconds, 0 disables expiry
+
+
+def normalize_source(diagram_source: str) -> str:
+    """Normalize diagram source for cache keys (line endings and trailing whitespace)"""
+    return diagram_source.replace("\r\n", "\n").replace("\r", "\n").rstrip()
+
+
+def make_cache_key(diagram_type: str, output_format: str, diagram_source: str) -> str:
+    """Build a content-addressed key from diagram type, output format and source"""
+    digest = hashlib.sha256()
+    digest.update(diagram_type.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(output_format.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_source(diagram_source).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """Byte-size-bounded LRU cache of rendered diagrams with TTL expiry"""
+
+    def __init__(self, max_bytes: int = RENDER_CACHE_MAX_BYTES, ttl: int = RENDER_CACHE_TTL,
+                 enabled: bool = RENDER_CACHE_ENABLED, name: str = "Render cache"):
+        self.enabled = enabled and max_bytes > 0
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        if self.enabled:
+            logger.info(f"{name} enabled (max_bytes={self.max_bytes}, ttl={self.ttl}s)")
+        else:
+            logger.info(f"{name} disabled")
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return cached bytes for key, or None on miss or expiry"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            data, expires_at = entry
+            if expires_at and expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store rendered bytes, evicting least recently used entries to stay in budget"""
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl > 0 else 0
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (data, expires_at)
+            self._size += len(data)
+
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop all cached entries"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, key: str) -> None:
+        data, _ = self._entries.pop(key)
+        self._size -= len(data)
+
+    def stats(self) -> dict:
+        """Cache counters for the health endpoint"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# Global render cache instance
+render_cache = RenderCache()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""Persistent content-addressed render store on a local or shared volume"""
+
+import os
+import time
+import logging
+import threading
+from typing import Optional
+from streaming import TEMP_PREFIX, AtomicFile
+
+logger = logging.getLogger(__name__)
+
+# Render store configuration
+RENDER_STORE_DIR = os.getenv("RENDER_STORE_DIR", "")  # empty disables the store
+RENDER_STORE_MAX_BYTES = int(os.getenv("RENDER_STORE_MAX_BYTES", str(1024 * 1024 * 1024)))
+RENDER_STORE_GC_TARGET = float(os.getenv("RENDER_STORE_GC_TARGET", "0.9"))  # fraction kept after GC
+
+
+class RenderStore:
+    """Content-addressed store of rendered diagrams
+
+    Files are sharded by key prefix (ab/cd/<key>) and written atomically through
+    a temporary file and rename. HTTP endpoints send them with locate() instead
+    of reading them into memory. Keys are the render cache keys, so several
+    replicas sharing a volume share renders. Methods do blocking file I/O; call
+    them from a worker thread.
+    """
+
+    def __init__(self, root: str = RENDER_STORE_DIR, max_bytes: int = RENDER_STORE_MAX_BYTES):
+        self.root = root
+        self.enabled = bool(root)
+        self.max_bytes = max_bytes
+        self._approx_size: Optional[int] = None
+        self._gc_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.gc_runs = 0
+        self.gc_removed = 0
+
+        if self.enabled:
+            os.makedirs(self.root, exist_ok=True)
+            logger.info(f"Render store enabled at {self.root} (max_bytes={self.max_bytes})")
+        else:
+            logger.info("Render store disabled")
+
+    def path_for(self, key: str) -> str:
+        """Sharded path of the file holding key"""
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def locate(self, key: str) -> Optional[str]:
+        """Path of the stored file for key, or None if absent"""
+        if not self.enabled:
+            return None
+
+        path = self.path_for(key)
+        if not os.path.isfile(path):
+            self.misses += 1
+            return None
+
+        self._touch(path)
+        self.hits += 1
+        return path
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Read stored bytes for key, or None if absent"""
+        if not self.enabled:
+            return None
+
+        path = self.path_for(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except OSError as e:
+            logger.warning(f"Failed to read render store entry {key}: {e}")
+            self.misses += 1
+            return None
+
+        self._touch(path)
+        self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Write bytes for key atomically (temporary file + rename)"""
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+
+        path = self.path_for(key)
+        if os.path.exists(path):
+            self._touch(path)
+            return
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with AtomicFile(path, temp_suffix="") as target:
+                target.file.write(data)
+        except OSError as e:
+            logger.warning(f"Failed to write render store entry {key}: {e}")
+            return
+
+        self.writes += 1
+        if self._approx_size is None:
+            self._approx_size = self._scan_size()
+        else:
+            self._approx_size += len(data)
+
+        if self._approx_size > self.max_bytes:
+            self.gc()
+
+    def gc(self) -> None:
+        """Remove least recently used entries until the store is under its target size"""
+        if not self._gc_lock.acquire(blocking=False):
+            return
+
+        try:
+            entries = []
+            total = 0
+            now = time.time()
+            for directory, _, files in os.walk(self.root):
+                for name in files:
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    # Leftovers from interrupted writes
+                    if name.startswith(TEMP_PREFIX):
+                        if now - stat.st_mtime > 3600:
+                            self._unlink(path)
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            target = int(self.max_bytes * RENDER_STORE_GC_TARGET)
+            removed = 0
+            entries.sort()
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                if self._unlink(path):
+                    total -= size
+                    removed += 1
+
+            self._approx_size = total
+            self.gc_runs += 1
+            self.gc_removed += removed
+            logger.info(f"Render store GC removed {removed} entries, {total} bytes remain")
+        finally:
+            self._gc_lock.release()
+
+    def _scan_size(self) -> int:
+        total = 0
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                try:
+                    total += os.stat(os.path.join(directory, name)).st_size
+                except FileNotFoundError:
+                    continue
+        return total
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        # mtime doubles as last-access time for GC ordering
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _unlink(path: str) -> bool:
+        try:
+            os.unlink(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def stats(self) -> dict:
+        """Store counters for the health endpoint"""
+        return {
+            "enabled": self.enabled,
+            "max_bytes": self.max_bytes,
+            "approx_size_bytes": self._approx_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "gc_runs": self.gc_runs,
+            "gc_removed": self.gc_removed,
+        }
+
+
+# Global render store instance
+render_store = RenderStore()
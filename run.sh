@@ -22,5 +22,10 @@ if ! command -v uvicorn &> /dev/null; then
     pip install -r requirements.txt
 fi
 
-# Run the server
-uvicorn mcp_kroki_server:app --host "${HOST}" --port "${PORT}" --reload
+# Run the server (RELOAD=true restarts on code changes, for development)
+if [ "${RELOAD:-false}" = "true" ]; then
+    uvicorn mcp_kroki_server:app --host "${HOST}" --port "${PORT}" --reload
+else
+    export HOST PORT
+    python launcher.py
+fi
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Single-flight coalescing of identical concurrent requests"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Run at most one call per key at a time; concurrent callers share its result
+
+    on_abandoned(task), if given, is called when every caller of a running
+    call has been cancelled, e.g. to drop work that has not started yet.
+    """
+
+    def __init__(self, on_abandoned: Optional[Callable[[asyncio.Task], Any]] = None):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._callers: Dict[asyncio.Task, int] = {}
+        self.on_abandoned = on_abandoned
+        self.executed = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await fn() for key, joining an in-flight call for the same key if there is one
+
+        The call runs as its own task, so a caller being cancelled does not
+        cancel the result other callers are waiting on.
+        """
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            logger.debug(f"Coalesced request for key {key[:12]}")
+        else:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            self.executed += 1
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        self._callers[task] = self._callers.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._callers[task] == 1 and not task.done():
+                self.abandoned += 1
+                if self.on_abandoned is not None:
+                    self.on_abandoned(task)
+            raise
+        finally:
+            self._callers[task] -= 1
+            if not self._callers[task]:
+                del self._callers[task]
+
+    def is_in_flight(self, key: str) -> bool:
+        """Whether a call for key is currently running"""
+        return key in self._in_flight
+
+    def stats(self) -> dict:
+        """Coalescing counters for the health endpoint"""
+        return {
+            "in_flight": len(self._in_flight),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+        }
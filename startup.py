@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Startup phase timings and readiness tracking"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Log a table of import and initialization timings once the server is ready
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "false").lower() == "true"
+
+
+class Startup:
+    """Time startup phases and track the warm-up tasks that gate readiness"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last_mark = self.started
+        self.phases: List[Tuple[str, float]] = []
+        self.warmups: Dict[str, dict] = {}
+        self._progress: Dict[str, Callable[[], dict]] = {}
+        self._tasks: List[asyncio.Task] = []
+        self.serving = False
+        self.ready_ms: Optional[float] = None
+
+    def mark(self, phase: str) -> None:
+        """Record the time spent since the previous mark under phase"""
+        now = time.perf_counter()
+        self.phases.append((phase, (now - self._last_mark) * 1000))
+        self._last_mark = now
+
+    def warm_up(self, name: str, awaitable: Awaitable, progress: Optional[Callable[[], dict]] = None) -> None:
+        """Run a warm-up step in the background; the server is not ready until it finishes
+
+        progress, if given, returns details shown by /ready while the step runs.
+        """
+        self.warmups[name] = {"state": "running"}
+        if progress is not None:
+            self._progress[name] = progress
+        self._tasks.append(asyncio.create_task(self._run(name, awaitable)))
+
+    async def _run(self, name: str, awaitable: Awaitable) -> None:
+        started = time.perf_counter()
+        try:
+            await awaitable
+            state = "done"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # A failed warm-up does not keep the server out of service; it only ran early
+            logger.warning(f"Warm-up step {name} failed: {e}")
+            state = "failed"
+        self.warmups[name] = {"state": state, "duration_ms": round((time.perf_counter() - started) * 1000, 1)}
+        self._check_ready()
+
+    def mark_serving(self) -> None:
+        """Called from the lifespan once the application has started"""
+        self.mark("lifespan")
+        self.serving = True
+        self._check_ready()
+
+    def _check_ready(self) -> None:
+        if self.ready_ms is None and self.ready:
+            self.ready_ms = (time.perf_counter() - self.started) * 1000
+            logger.info(f"Ready {self.ready_ms:.0f} ms after import")
+            if STARTUP_PROFILE:
+                self.log_profile()
+
+    @property
+    def ready(self) -> bool:
+        return self.serving and all(w["state"] != "running" for w in self.warmups.values())
+
+    def log_profile(self) -> None:
+        lines = [f"  {phase:<24} {ms:9.1f} ms" for phase, ms in self.phases]
+        lines += [f"  warm-up {name:<16} {w.get('duration_ms', 0):9.1f} ms ({w['state']})"
+                  for name, w in self.warmups.items()]
+        logger.info("Startup profile:\n" + "\n".join(lines) + f"\n  {'ready after':<24} {self.ready_ms:9.1f} ms")
+
+    async def aclose(self) -> None:
+        """Cancel warm-up steps still running at shutdown"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def readiness(self) -> dict:
+        """Body of the /ready endpoint"""
+        warmups = {name: dict(w, progress=self._progress[name]()) if name in self._progress else w
+                   for name, w in self.warmups.items()}
+        return {
+            "ready": self.ready,
+            "warmup": warmups,
+        }
+
+    def stats(self) -> dict:
+        stats = {phase.replace(" ", "_") + "_ms": round(ms, 1) for phase, ms in self.phases}
+        stats.update({
+            "ready": self.ready,
+            "ready_ms": round(self.ready_ms, 1) if self.ready_ms is not None else None,
+            "warmups_running": sum(1 for w in self.warmups.values() if w["state"] == "running"),
+        })
+        return stats
+
+
+# Global instance, created when the server module starts importing
+startup = Startup()
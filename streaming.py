@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""Chunked streaming of rendered diagrams to memory and disk"""
+
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import tempfile
+from typing import AsyncIterator, BinaryIO, Iterator, Optional
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Streaming configuration
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", str(64 * 1024)))
+MAX_OUTPUT_BYTES = int(os.getenv("MAX_OUTPUT_BYTES", str(50 * 1024 * 1024)))
+# Bytes gathered from a stream before they are written to disk in a worker thread
+STREAM_WRITE_BUFFER = int(os.getenv("STREAM_WRITE_BUFFER", str(1024 * 1024)))
+
+TEMP_PREFIX = ".tmp-"
+
+
+def _umask_file_mode() -> int:
+    # The umask can only be read by setting it, so read it once at import
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# Mode of files created with open(); mkstemp files are owner-only until changed
+FILE_MODE = _umask_file_mode()
+
+
+class OutputTooLargeError(Exception):
+    """Raised when a rendered diagram exceeds MAX_OUTPUT_BYTES"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Rendered output exceeds the maximum size of {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+def check_content_length(response: httpx.Response, max_bytes: int = MAX_OUTPUT_BYTES) -> None:
+    """Reject a response early when its declared length is over the limit"""
+    content_length = response.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise OutputTooLargeError(max_bytes)
+
+
+async def read_limited(response: httpx.Response, max_bytes: int = MAX_OUTPUT_BYTES) -> bytes:
+    """Read a streamed response body in chunks, failing fast past max_bytes"""
+    check_content_length(response, max_bytes)
+
+    buffer = bytearray()
+    async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+        if len(buffer) + len(chunk) > max_bytes:
+            raise OutputTooLargeError(max_bytes)
+        buffer += chunk
+    return bytes(buffer)
+
+
+def iter_chunks(data: bytes, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[memoryview]:
+    """Yield zero-copy fixed-size slices of data"""
+    view = memoryview(data)
+    for offset in range(0, len(view), chunk_size):
+        yield view[offset:offset + chunk_size]
+
+
+async def aiter_chunks(data: bytes, chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[memoryview]:
+    """Async variant of iter_chunks, for feeding in-memory bytes to write_stream_to_file"""
+    for chunk in iter_chunks(data, chunk_size):
+        yield chunk
+
+
+class AtomicFile:
+    """Binary file written under a temporary name next to path and renamed over it on commit()
+
+    The temporary file gets the umask-derived mode of a file created with
+    open(), so the renamed file is as readable as a plainly written one.
+    Used as a context manager, the file is committed on success and
+    discarded on error. Methods do blocking file I/O.
+    """
+
+    def __init__(self, path: str, temp_suffix: Optional[str] = None):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        suffix = os.path.basename(path) if temp_suffix is None else temp_suffix
+        fd, self.tmp_path = tempfile.mkstemp(dir=directory, prefix=TEMP_PREFIX, suffix=suffix)
+        try:
+            os.fchmod(fd, FILE_MODE)
+            self.file: BinaryIO = os.fdopen(fd, "wb")
+        except BaseException:
+            os.close(fd)
+            self._unlink()
+            raise
+
+    def commit(self) -> None:
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def discard(self) -> None:
+        try:
+            self.file.close()
+        finally:
+            self._unlink()
+
+    def _unlink(self) -> None:
+        try:
+            os.unlink(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "AtomicFile":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+
+def _write_chunk(f: BinaryIO, digest, chunk: bytes) -> None:
+    f.write(chunk)
+    digest.update(chunk)
+
+
+def _write_stats(written: int, digest, started: float) -> dict:
+    elapsed = time.perf_counter() - started
+    return {
+        "bytes_written": written,
+        "sha256": digest.hexdigest(),
+        "elapsed_seconds": round(elapsed, 6),
+        "throughput_bytes_per_second": int(written / elapsed) if elapsed > 0 else written,
+    }
+
+
+async def write_stream_to_file(chunks: AsyncIterator[bytes], output_path: str,
+                               max_bytes: int = MAX_OUTPUT_BYTES) -> dict:
+    """Write chunks to output_path through a temporary file and atomic rename
+
+    Chunks are gathered up to STREAM_WRITE_BUFFER bytes and written from a
+    worker thread, so disk I/O never blocks the event loop. The temporary
+    file is removed if the stream fails or exceeds max_bytes, so output_path
+    never holds a partial diagram.
+
+    Returns:
+        dict with bytes_written, sha256, elapsed_seconds and throughput_bytes_per_second
+    """
+    started = time.perf_counter()
+    digest = hashlib.sha256()
+    written = 0
+
+    target = await asyncio.to_thread(AtomicFile, output_path)
+    try:
+        buffer = bytearray()
+        async for chunk in chunks:
+            written += len(chunk)
+            if written > max_bytes:
+                raise OutputTooLargeError(max_bytes)
+            buffer += chunk
+            if len(buffer) >= STREAM_WRITE_BUFFER:
+                await asyncio.to_thread(_write_chunk, target.file, digest, bytes(buffer))
+                buffer.clear()
+        if buffer:
+            await asyncio.to_thread(_write_chunk, target.file, digest, bytes(buffer))
+        await asyncio.to_thread(target.commit)
+    except BaseException:
+        await asyncio.to_thread(target.discard)
+        raise
+
+    return _write_stats(written, digest, started)
+
+
+def _write_bytes(data: bytes, output_path: str, digest) -> None:
+    with AtomicFile(output_path) as target:
+        _write_chunk(target.file, digest, data)
+
+
+async def write_bytes_to_file(data: bytes, output_path: str) -> dict:
+    """Write in-memory bytes to output_path atomically from a worker thread
+
+    Returns the same stats as write_stream_to_file.
+    """
+    started = time.perf_counter()
+    digest = hashlib.sha256()
+    await asyncio.to_thread(_write_bytes, data, output_path, digest)
+    return _write_stats(len(data), digest, started)
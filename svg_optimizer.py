@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""SVG post-processing: strip comments and metadata, collapse whitespace,
+round coordinates and dedupe repeated style blocks"""
+
+import os
+import re
+import logging
+from typing import Iterator, List
+
+logger = logging.getLogger(__name__)
+
+# Optimize SVG output unless the caller says otherwise
+SVG_OPTIMIZE_DEFAULT = os.getenv("SVG_OPTIMIZE_DEFAULT", "false").lower() == "true"
+# Decimal places kept in coordinates and lengths
+SVG_OPTIMIZE_PRECISION = int(os.getenv("SVG_OPTIMIZE_PRECISION", "3"))
+
+# Bumped whenever the output of the optimizer changes, so cached results are not reused
+SVG_OPTIMIZER_VERSION = 2
+
+TOKEN_PATTERN = re.compile(
+    r"<!--.*?-->"                            # comment
+    r"|<!\[CDATA\[.*?\]\]>"                  # CDATA section
+    r"|<\?.*?\?>"                            # processing instruction
+    r"|<![^>]*>"                             # DOCTYPE
+    r"|<(?:[^>\"']|\"[^\"]*\"|'[^']*')*>"    # start or end tag
+    r"|[^<]+",                               # text
+    re.S,
+)
+TAG_PATTERN = re.compile(r"<(/?)([^\s/>]+)((?:\s+[^\s=/>]+\s*=\s*(?:\"[^\"]*\"|'[^']*'))*)\s*(/?)>\Z", re.S)
+ATTRIBUTE_PATTERN = re.compile(r"([^\s=/>]+)\s*=\s*(\"[^\"]*\"|'[^']*')", re.S)
+DECIMAL_PATTERN = re.compile(r"(-?\d*\.\d+)")
+
+# Elements whose whitespace is significant (or may be, for embedded HTML)
+PRESERVE_ELEMENTS = {"text", "tspan", "textPath", "title", "desc", "script", "foreignObject", "pre"}
+# Elements dropped with their content
+DROP_ELEMENTS = {"metadata"}
+# Attributes holding coordinates, lengths or path data
+NUMERIC_ATTRIBUTES = {
+    "x", "y", "x1", "y1", "x2", "y2", "cx", "cy", "r", "rx", "ry", "dx", "dy",
+    "width", "height", "d", "points", "transform", "viewBox", "stroke-width",
+    "font-size", "textLength", "refX", "refY", "markerWidth", "markerHeight",
+}
+
+
+def minify_css(css: str) -> str:
+    """Remove comments and redundant whitespace from a style sheet"""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,])\s*", r"\1", css)
+    return css.replace(";}", "}").strip()
+
+
+class SvgOptimizer:
+    """Token-level SVG minifier that never touches text content"""
+
+    def __init__(self, precision: int = SVG_OPTIMIZE_PRECISION):
+        self.precision = precision
+        self.optimized = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @property
+    def cache_tag(self) -> str:
+        """Identifies optimizer settings in cache keys of optimized renders"""
+        return f"svgopt-v{SVG_OPTIMIZER_VERSION}-p{self.precision}"
+
+    def optimize(self, svg: bytes) -> bytes:
+        """Return the optimized SVG; input that does not look like SVG is returned unchanged"""
+        text = svg.decode("utf-8", errors="replace")
+        if "<svg" not in text:
+            return svg
+
+        optimized = "".join(self.iter_optimized(text)).encode("utf-8")
+        self.optimized += 1
+        self.bytes_in += len(svg)
+        self.bytes_out += len(optimized)
+        return optimized
+
+    def iter_optimized(self, svg: str) -> Iterator[str]:
+        """Yield the optimized SVG piece by piece"""
+        preserve: List[bool] = []
+        drop_depth = 0
+        style: List[str] = []
+        in_style = False
+        seen_styles = set()
+
+        for match in TOKEN_PATTERN.finditer(svg):
+            token = match.group(0)
+
+            if token.startswith("<!--"):
+                continue
+            if token.startswith("<?"):
+                # Keep the XML declaration, drop others (e.g. PlantUML's embedded source)
+                if token.startswith("<?xml ") and drop_depth == 0:
+                    yield token
+                continue
+
+            tag = TAG_PATTERN.match(token) if token.startswith("<") and not token.startswith("<!") else None
+            if tag:
+                closing, name, attributes, self_closing = tag.groups()
+                local_name = name.rsplit(":", 1)[-1]
+
+                if drop_depth:
+                    if not self_closing:
+                        drop_depth += -1 if closing else 1
+                    continue
+                if local_name in DROP_ELEMENTS and not closing:
+                    drop_depth = 0 if self_closing else 1
+                    continue
+
+                if local_name == "style" and not self_closing:
+                    if not closing:
+                        in_style = True
+                        style = [self._start_tag(name, attributes, self_closing)]
+                    else:
+                        in_style = False
+                        css = "".join(style[1:])
+                        key = css.replace("<![CDATA[", "").replace("]]>", "")
+                        if key not in seen_styles:
+                            seen_styles.add(key)
+                            yield style[0] + css + token
+                    continue
+
+                if closing:
+                    if preserve:
+                        preserve.pop()
+                    yield token
+                    continue
+
+                if not self_closing:
+                    parent = preserve[-1] if preserve else False
+                    preserve.append(parent or local_name in PRESERVE_ELEMENTS
+                                    or "xml:space=\"preserve\"" in attributes)
+                yield self._start_tag(name, attributes, self_closing)
+                continue
+
+            if drop_depth:
+                continue
+            if in_style:
+                if token.startswith("<![CDATA["):
+                    style.append(f"<![CDATA[{minify_css(token[9:-3])}]]>")
+                else:
+                    style.append(minify_css(token))
+                continue
+            if not token.startswith("<") and not token.strip() and not (preserve and preserve[-1]):
+                # Indentation between elements
+                continue
+            yield token
+
+    def _start_tag(self, name: str, attributes: str, self_closing: str) -> str:
+        parts = [f"<{name}"]
+        for attribute, value in ATTRIBUTE_PATTERN.findall(attributes):
+            if attribute in NUMERIC_ATTRIBUTES:
+                value = DECIMAL_PATTERN.sub(self._round, value)
+            parts.append(f" {attribute}={value}")
+        parts.append("/>" if self_closing else ">")
+        return "".join(parts)
+
+    def _round(self, match: re.Match) -> str:
+        number = match.group(1)
+        if len(number.split(".", 1)[1]) <= self.precision:
+            return number
+        rounded = f"{float(number):.{self.precision}f}"
+        if "." in rounded:
+            rounded = rounded.rstrip("0").rstrip(".")
+        if rounded in ("-0", ""):
+            rounded = "0"
+
+        # Path data may omit separators ("1.5.5", "2-.5"); keep the numbers apart
+        text, start, end = match.string, match.start(), match.end()
+        if number.startswith("-") and not rounded.startswith("-") and start and text[start - 1] in "0123456789.":
+            rounded = " " + rounded
+        if "." not in rounded and text[end:end + 1] == ".":
+            rounded += " "
+        return rounded
+
+    def stats(self) -> dict:
+        return {
+            "precision": self.precision,
+            "optimized": self.optimized,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
+
+
+# Global optimizer instance
+svg_optimizer = SvgOptimizer()
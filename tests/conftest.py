@@ -0,0 +1,18 @@
+import os
+import sys
+import stat
+
+import pytest
+
+# The server modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def plain_file_mode(tmp_path) -> int:
+    """Mode of a file created with open() under the current umask"""
+    path = tmp_path / ".plain"
+    path.touch()
+    mode = stat.S_IMODE(os.stat(path).st_mode)
+    path.unlink()
+    return mode
@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+from admission import (
+    AdmissionController, AdmissionRejected, reset_render_priority, set_render_priority
+)
+
+
+def make_controller(**kwargs):
+    kwargs.setdefault("max_concurrency", 1)
+    kwargs.setdefault("type_limits", {})
+    kwargs.setdefault("queue_timeout", 5)
+    kwargs.setdefault("enabled", True)
+    return AdmissionController(**kwargs)
+
+
+async def render(controller, priority_class, client, order, release=None):
+    token = set_render_priority(priority_class, client)
+    try:
+        async with controller.slot("graphviz"):
+            order.append((priority_class, client))
+            if release is not None:
+                await release.wait()
+    finally:
+        reset_render_priority(token)
+
+
+async def queue_behind_blocker(controller, renders):
+    """Start renders while one render holds the only slot, then let them run one by one"""
+    order = []
+    release = asyncio.Event()
+    blocker = asyncio.create_task(render(controller, "interactive", "blocker", [], release))
+    await asyncio.sleep(0)
+    tasks = []
+    for priority_class, client in renders:
+        tasks.append(asyncio.create_task(render(controller, priority_class, client, order)))
+        await asyncio.sleep(0)
+    assert controller.waiting == len(renders)
+    release.set()
+    await asyncio.gather(blocker, *tasks)
+    return order
+
+
+def test_queued_classes_are_served_in_proportion_to_their_weights():
+    controller = make_controller(class_weights={"interactive": 3, "batch": 1})
+    renders = [("batch", "b")] * 4 + [("interactive", "i")] * 12
+
+    order = asyncio.run(queue_behind_blocker(controller, renders))
+
+    # Every window of 4 admissions holds 3 interactive renders and 1 batch render
+    classes = [priority_class for priority_class, _ in order]
+    for start in range(0, 16, 4):
+        assert classes[start:start + 4].count("batch") == 1
+    assert controller.admitted_by_class["interactive"] == 13
+    assert controller.admitted_by_class["batch"] == 4
+
+
+def test_clients_within_a_class_are_served_round_robin():
+    controller = make_controller()
+    renders = [("batch", "a")] * 3 + [("batch", "b")] * 3
+
+    order = asyncio.run(queue_behind_blocker(controller, renders))
+
+    assert [client for _, client in order] == ["a", "b", "a", "b", "a", "b"]
+
+
+def test_waiters_past_their_class_timeout_are_rejected():
+    controller = make_controller(class_timeouts={"batch": 0.05})
+
+    async def scenario():
+        release = asyncio.Event()
+        blocker = asyncio.create_task(render(controller, "interactive", "x", [], release))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await render(controller, "batch", "y", [])
+        release.set()
+        await blocker
+        return rejected.value
+
+    rejected = asyncio.run(scenario())
+    assert rejected.retry_after == pytest.approx(0.05)
+    assert rejected.to_result()["retryable"] is True
+    assert controller.rejected_timeout == 1
+    assert controller.waiting == 0 and controller.active == 0
+
+
+def test_full_queue_rejects_immediately():
+    controller = make_controller(max_queue=1)
+
+    async def scenario():
+        release = asyncio.Event()
+        blocker = asyncio.create_task(render(controller, "interactive", "x", [], release))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(render(controller, "interactive", "y", []))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            await render(controller, "interactive", "z", [])
+        release.set()
+        await asyncio.gather(blocker, queued)
+
+    asyncio.run(scenario())
+    assert controller.rejected_queue_full == 1
+    assert controller.admitted == 2
+
+
+def test_cancel_queued_drops_waiters_whose_callers_went_away():
+    controller = make_controller()
+
+    async def scenario():
+        order = []
+        release = asyncio.Event()
+        blocker = asyncio.create_task(render(controller, "interactive", "x", [], release))
+        await asyncio.sleep(0)
+        abandoned = asyncio.create_task(render(controller, "interactive", "gone", order))
+        waiting = asyncio.create_task(render(controller, "interactive", "y", order))
+        await asyncio.sleep(0)
+
+        # Only tasks waiting in the queue are cancelled
+        assert controller.cancel_queued(blocker) is False
+        assert controller.cancel_queued(abandoned) is True
+        with pytest.raises(asyncio.CancelledError):
+            await abandoned
+        assert controller.waiting == 1
+        assert controller.cancel_queued(abandoned) is False
+
+        release.set()
+        await asyncio.gather(blocker, waiting)
+        return order
+
+    order = asyncio.run(scenario())
+    assert order == [("interactive", "y")]
+    assert controller.cancelled == 1
+    assert controller.active == 0 and controller.waiting == 0
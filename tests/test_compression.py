@@ -0,0 +1,117 @@
+import asyncio
+import gzip
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+from compression import CompressionMiddleware
+
+BODY = b"<svg>" + b"<rect/>" * 400 + b"</svg>"
+
+
+async def svg(request):
+    return Response(BODY, media_type="image/svg+xml", headers={"Vary": "Origin"})
+
+
+async def small(request):
+    return Response(b"<svg/>", media_type="image/svg+xml")
+
+
+async def png(request):
+    return Response(BODY, media_type="image/png")
+
+
+async def encoded(request):
+    return Response(gzip.compress(BODY), media_type="image/svg+xml", headers={"Content-Encoding": "gzip"})
+
+
+async def events(request):
+    async def stream():
+        for _ in range(3):
+            yield b"data: " + b"x" * 1024 + b"\n\n"
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+def get(path, accept_encoding, algorithm="gzip", minimum_size=1024):
+    app = Starlette(routes=[Route(f"/{name}", endpoint)
+                            for name, endpoint in [("svg", svg), ("small", small), ("png", png),
+                                                   ("encoded", encoded), ("events", events)]])
+    app = CompressionMiddleware(app, algorithm=algorithm, minimum_size=minimum_size)
+
+    async def request():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.get(path, headers={"Accept-Encoding": accept_encoding})
+            return response, await response.aread()
+
+    return asyncio.run(request())
+
+
+@pytest.mark.parametrize("accept_encoding, algorithm, expected", [
+    ("gzip, br", "gzip", "gzip"),
+    ("gzip, br", "brotli", "br"),
+    ("gzip", "brotli", "gzip"),
+    ("identity", "brotli", None),
+])
+def test_accept_encoding_negotiation(accept_encoding, algorithm, expected):
+    response, body = get("/svg", accept_encoding, algorithm)
+    assert response.headers.get("content-encoding") == expected
+    # httpx decodes gzip and br transparently
+    assert body == BODY
+
+
+def test_bodies_under_minimum_size_are_sent_as_they_are():
+    response, body = get("/small", "gzip")
+    assert "content-encoding" not in response.headers
+    assert body == b"<svg/>"
+
+    response, _ = get("/small", "gzip", minimum_size=1)
+    assert response.headers["content-encoding"] == "gzip"
+
+
+@pytest.mark.parametrize("path", ["/png", "/encoded", "/events"])
+def test_incompressible_encoded_and_streaming_responses_pass_through(path):
+    response, _ = get(path, "gzip")
+    expected = "gzip" if path == "/encoded" else None
+    assert response.headers.get("content-encoding") == expected
+    # The pre-encoded body is forwarded once, not compressed twice
+    if path == "/encoded":
+        assert response.headers["content-length"] == str(len(gzip.compress(BODY)))
+
+
+@pytest.mark.parametrize("path", ["/svg", "/small", "/events"])
+def test_every_response_varies_on_accept_encoding_once(path):
+    response, _ = get(path, "gzip")
+    values = [value.strip().lower() for value in response.headers["vary"].split(",")]
+    assert values.count("accept-encoding") == 1
+
+
+def test_render_endpoint_sends_weak_etag_and_single_vary():
+    import mcp_kroki_server as server
+
+    async def kroki(request):
+        return httpx.Response(200, content=BODY, headers={"Content-Type": "image/svg+xml"})
+
+    server.kroki_client._client = httpx.AsyncClient(transport=httpx.MockTransport(kroki))
+    server.kroki_client.retries = 0
+    encoded_source = server.encode_diagram("digraph { compression -> test }")
+    path = f"/render/graphviz/svg/{encoded_source}"
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = await client.get(path, headers={"Accept-Encoding": "gzip"})
+            again = await client.get(path, headers={"Accept-Encoding": "identity",
+                                                    "If-None-Match": first.headers["etag"]})
+            return first, again
+
+    first, again = asyncio.run(scenario())
+    assert first.status_code == 200
+    assert first.headers["content-encoding"] == "gzip"
+    assert first.headers["etag"].startswith('W/"')
+    assert first.headers["vary"].lower().count("accept-encoding") == 1
+    # The validator matches whatever encoding the cached copy was sent in
+    assert again.status_code == 304
+    assert again.headers["etag"] == first.headers["etag"]
@@ -0,0 +1,55 @@
+import os
+import json
+import stat
+import asyncio
+import tarfile
+import zipfile
+
+import pytest
+
+from export import ExportWriter
+
+
+async def export(output_dir, archive, items):
+    writer = ExportWriter(str(output_dir), archive=archive, archive_name="diagrams")
+    await writer.open()
+    entries = [await writer.add(name, data) for name, data in items]
+    return await writer.close({"items": entries})
+
+
+@pytest.mark.parametrize("archive", ["zip", "tar", "tar.gz"])
+def test_archive_uses_umask_mode(tmp_path, plain_file_mode, archive):
+    result = asyncio.run(export(tmp_path, archive, [("a.svg", b"<svg/>"), ("a.svg", b"<svg>2</svg>")]))
+
+    path = result["archive_path"]
+    assert stat.S_IMODE(os.stat(path).st_mode) == plain_file_mode
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(".tmp-")]
+
+    if archive == "zip":
+        with zipfile.ZipFile(path) as zf:
+            names = zf.namelist()
+            manifest = json.loads(zf.read("manifest.json"))
+    else:
+        with tarfile.open(path) as tf:
+            names = tf.getnames()
+            manifest = json.load(tf.extractfile("manifest.json"))
+    assert names == ["a.svg", "a-2.svg", "manifest.json"]
+    assert [item["name"] for item in manifest["items"]] == ["a.svg", "a-2.svg"]
+
+
+def test_directory_export_uses_umask_mode(tmp_path, plain_file_mode):
+    asyncio.run(export(tmp_path, None, [("a.png", b"\x89PNG")]))
+
+    for name in ("a.png", "manifest.json"):
+        assert stat.S_IMODE(os.stat(tmp_path / name).st_mode) == plain_file_mode
+
+
+def test_abort_removes_partial_archive(tmp_path):
+    async def scenario():
+        writer = ExportWriter(str(tmp_path), archive="zip")
+        await writer.open()
+        await writer.add("a.svg", b"<svg/>")
+        await writer.abort()
+
+    asyncio.run(scenario())
+    assert os.listdir(tmp_path) == []
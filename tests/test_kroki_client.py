@@ -0,0 +1,125 @@
+import asyncio
+
+import httpx
+import pytest
+
+from kroki_client import CircuitOpenError, KrokiClient
+
+
+def make_client(urls, handler):
+    client = KrokiClient(urls)
+    client.retries = 0
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def open_circuit(backend):
+    for _ in range(backend.breaker.failure_threshold):
+        backend.breaker.record_failure()
+    # Due for a half-open probe
+    backend.breaker.opened_at -= backend.breaker.reset_timeout
+
+
+async def render(client):
+    async with client.render_stream("graphviz", "svg", "digraph { a -> b }") as response:
+        await response.aread()
+        return response.status_code
+
+
+def test_half_open_circuit_lets_a_single_probe_through():
+    hits = []
+    release = asyncio.Event()
+
+    async def handler(request):
+        hits.append(request.url.host)
+        await release.wait()
+        return httpx.Response(200, content=b"<svg/>")
+
+    async def scenario():
+        client = make_client("http://kroki-a", handler)
+        backend = client.backends[0]
+        open_circuit(backend)
+
+        probe = asyncio.create_task(render(client))
+        await asyncio.sleep(0.01)
+        others = await asyncio.gather(*(render(client) for _ in range(10)), return_exceptions=True)
+
+        assert len(hits) == 1
+        assert all(isinstance(result, CircuitOpenError) for result in others)
+
+        release.set()
+        assert await probe == 200
+        assert backend.breaker.state == "closed"
+
+        results = await asyncio.gather(*(render(client) for _ in range(10)))
+        assert results == [200] * 10
+        assert len(hits) == 11
+
+    asyncio.run(scenario())
+
+
+def test_half_open_backend_sends_other_requests_elsewhere():
+    hits = []
+    release = asyncio.Event()
+
+    async def handler(request):
+        hits.append(request.url.host)
+        if request.url.host == "kroki-a":
+            await release.wait()
+        return httpx.Response(200, content=b"<svg/>")
+
+    async def scenario():
+        client = make_client(["http://kroki-a", "http://kroki-b"], handler)
+        open_circuit(client.backends[0])
+
+        results = []
+        for _ in range(10):
+            results.append(asyncio.create_task(render(client)))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+
+        assert hits.count("kroki-a") == 1
+        release.set()
+        assert await asyncio.gather(*results) == [200] * 10
+        assert hits.count("kroki-b") == 9
+
+    asyncio.run(scenario())
+
+
+def test_failed_probe_opens_the_circuit_again():
+    async def handler(request):
+        return httpx.Response(503)
+
+    async def scenario():
+        client = make_client("http://kroki-a", handler)
+        backend = client.backends[0]
+        open_circuit(backend)
+
+        assert await render(client) == 503
+        assert backend.breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            await render(client)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_probe_frees_the_probe_slot():
+    async def handler(request):
+        await asyncio.sleep(10)
+
+    async def scenario():
+        client = make_client("http://kroki-a", handler)
+        backend = client.backends[0]
+        open_circuit(backend)
+
+        probe = asyncio.create_task(render(client))
+        await asyncio.sleep(0.01)
+        assert backend.breaker.probing
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        assert backend.breaker.state == "half_open"
+        assert backend.breaker.allow()
+
+    asyncio.run(scenario())
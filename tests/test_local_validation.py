@@ -0,0 +1,57 @@
+import pytest
+
+from local_validation import STRUCTURAL_CHECK, LocalValidator
+
+validator = LocalValidator(enabled=True)
+
+# Valid diagrams must never be rejected locally; None means "ask Kroki"
+ACCEPTED = [
+    ("vega", '{"$schema": "https://vega.github.io/schema/vega/v5.json", "marks": []}'),
+    ("vegalite", '{"mark": "bar", "data": {"values": [{"a": 1}]}}'),
+    ("bpmn", '<?xml version="1.0"?>\n<bpmn:definitions xmlns:bpmn="http://www.omg.org/spec/BPMN/20100524/MODEL">'
+             '<bpmn:process id="p"/></bpmn:definitions>'),
+    ("plantuml", "@startuml\nAlice -> Bob : hi\n@enduml"),
+    ("plantuml", "@startuml\nA -> B\n@enduml\n@startmindmap\n* root\n@endmindmap"),
+    ("plantuml", "Alice -> Bob"),
+    ("graphviz", "digraph G { a -> b [label=\"}\"]; }"),
+    ("graphviz", "# comment\nstrict graph { a -- b }"),
+    ("graphviz", "/* header */ digraph { a [label=<<b>bold</b>>]; } // done"),
+    ("graphviz", "digraph {\n  # a { comment\n  a -> b\n}"),
+    ("dbml", "Table users {\n  id int [pk]\n  note: 'has a } brace'\n}"),
+    ("dbml", "Table t {\n  c text [note: '''multi\n{ line''']\n}\n// trailing ( comment"),
+    ("mermaid", "graph TD\n  A --> B"),
+    ("d2", "x -> y"),
+]
+
+REJECTED = [
+    ("vega", "{\"marks\": [", "Invalid JSON"),
+    ("vegalite", "[1, 2]", "must be a JSON object"),
+    ("bpmn", "<definitions>", "Invalid XML"),
+    ("bpmn", "<process/>", "Root element must be 'definitions'"),
+    ("plantuml", "@startuml\nA -> B", "Unbalanced @start/@end"),
+    ("plantuml", "@startuml\nA -> B\n@endmindmap", "Mismatched markers"),
+    ("graphviz", "digraph { a -> b", "Unclosed '{'"),
+    ("graphviz", "digraph { a -> b }}", "Unexpected '}'"),
+    ("graphviz", "digraph { a [label=\"x] }", "Unterminated string"),
+    ("graphviz", "a -> b", "Graph must start with"),
+    ("dbml", "Table users {\n  id int [pk\n}", "Unexpected '}'"),
+    ("dbml", "Table t { /* open", "Unterminated block comment"),
+    ("mermaid", "   \n", "empty"),
+]
+
+
+@pytest.mark.parametrize("diagram_type, source", ACCEPTED)
+def test_valid_sources_are_not_rejected(diagram_type, source):
+    assert validator.validate(diagram_type, source) is None
+
+
+@pytest.mark.parametrize("diagram_type, source, error", REJECTED)
+def test_broken_sources_are_rejected(diagram_type, source, error):
+    result = validator.validate(diagram_type, source)
+    assert result["valid"] is False
+    assert error in result["error"]
+    assert result["validation_method"] == STRUCTURAL_CHECK
+
+
+def test_disabled_validator_decides_nothing():
+    assert LocalValidator(enabled=False).validate("vega", "{") is None
@@ -0,0 +1,61 @@
+import json
+
+from normalization import SourceNormalizer
+
+
+def normalize(diagram_type, source):
+    return SourceNormalizer(enabled=True, strip_comments=True).normalize(diagram_type, source)
+
+
+def test_plantuml_line_comments_are_dropped():
+    source = "@startuml\n' a comment\n  ' indented comment\nAlice -> Bob\n@enduml\n"
+    assert normalize("plantuml", source) == "@startuml\nAlice -> Bob\n@enduml"
+
+
+def test_plantuml_block_comment_is_kept_whole():
+    source = (
+        "@startuml\n"
+        "/' first line of the block\n"
+        "' looks like a line comment but is inside the block\n"
+        "Alice -> Bob : hidden\n"
+        "'/\n"
+        "' a real line comment\n"
+        "Alice -> Carol\n"
+        "@enduml"
+    )
+    assert normalize("plantuml", source) == (
+        "@startuml\n"
+        "/' first line of the block\n"
+        "' looks like a line comment but is inside the block\n"
+        "Alice -> Bob : hidden\n"
+        "'/\n"
+        "Alice -> Carol\n"
+        "@enduml"
+    )
+
+
+def test_plantuml_single_line_block_comment():
+    source = "@startuml\n/' one-line block '/\n' line comment\nA -> B\n@enduml"
+    assert normalize("c4plantuml", source) == "@startuml\n/' one-line block '/\nA -> B\n@enduml"
+
+
+def test_mermaid_init_directive_is_kept():
+    source = "%%{init: {'theme': 'dark'}}%%\n%% comment\ngraph TD\n  A --> B"
+    assert normalize("mermaid", source) == "%%{init: {'theme': 'dark'}}%%\ngraph TD\n  A --> B"
+
+
+def test_yaml_first_line_indentation_is_kept():
+    source = "\n  connectors:\n    X1:\n      pincount: 2\n  cables:\n    W1: {}\n"
+    assert normalize("wireviz", source) == "  connectors:\n    X1:\n      pincount: 2\n  cables:\n    W1: {}"
+
+
+def test_json_whitespace_is_removed_without_reordering_keys():
+    source = '{\n  "mark": "bar",\n  "data": {"values": [1.0, 2E3, 10]},\n  "title": "a  b \\" c"\n}'
+    normalized = normalize("vegalite", source)
+    assert normalized == '{"mark":"bar","data":{"values":[1.0,2E3,10]},"title":"a  b \\" c"}'
+    assert json.loads(normalized) == json.loads(source)
+
+
+def test_json_with_non_standard_constants_is_left_alone():
+    source = ' {"value": NaN, "max": Infinity} '
+    assert normalize("vega", source) == '{"value": NaN, "max": Infinity}'
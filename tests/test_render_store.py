@@ -0,0 +1,15 @@
+import os
+import stat
+
+from render_store import RenderStore
+
+
+def test_put_get_and_locate(tmp_path, plain_file_mode):
+    store = RenderStore(root=str(tmp_path / "store"))
+    key = "ab" * 32
+    store.put(key, b"<svg/>")
+
+    assert store.get(key) == b"<svg/>"
+    assert store.locate(key) == store.path_for(key)
+    assert store.locate("cd" * 32) is None
+    assert stat.S_IMODE(os.stat(store.path_for(key)).st_mode) == plain_file_mode
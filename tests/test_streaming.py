@@ -0,0 +1,33 @@
+import os
+import stat
+import asyncio
+
+import pytest
+
+from streaming import OutputTooLargeError, aiter_chunks, write_bytes_to_file, write_stream_to_file
+
+
+def test_write_bytes_to_file_uses_umask_mode(tmp_path, plain_file_mode):
+    path = tmp_path / "diagram.svg"
+    stats = asyncio.run(write_bytes_to_file(b"<svg/>", str(path)))
+
+    assert path.read_bytes() == b"<svg/>"
+    assert stats["bytes_written"] == 6
+    assert stat.S_IMODE(os.stat(path).st_mode) == plain_file_mode
+
+
+def test_write_stream_to_file_uses_umask_mode(tmp_path, plain_file_mode):
+    path = tmp_path / "diagram.png"
+    data = b"x" * 200_000
+    asyncio.run(write_stream_to_file(aiter_chunks(data, 4096), str(path)))
+
+    assert path.read_bytes() == data
+    assert stat.S_IMODE(os.stat(path).st_mode) == plain_file_mode
+
+
+def test_write_stream_to_file_leaves_nothing_when_too_large(tmp_path):
+    path = tmp_path / "diagram.png"
+    with pytest.raises(OutputTooLargeError):
+        asyncio.run(write_stream_to_file(aiter_chunks(b"x" * 10_000, 1000), str(path), max_bytes=5000))
+
+    assert os.listdir(tmp_path) == []
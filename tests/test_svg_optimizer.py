@@ -0,0 +1,58 @@
+import re
+
+import pytest
+
+from svg_optimizer import SvgOptimizer, minify_css
+
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg">%s</svg>'
+
+
+def optimize(body: str, precision: int = 3) -> str:
+    return SvgOptimizer(precision).optimize(SVG % body.encode()).decode()
+
+
+def path_numbers(d: str) -> list:
+    return [float(n) for n in re.findall(r"-?(?:\d+\.?\d*|\.\d+)", d)]
+
+
+@pytest.mark.parametrize("d, expected", [
+    ("M0.0004.5", "M0 .5"),
+    ("M1.00004.25L2.5.5", "M1 .25L2.5.5"),
+    ("M5-0.0001", "M5 0"),
+    ("M.5-.00002", "M.5 0"),
+    ("M-0.0004-1.23456", "M0-1.235"),
+    ("M10.12345,20.98765", "M10.123,20.988"),
+])
+def test_rounding_keeps_implicitly_separated_path_data_apart(d, expected):
+    out = optimize(f'<path d="{d}"/>')
+    rounded = re.search(r'd="([^"]*)"', out).group(1)
+    assert rounded == expected
+    assert len(path_numbers(rounded)) == len(path_numbers(d))
+
+
+def test_short_decimals_are_left_alone():
+    assert '<rect x="1.5" width="0.25"/>' in optimize('<rect x="1.5" width="0.25"/>')
+
+
+def test_text_content_and_whitespace_are_preserved():
+    out = optimize('\n  <text x="1.23456">  a  0.123456  </text>\n')
+    assert '<text x="1.235">  a  0.123456  </text>' in out
+    assert "\n  <text" not in out
+
+
+def test_comments_metadata_and_duplicate_styles_are_dropped():
+    out = optimize(
+        "<!-- generated --><metadata><rdf>x</rdf></metadata>"
+        "<style>a { fill:red; }</style><style>\n  a{fill:red}\n</style>"
+    )
+    assert "generated" not in out and "metadata" not in out
+    assert out.count("<style>") == 1
+    assert "<style>a{fill:red}</style>" in out
+
+
+def test_non_svg_input_is_returned_unchanged():
+    assert SvgOptimizer().optimize(b"\x89PNG") == b"\x89PNG"
+
+
+def test_minify_css():
+    assert minify_css("/* c */ a , b { x : 1 ; }") == "a,b{x : 1}"
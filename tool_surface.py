@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Which diagram tools are exposed, and a cached tools/list response"""
+
+import os
+import json
+import time
+import logging
+from contextlib import contextmanager
+from typing import Iterator, Optional, Sequence
+from fastmcp.server.middleware import CallNext, Middleware, MiddlewareContext
+from fastmcp.tools import Tool
+
+logger = logging.getLogger(__name__)
+
+# per-type: generate_diagram_<type>/validate_diagram_<type> tools (34 tools)
+# compact: one generate_diagram and one validate_diagram tool with a diagram_type enum
+# both: all of the above
+TOOL_SURFACE = os.getenv("TOOL_SURFACE", "per-type").lower()
+TOOL_SURFACES = ("per-type", "compact", "both")
+
+if TOOL_SURFACE not in TOOL_SURFACES:
+    logger.warning(f"Unknown TOOL_SURFACE {TOOL_SURFACE!r}, using per-type")
+    TOOL_SURFACE = "per-type"
+
+
+def per_type_tools_enabled() -> bool:
+    return TOOL_SURFACE in ("per-type", "both")
+
+
+def compact_tools_enabled() -> bool:
+    return TOOL_SURFACE in ("compact", "both")
+
+
+class ToolListCache(Middleware):
+    """Answer tools/list from the tool list computed on the first request
+
+    Tools are registered once at import time, so the list never changes while
+    the server runs; call invalidate() after adding or removing tools.
+    """
+
+    def __init__(self):
+        self._tools: Optional[Sequence[Tool]] = None
+        self.registration_ms: Optional[float] = None
+        self.list_payload_bytes = 0
+        self.requests = 0
+        self.hits = 0
+
+    def invalidate(self) -> None:
+        self._tools = None
+
+    async def on_list_tools(self, context: MiddlewareContext, call_next: CallNext) -> Sequence[Tool]:
+        self.requests += 1
+        if self._tools is not None:
+            self.hits += 1
+            return self._tools
+
+        tools = list(await call_next(context))
+        payload = {"tools": [tool.to_mcp_tool(name=tool.key).model_dump(by_alias=True, exclude_none=True)
+                             for tool in tools]}
+        self.list_payload_bytes = len(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+        self._tools = tools
+        logger.info(f"tools/list: {len(tools)} tools, {self.list_payload_bytes} bytes ({TOOL_SURFACE} surface)")
+        return tools
+
+    @contextmanager
+    def measure_registration(self) -> Iterator[None]:
+        """Time the registration of the diagram tools"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registration_ms = (time.perf_counter() - started) * 1000
+
+    def stats(self) -> dict:
+        return {
+            "surface": TOOL_SURFACE,
+            "tools": len(self._tools) if self._tools is not None else None,
+            "list_payload_bytes": self.list_payload_bytes,
+            "registration_ms": round(self.registration_ms, 2) if self.registration_ms is not None else None,
+            "list_requests": self.requests,
+            "hits": self.hits,
+        }
+
+
+# Global cache instance
+tool_list_cache = ToolListCache()
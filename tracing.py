@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""Per-request phase timing as a Server-Timing header and optional OpenTelemetry spans
+
+Code on the hot path wraps its steps in phase("name"). Phases are only
+recorded inside a request timed by TimingMiddleware, so with SERVER_TIMING
+and TRACING_ENABLED off phase() returns a shared no-op context manager.
+"""
+
+import os
+import time
+import logging
+from contextvars import ContextVar
+from contextlib import nullcontext
+from typing import Any, Dict, Optional
+from fastmcp.server.dependencies import get_http_request
+from fastmcp.server.middleware import CallNext, Middleware, MiddlewareContext
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Add a Server-Timing header with the phases finished before the response headers were sent
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() == "true"
+# Export a span per request, tool call and phase (needs opentelemetry-sdk)
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+# otlp (OTLP/HTTP to OTEL_EXPORTER_OTLP_ENDPOINT, needs opentelemetry-exporter-otlp-proto-http)
+# or file (one JSON span per line in TRACING_FILE; "{pid}" is replaced by the process id)
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "otlp").lower()
+TRACING_FILE = os.getenv("TRACING_FILE", "spans-{pid}.jsonl")
+TRACING_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "mcp-kroki")
+
+# Key of the RequestTiming in the ASGI scope; MCP tool calls find it through the HTTP request
+SCOPE_KEY = "mcp_kroki.timing"
+
+_NO_PHASE = nullcontext()
+
+
+class RequestTiming:
+    """Phase durations of one HTTP request, and the span phases are nested under"""
+
+    __slots__ = ("started", "phases", "span", "tool_finished")
+
+    def __init__(self, span: Any = None):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.span = span
+        self.tool_finished: Optional[float] = None
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        metrics = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.phases.items()]
+        metrics.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+_current: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+
+class _Phase:
+    __slots__ = ("timing", "name", "started", "span")
+
+    def __init__(self, timing: RequestTiming, name: str):
+        self.timing = timing
+        self.name = name
+        self.span = None
+
+    def __enter__(self) -> "_Phase":
+        if self.timing.span is not None:
+            self.span = tracing.start_span(self.name, self.timing.span)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.timing.add(self.name, time.perf_counter() - self.started)
+        if self.span is not None:
+            if exc is not None:
+                self.span.record_exception(exc)
+            self.span.end()
+
+
+def phase(name: str):
+    """Context manager timing a step of the current request (no-op outside timed requests)"""
+    timing = _current.get()
+    if timing is None:
+        return _NO_PHASE
+    return _Phase(timing, name)
+
+
+class Tracing:
+    """Holds the OpenTelemetry tracer when span export is enabled"""
+
+    def __init__(self):
+        self.enabled = SERVER_TIMING or TRACING_ENABLED
+        self._provider = None
+        self._tracer = None
+        self._trace = None
+        self._propagator = None
+        self._out = None
+        self.requests_timed = 0
+
+    @property
+    def spans_enabled(self) -> bool:
+        return self._tracer is not None
+
+    def start(self) -> None:
+        """Set up span export (call from the application lifespan)"""
+        if not TRACING_ENABLED or self._provider is not None:
+            return
+        try:
+            from opentelemetry import trace
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+            from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+        except ImportError:
+            logger.warning("TRACING_ENABLED=true but opentelemetry-sdk is not installed; spans are not exported")
+            return
+
+        if TRACING_EXPORTER == "file":
+            path = TRACING_FILE.replace("{pid}", str(os.getpid()))
+            self._out = open(path, "a", encoding="utf-8")
+            exporter = ConsoleSpanExporter(out=self._out, formatter=lambda span: span.to_json(indent=None) + "\n")
+            target = path
+        else:
+            try:
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            except ImportError:
+                logger.warning("TRACING_EXPORTER=otlp but opentelemetry-exporter-otlp-proto-http "
+                               "is not installed; spans are not exported")
+                return
+            exporter = OTLPSpanExporter()
+            target = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318")
+
+        self._provider = TracerProvider(resource=Resource.create({"service.name": TRACING_SERVICE_NAME}))
+        self._provider.add_span_processor(BatchSpanProcessor(exporter))
+        self._tracer = self._provider.get_tracer("mcp-kroki")
+        self._trace = trace
+        self._propagator = TraceContextTextMapPropagator()
+        logger.info(f"Exporting spans to {target}")
+
+    def shutdown(self) -> None:
+        """Flush and stop span export"""
+        if self._provider is not None:
+            self._provider.shutdown()
+            self._provider = self._tracer = None
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+
+    def start_span(self, name: str, parent: Any = None, **kwargs) -> Any:
+        if self._tracer is None:
+            return None
+        context = self._trace.set_span_in_context(parent) if parent is not None else kwargs.pop("context", None)
+        return self._tracer.start_span(name, context=context, **kwargs)
+
+    def start_request_span(self, scope: Scope) -> Any:
+        """Root span of an HTTP request, continuing the caller's trace if it sent traceparent"""
+        if self._tracer is None:
+            return None
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope.get("headers", ())}
+        return self.start_span(
+            f"{scope['method']} {scope['path']}",
+            context=self._propagator.extract(headers),
+            kind=self._trace.SpanKind.SERVER,
+            attributes={"http.request.method": scope["method"], "url.path": scope["path"]},
+        )
+
+    def stats(self) -> dict:
+        return {
+            "server_timing": SERVER_TIMING,
+            "spans": self.spans_enabled,
+            "requests_timed": self.requests_timed,
+        }
+
+
+class TimingMiddleware:
+    """Time each HTTP request and send its phases as a Server-Timing header
+
+    The header can only hold phases finished before the response starts,
+    which MCP SSE responses may do before the tool returns; MCP_JSON_RESPONSE
+    always gives complete headers. Spans always hold every phase.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        tracing.requests_timed += 1
+        timing = RequestTiming(tracing.start_request_span(scope))
+        scope[SCOPE_KEY] = timing
+        token = _current.set(timing)
+        status_code = None
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if timing.tool_finished is not None:
+                # Turning the tool result into the JSON-RPC response
+                timing.add("serialize", time.perf_counter() - timing.tool_finished)
+                timing.tool_finished = None
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if SERVER_TIMING:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", timing.server_timing().encode("latin-1"))
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            if timing.span is not None:
+                if status_code is not None:
+                    timing.span.set_attribute("http.response.status_code", status_code)
+                for name, seconds in timing.phases.items():
+                    timing.span.set_attribute(f"mcp_kroki.phase.{name}_ms", round(seconds * 1000, 3))
+                timing.span.end()
+
+
+class ToolTimingMiddleware(Middleware):
+    """FastMCP middleware timing tool calls within the HTTP request that carried them
+
+    MCP sessions run tools outside the HTTP request's task, so the timing is
+    found through the request scope and made current for the tool call.
+    """
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next: CallNext) -> Any:
+        try:
+            timing = get_http_request().scope.get(SCOPE_KEY)
+        except RuntimeError:
+            timing = None
+        if timing is None:
+            return await call_next(context)
+
+        started = time.perf_counter()
+        # Body read, JSON-RPC decoding and dispatch to the tool
+        timing.add("rpc", started - timing.started)
+        request_span = timing.span
+        timing.span = tracing.start_span(f"tool {context.message.name}", request_span)
+        token = _current.set(timing)
+        try:
+            return await call_next(context)
+        finally:
+            _current.reset(token)
+            timing.tool_finished = time.perf_counter()
+            timing.add("tool", timing.tool_finished - started)
+            if timing.span is not None:
+                timing.span.end()
+            timing.span = request_span
+
+
+# Global instance
+tracing = Tracing()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""Render cache warm-up from a manifest and from hot keys recorded by earlier runs"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+from streaming import AtomicFile
+
+logger = logging.getLogger(__name__)
+
+# JSON list or JSON Lines file of {"diagram_type", "source", "output_format"} entries to pre-render
+WARMUP_MANIFEST = os.getenv("WARMUP_MANIFEST", "")
+# File the most rendered diagrams are saved to, and loaded from at the next start (empty disables)
+WARMUP_HOT_KEYS_PATH = os.getenv("WARMUP_HOT_KEYS_PATH", "")
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", "100"))
+WARMUP_HOT_KEYS_SAVE_INTERVAL = int(os.getenv("WARMUP_HOT_KEYS_SAVE_INTERVAL", "300"))
+# Concurrent warm-up renders; real traffic always goes first
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", "2"))
+# Seconds readiness waits for the warm-up; it then continues in the background
+WARMUP_READY_TIMEOUT = float(os.getenv("WARMUP_READY_TIMEOUT", "60"))
+# Largest source kept for hot keys; larger diagrams are not worth the file space
+WARMUP_MAX_SOURCE_BYTES = int(os.getenv("WARMUP_MAX_SOURCE_BYTES", str(64 * 1024)))
+
+
+def load_entries(path: str) -> List[dict]:
+    """Read warm-up entries from a JSON list or JSON Lines file, skipping invalid ones"""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+
+    stripped = text.lstrip()
+    if stripped.startswith("["):
+        items = json.loads(stripped)
+    else:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    entries = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get("diagram_type") or not isinstance(item.get("source"), str):
+            logger.warning(f"Ignoring invalid warm-up entry in {path}: {str(item)[:80]}")
+            continue
+        entries.append({
+            "diagram_type": item["diagram_type"],
+            "source": item["source"],
+            "output_format": item.get("output_format", "svg"),
+        })
+    return entries
+
+
+class HotKeys:
+    """Count renders per diagram and save the most frequent ones for the next warm-up"""
+
+    def __init__(self, path: str = WARMUP_HOT_KEYS_PATH, top_n: int = WARMUP_TOP_N,
+                 max_source_bytes: int = WARMUP_MAX_SOURCE_BYTES):
+        self.path = path
+        self.top_n = top_n
+        self.max_source_bytes = max_source_bytes
+        self.max_tracked = max(top_n * 10, 1000)
+        self._counts: Dict[str, list] = {}
+        self._save_task: Optional[asyncio.Task] = None
+        self.saves = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) and self.top_n > 0
+
+    def record(self, cache_key: str, diagram_type: str, output_format: str, diagram_source: str) -> None:
+        if not self.enabled:
+            return
+        counted = self._counts.get(cache_key)
+        if counted is not None:
+            counted[0] += 1
+            return
+        if len(diagram_source.encode("utf-8")) > self.max_source_bytes:
+            return
+        if len(self._counts) >= self.max_tracked:
+            # Forget the rarely used half; frequent diagrams quickly come back on top
+            ranked = sorted(self._counts.items(), key=lambda item: item[1][0], reverse=True)
+            self._counts = dict(ranked[:self.max_tracked // 2])
+        self._counts[cache_key] = [1, diagram_type, output_format, diagram_source]
+
+    def top(self, n: Optional[int] = None) -> List[dict]:
+        ranked = sorted(self._counts.values(), key=lambda counted: counted[0], reverse=True)
+        return [{"diagram_type": t, "output_format": f, "source": s, "count": c}
+                for c, t, f, s in ranked[:n or self.top_n]]
+
+    def load(self) -> List[dict]:
+        """Hot keys saved by a previous run"""
+        if not self.enabled or not os.path.exists(self.path):
+            return []
+        try:
+            return load_entries(self.path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read hot keys from {self.path}: {e}")
+            return []
+
+    def save(self) -> None:
+        """Write the top entries atomically, so concurrent writers never leave a partial file"""
+        if not self.enabled or not self._counts:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with AtomicFile(self.path) as target:
+                for entry in self.top():
+                    target.file.write((json.dumps(entry) + "\n").encode("utf-8"))
+            self.saves += 1
+        except OSError as e:
+            logger.warning(f"Could not save hot keys to {self.path}: {e}")
+
+    async def _save_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(WARMUP_HOT_KEYS_SAVE_INTERVAL)
+            await asyncio.to_thread(self.save)
+
+    def start(self) -> None:
+        """Start saving hot keys periodically (call from the application lifespan)"""
+        if self.enabled and WARMUP_HOT_KEYS_SAVE_INTERVAL > 0 and self._save_task is None:
+            self._save_task = asyncio.create_task(self._save_periodically())
+
+    async def aclose(self) -> None:
+        """Stop periodic saving and save one last time"""
+        if self._save_task is not None:
+            self._save_task.cancel()
+            try:
+                await self._save_task
+            except asyncio.CancelledError:
+                pass
+            self._save_task = None
+        await asyncio.to_thread(self.save)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "tracked": len(self._counts),
+            "saves": self.saves,
+        }
+
+
+class Warmer:
+    """Pre-render diagrams in the background with capped concurrency
+
+    render(diagram_type, source, output_format) returns a fetch_render style
+    result; busy() tells when real renders are waiting, so warm-up backs off.
+    """
+
+    def __init__(self, concurrency: int = WARMUP_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self.render: Optional[Callable[[str, str, str], Awaitable[dict]]] = None
+        self.busy: Callable[[], bool] = lambda: False
+        self._task: Optional[asyncio.Task] = None
+        self.total = 0
+        self.done = 0
+        self.cached = 0
+        self.failed = 0
+        self.runs = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, entries: Iterable[dict]) -> bool:
+        """Start warming up entries; returns False if a warm-up is already running"""
+        if self.running:
+            return False
+
+        unique = {}
+        for entry in entries:
+            key = (entry["diagram_type"], entry.get("output_format", "svg"), entry["source"])
+            unique.setdefault(key, entry)
+        self.total = len(unique)
+        self.done = self.cached = self.failed = 0
+        self.runs += 1
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self._task = asyncio.create_task(self._run(list(unique)))
+        return True
+
+    async def _run(self, entries: List[tuple]) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def warm(diagram_type: str, output_format: str, source: str) -> None:
+            async with semaphore:
+                while self.busy():
+                    await asyncio.sleep(0.1)
+                try:
+                    result = await self.render(diagram_type, source, output_format)
+                except Exception as e:
+                    logger.warning(f"Warm-up render of {diagram_type}/{output_format} failed: {e}")
+                    result = {"success": False}
+                if not result.get("success"):
+                    self.failed += 1
+                elif result.get("cached"):
+                    self.cached += 1
+                self.done += 1
+
+        logger.info(f"Warming up {len(entries)} diagram(s) with concurrency {self.concurrency}")
+        await asyncio.gather(*(warm(*entry) for entry in entries))
+        self.finished_at = time.monotonic()
+        logger.info(f"Warm-up finished: {self.done - self.failed - self.cached} rendered, "
+                    f"{self.cached} already cached, {self.failed} failed "
+                    f"in {self.finished_at - self.started_at:.1f}s")
+
+    async def wait(self, timeout: float = WARMUP_READY_TIMEOUT) -> None:
+        """Wait for the running warm-up, at most timeout seconds (it keeps running after that)"""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.info(f"Warm-up not finished after {timeout:g}s ({self.done}/{self.total}), "
+                        "continuing in the background")
+
+    async def aclose(self) -> None:
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def progress(self) -> dict:
+        return {
+            "running": self.running,
+            "total": self.total,
+            "done": self.done,
+            "cached": self.cached,
+            "failed": self.failed,
+        }
+
+    def stats(self) -> dict:
+        return dict(self.progress(), concurrency=self.concurrency, runs=self.runs)
+
+
+# Global instances
+hot_keys = HotKeys()
+warmer = Warmer()